@@ -0,0 +1,130 @@
+"""
+asyncio variant of BasePage.
+
+Page objects built on AsyncBasePage drive an AsyncWebDriver from test_util/async_webdriver.py: every action, wait and
+script call is a coroutine. Waits resolve inside the page with one async script, like the browser wait engine of
+BasePage, so a wait is a single awaited round-trip and the event loop runs the other sessions in the meantime.
+"""
+import asyncio
+import datetime
+import time
+
+from selenium.common.exceptions import ElementNotInteractableException, JavascriptException, \
+    NoSuchElementException, TimeoutException
+
+from pages.base_page import TIMEOUT, RowSnapshot, document_unloaded, page_condition
+from pages.locators import LOCATORS
+from pages.scripts import EXTRACT_ROWS_JS, FILL_FIELDS_JS, WAIT_FOR_CONDITION_JS
+
+# Delay before a wait is sent again after the document was unloaded under it, in seconds
+RETRY_DELAY = 0.05
+
+
+class AsyncBasePage:
+    timeout = TIMEOUT
+
+    def __init__(self, driver):
+        """
+        :param driver: AsyncWebDriver instance
+        """
+        self.driver = driver
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        LOCATORS.register(cls)
+
+    @property
+    def app_version(self):
+        return getattr(self.driver, 'app_version', None)
+
+    def get_selector(self, selector):
+        return LOCATORS.resolve(selector, self.app_version)
+
+    async def go_to_url(self, url):
+        await self.driver.get(url)
+
+    async def get_element(self, selector):
+        start = time.time()
+        try:
+            return await self.driver.find_element(*selector)
+        finally:
+            LOCATORS.record(selector, time.time() - start)
+
+    async def get_elements(self, selector):
+        start = time.time()
+        try:
+            return await self.driver.find_elements(*selector)
+        finally:
+            LOCATORS.record(selector, time.time() - start)
+
+    async def element_exists(self, selector):
+        return bool(await self.driver.find_elements(*selector))
+
+    async def execute_js(self, js, *args):
+        return await self.driver.execute_script(js, *args)
+
+    async def wait_until_visible(self, selector, timeout=None):
+        return await self._wait_until([page_condition('visible', selector)], selector, timeout)
+
+    async def wait_until_clickable(self, selector, timeout=None):
+        return await self._wait_until([page_condition('clickable', selector)], selector, timeout)
+
+    async def wait_until_present(self, selector, timeout=None):
+        return await self._wait_until([page_condition('present', selector)], selector, timeout)
+
+    async def wait_until_invisible(self, selector, timeout=None):
+        return await self._wait_until([page_condition('invisible', selector)], selector, timeout)
+
+    async def _wait_until(self, conditions, locator, timeout=None, mode='one'):
+        timeout = self.timeout if timeout is None else timeout
+        message = f"Error in wait_until: Timed out after {timeout} sec waiting for {conditions}. \nLocator: {locator}"
+        start = time.time()
+        deadline = start + timeout
+        try:
+            await self.driver.set_script_timeout(max(timeout + 5, 30))
+            while True:
+                remaining = max(deadline - time.time(), 0)
+                try:
+                    result = await self.driver.execute_async_script(WAIT_FOR_CONDITION_JS, conditions, mode,
+                                                                    int(remaining * 1000))
+                    break
+                except JavascriptException as e:
+                    if not document_unloaded(e):
+                        raise
+                    # The document was unloaded while waiting, wait again in the new one
+                    if time.time() >= deadline:
+                        raise TimeoutException(message)
+                    await asyncio.sleep(RETRY_DELAY)
+            if result and result.get('error'):
+                raise JavascriptException(result['error'])
+            if not result or not result['ok']:
+                raise TimeoutException(message)
+            return result['value']
+        finally:
+            LOCATORS.record(locator, time.time() - start)
+
+    async def extract_rows(self, selector, columns, key=None):
+        """Read columns of every element matching a selector in a single script call, see BasePage.extract_rows"""
+        by, locator = self.get_selector(selector)
+        start = time.time()
+        try:
+            values = await self.driver.execute_script(EXTRACT_ROWS_JS, by, locator,
+                                                      [list(column) for column in columns.values()])
+        finally:
+            LOCATORS.record(selector, time.time() - start)
+        return RowSnapshot(list(columns), values, key=key)
+
+    async def fill_fields(self, fields):
+        """Fill many fields with a single script execution, see BasePage.fill_fields"""
+        fields = fields.items() if hasattr(fields, 'items') else fields
+        bulk = []
+        for selector, value in fields:
+            if isinstance(value, (datetime.date, datetime.datetime)):
+                value = value.strftime('%Y-%m-%d')
+            bulk.append([selector[0], selector[1], value])
+        problems = await self.driver.execute_script(FILL_FIELDS_JS, bulk) if bulk else []
+        if problems:
+            details = ', '.join(f"({problem['by']}, {problem['value']}): {problem['reason']}" for problem in problems)
+            if all(problem['reason'] == 'not found' for problem in problems):
+                raise NoSuchElementException(f'Error in fill_fields: {details}')
+            raise ElementNotInteractableException(f'Error in fill_fields: {details}')
@@ -0,0 +1,191 @@
+from pages.async_base_page import AsyncBasePage
+from pages.local_app import LoginPage, Dashboard, ItemList, Form
+
+
+# The locators are the ones of the blocking page objects of pages/local_app.py
+
+
+class AsyncLoginPage(AsyncBasePage):
+    """Awaitable page object of the login page."""
+
+    _page_loaded_selector = LoginPage._page_loaded_selector
+    _username_input = LoginPage._username_input
+    _password_input = LoginPage._password_input
+    _login_button = LoginPage._login_button
+    _error_message = LoginPage._error_message
+
+    async def is_page_loaded(self):
+        """Wait until the login page is fully loaded by checking for a specific element."""
+        await self.wait_until_visible(self._page_loaded_selector)
+
+    async def fill_username(self, username):
+        """Fill in the username field with the provided username."""
+        await (await self.wait_until_visible(self._username_input)).send_keys(username)
+
+    async def fill_password(self, password):
+        """Fill in the password field with the provided password."""
+        await (await self.wait_until_visible(self._password_input)).send_keys(password)
+
+    async def click_login_button(self):
+        """Click the login button to submit the login form."""
+        await (await self.wait_until_visible(self._login_button)).click()
+
+    async def is_invalid_login_message_visible(self):
+        """Check if the invalid login error message is visible."""
+        await self.wait_until_visible(self._error_message)
+
+
+class AsyncDashboard(AsyncBasePage):
+    """Awaitable page object of the dashboard page after successful login."""
+
+    _page_loaded_selector = Dashboard._page_loaded_selector
+    _go_to_item_list_page = Dashboard._go_to_item_list_page
+    _go_to_form_page = Dashboard._go_to_form_page
+    _logout = Dashboard._logout
+
+    async def is_page_loaded(self):
+        """Wait until the dashboard page is fully loaded."""
+        await self.wait_until_visible(self._page_loaded_selector)
+
+    async def click_go_to_item_list(self):
+        """Click the button to navigate to the item list page."""
+        await (await self.wait_until_clickable(self._go_to_item_list_page)).click()
+
+    async def click_go_to_form_page(self):
+        """Click the button to navigate to the form page."""
+        await (await self.wait_until_clickable(self._go_to_form_page)).click()
+
+    async def click_logout(self):
+        """Click the button to logout."""
+        await (await self.wait_until_clickable(self._logout)).click()
+
+
+class AsyncItemList(AsyncBasePage):
+    """Awaitable page object of the item list page where items can be added, edited, or deleted."""
+
+    _page_loaded_selector = ItemList._page_loaded_selector
+    _item_input = ItemList._item_input
+    _add_item = ItemList._add_item
+    _item_edit_input = ItemList._item_edit_input
+    _save_item = ItemList._save_item
+    _back_to_dashboard = ItemList._back_to_dashboard
+    _item_lists = ItemList._item_lists
+    _edit_button = ItemList._edit_button
+    _delete_button = ItemList._delete_button
+    _edit_button_at = ItemList._edit_button_at
+    _delete_button_at = ItemList._delete_button_at
+
+    async def is_page_loaded(self):
+        """Wait until the item list page is fully loaded."""
+        await self.wait_until_visible(self._page_loaded_selector)
+
+    async def click_go_back_to_dashboard(self):
+        """Click the button to go back to dashboard."""
+        await (await self.wait_until_visible(self._back_to_dashboard)).click()
+
+    async def fill_item_input(self, item):
+        """Enter a new item in the input field."""
+        await (await self.wait_until_visible(self._item_input)).send_keys(item)
+
+    async def click_add_item(self):
+        """Click the button to add a new item."""
+        await (await self.wait_until_clickable(self._add_item)).click()
+
+    async def click_edit_by_item_name(self, item, snapshot=None):
+        """Click the edit button for the specified item, located by position when a snapshot is given."""
+        row = snapshot.find(item) if snapshot is not None else None
+        locator = self._edit_button.format(item) if row is None else self._edit_button_at.format(row['index'] + 1)
+        await (await self.wait_until_clickable(locator)).click()
+
+    async def click_delete_by_item_name(self, item, snapshot=None):
+        """Click the delete button for the specified item, located by position when a snapshot is given."""
+        row = snapshot.find(item) if snapshot is not None else None
+        locator = self._delete_button.format(item) if row is None else self._delete_button_at.format(row['index'] + 1)
+        await (await self.wait_until_clickable(locator)).click()
+
+    async def clear_item_edit_input(self):
+        """Clear the input field used for editing an item."""
+        await (await self.wait_until_visible(self._item_edit_input)).clear()
+
+    async def fill_item_edit_input(self, item):
+        """Fill the edit input field with the new item value."""
+        await (await self.wait_until_visible(self._item_edit_input)).send_keys(item)
+
+    async def click_save(self):
+        """Click the save button to save changes after editing an item."""
+        await (await self.wait_until_clickable(self._save_item)).click()
+
+    async def get_item_lists(self):
+        """Return a list of AsyncWebElement objects representing all items on the page."""
+        return await self.get_elements(self._item_lists)
+
+    async def get_items_snapshot(self):
+        """Return the name and edit state of every item in one script call, as a RowSnapshot indexed by name."""
+        return await self.extract_rows(self._item_lists, {'name': ('span', 'text'), 'editing': ('input', 'visible')},
+                                       key='name')
+
+    async def get_item_names(self):
+        """Return the names of all items in one script call."""
+        return (await self.get_items_snapshot()).column('name')
+
+
+class AsyncForm(AsyncBasePage):
+    """Awaitable page object of the form submission page."""
+
+    _page_loaded_selector = Form._page_loaded_selector
+    _text_input = Form._text_input
+    _option_dropdown = Form._option_dropdown
+    _date_input = Form._date_input
+    _agree_checkbox = Form._agree_checkbox
+    _submit_button = Form._submit_button
+    _form_message = Form._form_message
+    _back_to_dashboard = Form._back_to_dashboard
+    _select_option = Form._select_option
+    _radio_button = Form._radio_button
+
+    async def is_page_loaded(self):
+        """Verify the form page is visible."""
+        await self.wait_until_visible(self._page_loaded_selector)
+
+    async def fill_text_input(self, text):
+        """Enter text in the input field."""
+        await (await self.wait_until_visible(self._text_input)).send_keys(text)
+
+    async def select_dropdown_option(self, option_text):
+        """Select an option from the dropdown."""
+        await (await self.wait_until_clickable(self._option_dropdown)).click()
+        await (await self.wait_until_clickable(self._select_option.format(option_text))).click()
+
+    async def fill_date(self, date_str):
+        """Enter a date in the date picker."""
+        await (await self.wait_until_visible(self._date_input)).send_keys(date_str)
+
+    async def select_radio_option(self, value):
+        """Select a radio button by its value."""
+        await (await self.wait_until_clickable(self._radio_button.format(value))).click()
+
+    async def check_agree_checkbox(self):
+        """Check the agreement checkbox."""
+        await (await self.wait_until_clickable(self._agree_checkbox)).click()
+
+    async def submit_form(self):
+        """Click the submit button."""
+        await (await self.wait_until_clickable(self._submit_button)).click()
+
+    async def fill_form(self, text, option, date, choice, agree=True):
+        """Fill every field of the form with one script execution."""
+        await self.fill_fields({
+            self._text_input: text,
+            self._option_dropdown: option,
+            self._date_input: date,
+            self._radio_button.format(choice): True,
+            self._agree_checkbox: agree,
+        })
+
+    async def get_form_message(self):
+        """Return the text message of the form"""
+        return await (await self.wait_until_visible(self._form_message)).text()
+
+    async def click_go_back_to_dashboard(self):
+        """Click the button to go back to dashboard."""
+        await (await self.wait_until_visible(self._back_to_dashboard)).click()
@@ -1,27 +1,89 @@
+import datetime
 import random
 import string
-from collections import OrderedDict
+import threading
 import time
+import weakref
+from collections.abc import Sequence
 
-from packaging import version
-from selenium.common.exceptions import WebDriverException
-from selenium.webdriver.common.action_chains import ActionChains
+from selenium.common.exceptions import ElementNotInteractableException, JavascriptException, \
+    NoSuchElementException, StaleElementReferenceException, TimeoutException, WebDriverException
 from selenium.webdriver.common.by import By
-from selenium.webdriver.support import expected_conditions as ec
-from selenium.webdriver.support.wait import WebDriverWait
+
+from test_util.lazy_import import lazy_import
+
+from pages import steps
+from pages.locators import LOCATORS
+from pages.scripts import CAPTURE_STATE_JS, EXTRACT_ROWS_JS, FILL_FIELDS_JS, RESTORE_STATE_JS, VALIDATE_ELEMENT_JS, \
+    WAIT_FOR_CONDITION_JS, WAIT_FOR_JS_STATEMENT_JS
+
+# Loaded on first use, importing them pulls in the whole remote webdriver
+action_chains = lazy_import('selenium.webdriver.common.action_chains')
+ec = lazy_import('selenium.webdriver.support.expected_conditions')
+wait = lazy_import('selenium.webdriver.support.wait')
 
 TIMEOUT = 10
 
+# Polling delays of wait_for_js_statement, in seconds, and the in-page re-evaluation interval, in ms
+JS_STATEMENT_MIN_DELAY = 0.05
+JS_STATEMENT_MAX_DELAY = 0.5
+JS_STATEMENT_INTERVAL_MS = 50
+
+# Element cache counters of every page object, the counters of one page are in its element_cache_stats
+ELEMENT_CACHE_STATS = {'hits': 0, 'misses': 0, 'stale': 0}
+_ELEMENT_CACHE_LOCK = threading.Lock()
+
+# Wait engines: WebDriverWait polling from Python, or an async script resolving inside the page
+WAIT_ENGINE_WEBDRIVER = 'webdriver'
+WAIT_ENGINE_BROWSER = 'browser'
+WAIT_ENGINES = (WAIT_ENGINE_WEBDRIVER, WAIT_ENGINE_BROWSER)
+
+# Script timeout last set on each driver by the in-page waits, in seconds
+_SCRIPT_TIMEOUTS = weakref.WeakKeyDictionary()
+
+
+def ensure_script_timeout(driver, wait_timeout):
+    """Raise the script timeout of driver so that an async script waiting wait_timeout seconds is not cut short"""
+    script_timeout = _SCRIPT_TIMEOUTS.get(driver)
+    if script_timeout is None or script_timeout < wait_timeout + 5:
+        script_timeout = max(wait_timeout + 5, 30)
+        driver.set_script_timeout(script_timeout)
+        _SCRIPT_TIMEOUTS[driver] = script_timeout
+
+
+def document_unloaded(error):
+    """Whether an async script failed because the page navigated or reloaded while it was running"""
+    return isinstance(error, JavascriptException) and 'unloaded' in (error.msg or '').lower()
+
 
 class BasePage:
     page_url = ''
     page_loaded_selector = {}
     timeout = TIMEOUT
-
-    def __init__(self, driver):
+    wait_engine = WAIT_ENGINE_WEBDRIVER
+    element_cache = False
+
+    def __init__(self, driver, element_cache=None):
+        """
+        :param driver: Selenium WebDriver instance
+        :param element_cache: keep the elements returned by wait_until_visible and wait_until_clickable per locator
+                              and reuse them while they are valid. Defaults to the element_cache class attribute.
+        """
         self.driver = driver
+        if element_cache is not None:
+            self.element_cache = element_cache
+        self._elements = {}
+        self.element_cache_stats = {'hits': 0, 'misses': 0, 'stale': 0}
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        # Locators are declared as class attributes and compiled once per page class
+        LOCATORS.register(cls)
+        # Public methods become timed steps when --page-steps is set
+        steps.register(cls)
 
     def go_to(self):
+        self.clear_element_cache()
         self.driver.get(self.page_url)
 
     def wait_for_page_loaded(self):
@@ -32,51 +94,202 @@ class BasePage:
             self.wait_until_visible(self.page_loaded_selector, timeout=self.timeout)
 
     def go_to_url(self, url):
+        self.clear_element_cache()
         self.driver.get(url)
 
+    def clear_element_cache(self):
+        self._elements.clear()
+
+    def __cached_element(self, selector, clickable):
+        """Return the cached element of a locator when it is still attached, visible (and enabled), else None"""
+        if not self.element_cache:
+            return None
+        element = self._elements.get(selector)
+        if element is None:
+            self.__count_cache('misses')
+            return None
+        try:
+            if self.driver.execute_script(VALIDATE_ELEMENT_JS, element, clickable):
+                self.__count_cache('hits')
+                return element
+            self.__count_cache('misses')
+        except (StaleElementReferenceException, JavascriptException):
+            self.__count_cache('stale')
+        self._elements.pop(selector, None)
+        return None
+
+    def __cache_element(self, selector, element):
+        if self.element_cache:
+            self._elements[selector] = element
+        return element
+
+    def __count_cache(self, counter):
+        self.element_cache_stats[counter] += 1
+        with _ELEMENT_CACHE_LOCK:
+            ELEMENT_CACHE_STATS[counter] += 1
+
     def get_selector(self, selector):
-        if type(selector) is OrderedDict:
-            result = next(iter(selector.items()))[1]
-            for sel_version, sel in selector.items():
-                selector_version = version.parse(sel_version)
-                if self.app_version >= selector_version:
-                    result = sel
-            return result
-        else:
-            return selector
+        return LOCATORS.resolve(selector, self.app_version)
 
     def get_element(self, selector):
         by, locator = selector[0], selector[1]
-        return self.driver.find_element(by, locator)
+        start = time.time()
+        try:
+            return self.driver.find_element(by, locator)
+        finally:
+            LOCATORS.record(selector, time.time() - start)
 
     def get_elements(self, selector):
         by, locator = selector[0], selector[1]
-        return self.driver.find_elements(by, locator)
+        start = time.time()
+        try:
+            return self.driver.find_elements(by, locator)
+        finally:
+            LOCATORS.record(selector, time.time() - start)
 
     def element_exists(self, selector):
         by, locator = selector[0], selector[1]
         return True if self.driver.find_elements(by, locator) else False
 
+    def extract_rows(self, selector, columns, key=None):
+        """
+        Read columns of every element matching a selector in a single script call, instead of one round-trip per
+        element and property.
+
+        :param selector: locator of the rows, e.g. the li of a list
+        :param columns: {column: (css selector relative to the row or None for the row, property)}. The property is
+            a DOM property such as value or className, 'text' for the trimmed text content or 'visible'
+        :param key: column the returned RowSnapshot is indexed by
+        """
+        by, locator = self.get_selector(selector)
+        start = time.time()
+        try:
+            values = self.driver.execute_script(EXTRACT_ROWS_JS, by, locator,
+                                                [list(column) for column in columns.values()])
+        finally:
+            LOCATORS.record(selector, time.time() - start)
+        return RowSnapshot(list(columns), values, key=key)
+
+    def capture_state(self):
+        """Return the app state of the current page (shown sections, cookies and web storage) in one script call"""
+        return self.driver.execute_script(CAPTURE_STATE_JS)
+
+    def restore_state(self, state, check_selector=None):
+        """
+        Apply a state from capture_state to the freshly loaded app in one script call. Returns whether the element
+        of check_selector, by default the page loaded selector of this page, is visible afterwards.
+        """
+        by, locator = self.get_selector(check_selector or self._page_loaded_selector)
+        self.clear_element_cache()
+        try:
+            return bool(self.driver.execute_script(RESTORE_STATE_JS, state, by, locator))
+        except JavascriptException:
+            return False
+
     def wait_for_js_statement(self, key, value, exception_msg=None, timeout=timeout):
+        """
+        Wait until the JavaScript expression `key` evaluates to `value`.
+
+        With the browser wait engine the expression is re-evaluated inside the page by one async script, otherwise it
+        is polled with a growing delay (50 ms up to 500 ms) so that many concurrent waits do not flood the driver.
+        Raises a TimeoutException with the last value, the number of evaluations and the driver calls made.
+
+        :return: dict with the number of evaluations, driver calls and elapsed seconds
+        """
         start_time = time.time()
         print(f'Waiting for {key} is equal to {value}: {timeout} s.')
         exception_msg = exception_msg if exception_msg else f'{key} is not equal to {value} for {timeout} s. '
+        stats = {'evaluations': 0, 'driver_calls': 0, 'elapsed': 0.0}
+        js_current_value = None
+        js_error = None
 
+        if self.wait_engine == WAIT_ENGINE_BROWSER:
+            ensure_script_timeout(self.driver, timeout)
+            try:
+                result = self.driver.execute_async_script(WAIT_FOR_JS_STATEMENT_JS, key, value,
+                                                          int(timeout * 1000), JS_STATEMENT_INTERVAL_MS)
+                stats['driver_calls'] += 1
+                stats['evaluations'] += result['evaluations']
+                js_current_value, js_error = result['value'], result['error']
+                if result['ok']:
+                    stats['elapsed'] = time.time() - start_time
+                    print(f'{key} == {value} after {stats["elapsed"]} s.')
+                    return stats
+                if not js_error:
+                    stats['elapsed'] = time.time() - start_time
+                    raise TimeoutException(self.__js_statement_timeout_message(exception_msg, js_current_value,
+                                                                               js_error, stats))
+            except JavascriptException as e:
+                if not document_unloaded(e):
+                    raise
+                # The document was unloaded while waiting, finish the wait by polling
+                stats['driver_calls'] += 1
+
+        delay = JS_STATEMENT_MIN_DELAY
         while time.time() - start_time < timeout:
-            js_current_value = self.execute_js(f'return {key}')
+            stats['driver_calls'] += 1
+            stats['evaluations'] += 1
+            try:
+                js_current_value = self.execute_js(f'return {key}')
+                js_error = None
+            except JavascriptException as e:
+                js_current_value, js_error = None, e.msg
             if js_current_value == value:
-                print(f'{key} == {value} after {time.time() - start_time} s.')
-                break
-        else:
-            raise SystemExit(f'{exception_msg}')
+                stats['elapsed'] = time.time() - start_time
+                print(f'{key} == {value} after {stats["elapsed"]} s.')
+                return stats
+            time.sleep(min(delay, max(timeout - (time.time() - start_time), 0)))
+            delay = min(delay * 1.5, JS_STATEMENT_MAX_DELAY)
+
+        stats['elapsed'] = time.time() - start_time
+        raise TimeoutException(self.__js_statement_timeout_message(exception_msg, js_current_value, js_error, stats))
+
+    @staticmethod
+    def __js_statement_timeout_message(exception_msg, last_value, js_error, stats):
+        message = (f'{exception_msg}Last value: {last_value!r}. {stats["evaluations"]} evaluations and '
+                   f'{stats["driver_calls"]} driver calls in {stats["elapsed"]:.2f} s.')
+        return f'{message} Last error: {js_error}' if js_error else message
+
+    def fill_fields(self, fields, strict=()):
+        """
+        Fill many fields with a single script execution, still firing their input and change events.
+
+        Text inputs and text areas receive the value, selects pick the option whose value or text matches,
+        checkboxes and radio buttons are clicked when their checked state differs from the boolean value.
+        Dates and datetimes are sent as yyyy-mm-dd, the value format of date inputs.
+
+        :param fields: mapping (or list of pairs) of locator to value
+        :param strict: locators filled with real send_keys instead, for fields where keystroke fidelity matters
+        """
+        fields = fields.items() if hasattr(fields, 'items') else fields
+        strict = set(strict)
+        bulk = []
+        for selector, value in fields:
+            if selector in strict:
+                self.wait_until_visible(selector).send_keys(value)
+                continue
+            if isinstance(value, (datetime.date, datetime.datetime)):
+                value = value.strftime('%Y-%m-%d')
+            bulk.append([selector[0], selector[1], value])
+
+        problems = self.driver.execute_script(FILL_FIELDS_JS, bulk) if bulk else []
+        if problems:
+            details = ', '.join(f"({problem['by']}, {problem['value']}): {problem['reason']}" for problem in problems)
+            if all(problem['reason'] == 'not found' for problem in problems):
+                raise NoSuchElementException(f'Error in fill_fields: {details}')
+            raise ElementNotInteractableException(f'Error in fill_fields: {details}')
 
     def wait_until_invisible(self, selector, timeout=timeout):
         return self.__wait_until(expected_condition=ec.invisibility_of_element_located(selector), locator=selector,
-                                 time_out=timeout)
+                                 time_out=timeout, page_conditions=[page_condition('invisible', selector)])
 
     def wait_until_visible(self, selector, timeout=timeout):
-        return self.__wait_until(expected_condition=ec.visibility_of_element_located(selector), locator=selector,
-                                 time_out=timeout)
+        element = self.__cached_element(selector, clickable=False)
+        if element is not None:
+            return element
+        return self.__cache_element(selector, self.__wait_until(
+            expected_condition=ec.visibility_of_element_located(selector), locator=selector, time_out=timeout,
+            page_conditions=[page_condition('visible', selector)]))
 
     def wait_until_available_to_switch(self, selector):
         return self.__wait_until(expected_condition=ec.frame_to_be_available_and_switch_to_it(selector),
@@ -85,29 +298,36 @@ class BasePage:
 
     def wait_until_present(self, selector, timeout=timeout):
         return self.__wait_until(expected_condition=ec.presence_of_element_located(selector), locator=selector,
-                                 time_out=timeout)
+                                 time_out=timeout, page_conditions=[page_condition('present', selector)])
 
     def wait_until_clickable(self, selector, timeout=timeout):
-        return self.__wait_until(expected_condition=ec.element_to_be_clickable(selector), locator=selector,
-                                 time_out=timeout)
+        element = self.__cached_element(selector, clickable=True)
+        if element is not None:
+            return element
+        return self.__cache_element(selector, self.__wait_until(
+            expected_condition=ec.element_to_be_clickable(selector), locator=selector, time_out=timeout,
+            page_conditions=[page_condition('clickable', selector)]))
 
     def wait_until_any_element_visible(self, selector, timeout=timeout):
         return self.__wait_until(expected_condition=ec.visibility_of_any_elements_located(selector),
                                  locator=selector,
-                                 time_out=timeout)
+                                 time_out=timeout, page_conditions=[page_condition('any_visible', selector)])
 
     def wait_until_any_ec_presented(self, selectors, timeout=timeout):
         any_ec = AnyEc()
         any_ec.ecs = tuple(ec.presence_of_element_located(selector) for selector in selectors)
-        return self.__wait_until(expected_condition=any_ec, locator=selectors, time_out=timeout)
+        return self.__wait_until(expected_condition=any_ec, locator=selectors, time_out=timeout,
+                                 page_conditions=[page_condition('present', selector) for selector in selectors])
 
     def wait_until_any_ec_text_presented_in_el(self, selector_text_list, timeout=timeout):
         any_ec = AnyEc()
         any_ec.ecs = tuple(ec.text_to_be_present_in_element(locator=selector_text[0], text_=selector_text[1]) for
                            selector_text in selector_text_list)
-        return self.__wait_until(expected_condition=any_ec, locator=selector_text_list, time_out=timeout)
+        return self.__wait_until(expected_condition=any_ec, locator=selector_text_list, time_out=timeout,
+                                 page_conditions=[page_condition('text', selector_text[0], selector_text[1])
+                                                  for selector_text in selector_text_list])
 
-    def __wait_until(self, expected_condition, locator, time_out=timeout):
+    def __wait_until(self, expected_condition, locator, time_out=timeout, page_conditions=None):
         message = f"Error in wait_until: "
         ec_type = type(expected_condition)
         if ec_type == AnyEc:
@@ -129,7 +349,33 @@ class BasePage:
             message += (f"Timed out after {time_out} sec waiting for {str(expected_condition)}. \n"
                         f"Locator: {locator}{str(expected_condition)}")
 
-        return WebDriverWait(self.driver, time_out).until(expected_condition, message=message)
+        start = time.time()
+        try:
+            if self.wait_engine == WAIT_ENGINE_BROWSER and page_conditions:
+                try:
+                    return self.__wait_in_page(page_conditions, 'any' if ec_type == AnyEc else 'one', time_out,
+                                               message)
+                except TimeoutException:
+                    raise
+                except WebDriverException:
+                    # The document was unloaded while waiting or the condition cannot be evaluated in the page,
+                    # finish the wait with WebDriverWait so the usual selenium errors are raised
+                    time_out = max(time_out - (time.time() - start), 0)
+
+            return wait.WebDriverWait(self.driver, time_out).until(expected_condition, message=message)
+        finally:
+            LOCATORS.record(locator, time.time() - start)
+
+    def __wait_in_page(self, page_conditions, mode, time_out, message):
+        """Wait with a single async script resolving in the page as soon as the conditions hold"""
+        ensure_script_timeout(self.driver, time_out)
+        result = self.driver.execute_async_script(WAIT_FOR_CONDITION_JS, page_conditions, mode,
+                                                  int(time_out * 1000))
+        if result and result.get('error'):
+            raise JavascriptException(result['error'])
+        if not result or not result['ok']:
+            raise TimeoutException(message)
+        return result['value']
 
     def dismiss_popup(self, popup_selectors):
         for selector_type, selector_value in popup_selectors:
@@ -157,7 +403,7 @@ class BasePage:
 
     @property
     def app_version(self):
-        return self.driver.app_version if 'app_version' in dir(self.driver) else None
+        return getattr(self.driver, 'app_version', None)
 
     @staticmethod
     def generate_random_string(length):
@@ -168,7 +414,7 @@ class BasePage:
         return "".join([random.choice(string.digits + string.ascii_letters) for _ in range(length)])
 
     def action_chains(self):
-        return ActionChains(self.driver)
+        return action_chains.ActionChains(self.driver)
 
     def delete_all_cookies(self):
         self.driver.delete_all_cookies()
@@ -177,6 +423,46 @@ class BasePage:
         self.driver.execute_script("window.scrollTo(0, document.body.scrollHeight)")
 
 
+def page_condition(kind, selector, text=None):
+    """Describe a wait condition for the in-page wait engine"""
+    return {'kind': kind, 'by': selector[0], 'value': selector[1], 'text': text}
+
+
+class RowSnapshot(Sequence):
+    """Rows read at once by BasePage.extract_rows, with a key to row index built once per snapshot"""
+
+    def __init__(self, columns, values, key=None):
+        """
+        :param columns: column names, in the order of the values of a row
+        :param values: one list of values per row
+        :param key: column to index, the first row wins for duplicate keys
+        """
+        self.columns = columns
+        self.rows = [dict(zip(columns, row), index=position) for position, row in enumerate(values)]
+        self.key = key
+        self._index = {}
+        if key is not None:
+            for row in reversed(self.rows):
+                self._index[row[key]] = row
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __getitem__(self, position):
+        return self.rows[position]
+
+    def __contains__(self, key):
+        return key in self._index
+
+    def find(self, key):
+        """Return the row of a key, None when no row has it"""
+        return self._index.get(key)
+
+    def column(self, name):
+        """Return the values of one column for every row"""
+        return [row[name] for row in self.rows]
+
+
 class AnyEc:
     """ Use with WebDriverWait to combine expected_conditions
         in an OR.
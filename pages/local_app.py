@@ -1,27 +1,20 @@
 from selenium.webdriver.common.by import By
 from pages.base_page import BasePage
+from pages.locators import LocatorTemplate
 
 
 class LoginPage(BasePage):
     """Page object representing the login page of the application."""
 
-    def __init__(self, driver):
-        """
-        Initialize the LoginPage with its web element locators.
-
-        :param driver: Selenium WebDriver instance
-        """
-        super().__init__(driver)
-
-        # Locator for element confirming page load
-        self._page_loaded_selector = (By.ID, 'login-section')
-        # Input field locators
-        self._username_input = (By.ID, 'username')
-        self._password_input = (By.ID, 'password')
-        # Button locator
-        self._login_button = (By.XPATH, '//button[@onclick="login()"]')
-        # Error message locator for invalid login attempts
-        self._error_message = (By.XPATH, '//p[@class="error"][text()="Invalid credentials."]')
+    # Locator for element confirming page load
+    _page_loaded_selector = (By.ID, 'login-section')
+    # Input field locators
+    _username_input = (By.ID, 'username')
+    _password_input = (By.ID, 'password')
+    # Button locator
+    _login_button = (By.XPATH, '//button[@onclick="login()"]')
+    # Error message locator for invalid login attempts
+    _error_message = (By.XPATH, '//p[@class="error"][text()="Invalid credentials."]')
 
     def is_page_loaded(self):
         """Wait until the login page is fully loaded by checking for a specific element."""
@@ -47,20 +40,12 @@ class LoginPage(BasePage):
 class Dashboard(BasePage):
     """Page object representing the dashboard page after successful login."""
 
-    def __init__(self, driver):
-        """
-        Initialize the Dashboard page with its web element locators.
-
-        :param driver: Selenium WebDriver instance
-        """
-        super().__init__(driver)
-
-        # Locator confirming dashboard page load
-        self._page_loaded_selector = (By.ID, 'dashboard')
-        # Buttons to navigate to other pages
-        self._go_to_item_list_page = (By.XPATH, '//button[text()="Go to Item List Page"]')
-        self._go_to_form_page = (By.XPATH, '//button[text()="Go to Form Page"]')
-        self._logout = (By.XPATH, '//button[text()="Logout"]')
+    # Locator confirming dashboard page load
+    _page_loaded_selector = (By.ID, 'dashboard')
+    # Buttons to navigate to other pages
+    _go_to_item_list_page = (By.XPATH, '//button[text()="Go to Item List Page"]')
+    _go_to_form_page = (By.XPATH, '//button[text()="Go to Form Page"]')
+    _logout = (By.XPATH, '//button[text()="Logout"]')
 
     def is_page_loaded(self):
         """Wait until the dashboard page is fully loaded."""
@@ -82,30 +67,26 @@ class Dashboard(BasePage):
 class ItemList(BasePage):
     """Page object representing the item list page where items can be added, edited, or deleted."""
 
-    def __init__(self, driver):
-        """
-        Initialize the ItemList page with its web element locators.
-
-        :param driver: Selenium WebDriver instance
-        """
-        super().__init__(driver)
-
-        # Locator to confirm the item list page is loaded
-        self._page_loaded_selector = (By.ID, 'list-page')
+    # Locator to confirm the item list page is loaded
+    _page_loaded_selector = (By.ID, 'list-page')
 
-        # Input field to add new items
-        self._item_input = (By.ID, 'item-input')
+    # Input field to add new items
+    _item_input = (By.ID, 'item-input')
 
-        # Button locators for item operations
-        self._add_item = (By.XPATH, '//button[text()="Add Item"]')
-        self._item_edit_input = (By.XPATH, '//li/input')
-        self._save_item = (By.XPATH, '//button[text()="Save"]')
-        self._back_to_dashboard = (By.XPATH, '//div[@id="list-page"]//button[text()="Back to Dashboard"]')
-        self._item_lists = (By.XPATH, '//ul[@id="item-list"]/li')
+    # Button locators for item operations
+    _add_item = (By.XPATH, '//button[text()="Add Item"]')
+    _item_edit_input = (By.XPATH, '//li/input')
+    _save_item = (By.XPATH, '//button[text()="Save"]')
+    _back_to_dashboard = (By.XPATH, '//div[@id="list-page"]//button[text()="Back to Dashboard"]')
+    _export_items = (By.XPATH, '//button[text()="Export Items"]')
+    _item_lists = (By.XPATH, '//ul[@id="item-list"]/li')
 
-        # XPath template's for edit and delete buttons next to specific item names
-        self._edit_button = "//span[text()='{}']/following-sibling::button[1]"
-        self._delete_button = "//span[text()='{}']/following-sibling::button[2]"
+    # XPath template's for edit and delete buttons next to specific item names
+    _edit_button = LocatorTemplate(By.XPATH, "//span[text()='{}']/following-sibling::button[1]")
+    _delete_button = LocatorTemplate(By.XPATH, "//span[text()='{}']/following-sibling::button[2]")
+    # Edit and delete buttons of the item at a position (starting at 1), found without scanning the item texts
+    _edit_button_at = LocatorTemplate(By.CSS_SELECTOR, 'ul#item-list > li:nth-child({}) > button:nth-of-type(1)')
+    _delete_button_at = LocatorTemplate(By.CSS_SELECTOR, 'ul#item-list > li:nth-child({}) > button:nth-of-type(2)')
 
     def is_page_loaded(self):
         """Wait until the item list page is fully loaded."""
@@ -123,13 +104,20 @@ class ItemList(BasePage):
         """Click the button to add a new item."""
         self.wait_until_clickable(self._add_item).click()
 
-    def click_edit_by_item_name(self, item):
-        """Click the edit button for the specified item."""
-        self.wait_until_clickable((By.XPATH, self._edit_button.format(item))).click()
+    def click_edit_by_item_name(self, item, snapshot=None):
+        """
+        Click the edit button for the specified item. With a snapshot from get_items_snapshot taken after the last
+        change of the list, the button is located by the position of the item instead of by its text.
+        """
+        row = snapshot.find(item) if snapshot is not None else None
+        locator = self._edit_button.format(item) if row is None else self._edit_button_at.format(row['index'] + 1)
+        self.wait_until_clickable(locator).click()
 
-    def click_delete_by_item_name(self, item):
-        """Click the delete button for the specified item."""
-        self.wait_until_clickable((By.XPATH, self._delete_button.format(item))).click()
+    def click_delete_by_item_name(self, item, snapshot=None):
+        """Click the delete button for the specified item, located by position when a snapshot is given."""
+        row = snapshot.find(item) if snapshot is not None else None
+        locator = self._delete_button.format(item) if row is None else self._delete_button_at.format(row['index'] + 1)
+        self.wait_until_clickable(locator).click()
 
     def clear_item_edit_input(self):
         """Clear the input field used for editing an item."""
@@ -147,32 +135,38 @@ class ItemList(BasePage):
         """Return a list of WebElement objects representing all items on the page."""
         return self.get_elements(self._item_lists)
 
+    def get_items_snapshot(self):
+        """Return the name and edit state of every item in one script call, as a RowSnapshot indexed by name."""
+        return self.extract_rows(self._item_lists, {'name': ('span', 'text'), 'editing': ('input', 'visible')},
+                                 key='name')
 
-class Form(BasePage):
-    """Page object representing the form submission page with various input types."""
+    def get_item_names(self):
+        """Return the names of all items in one script call."""
+        return self.get_items_snapshot().column('name')
 
-    def __init__(self, driver):
-        """
-        Initialize the Form page with its web element locators.
+    def click_export_items(self):
+        """Click the button to download the items as items.csv."""
+        self.wait_until_clickable(self._export_items).click()
 
-        :param driver: Selenium WebDriver instance
-        """
-        super().__init__(driver)
 
-        # Page identifier
-        self._page_loaded_selector = (By.ID, 'form-page')
+class Form(BasePage):
+    """Page object representing the form submission page with various input types."""
+
+    # Page identifier
+    _page_loaded_selector = (By.ID, 'form-page')
 
-        # Form element locators
-        self._text_input = (By.ID, 'form-input')
-        self._option_dropdown = (By.ID, 'dropdown')
-        self._date_input = (By.ID, 'date')
-        self._agree_checkbox = (By.ID, 'agree')
-        self._submit_button = (By.XPATH, '//button[text()="Submit"]')
-        self._form_message = (By.ID, 'form-message')
+    # Form element locators
+    _text_input = (By.ID, 'form-input')
+    _option_dropdown = (By.ID, 'dropdown')
+    _date_input = (By.ID, 'date')
+    _agree_checkbox = (By.ID, 'agree')
+    _submit_button = (By.XPATH, '//button[text()="Submit"]')
+    _form_message = (By.ID, 'form-message')
+    _back_to_dashboard = (By.XPATH, '//div[@id="form-page"]//button[text()="Back to Dashboard"]')
 
-        # Dynamic locators
-        self._select_option_xpath = '//option[@value="{}"]'
-        self._radio_button_xpath = '//input[@type="radio" and @value="{}"]'
+    # Dynamic locators
+    _select_option = LocatorTemplate(By.XPATH, '//option[@value="{}"]')
+    _radio_button = LocatorTemplate(By.XPATH, '//input[@type="radio" and @value="{}"]')
 
     def is_page_loaded(self):
         """Verify the form page is visible."""
@@ -185,7 +179,7 @@ class Form(BasePage):
     def select_dropdown_option(self, option_text):
         """Select an option from the dropdown."""
         self.wait_until_clickable(self._option_dropdown).click()
-        self.wait_until_clickable((By.XPATH, self._select_option_xpath.format(option_text))).click()
+        self.wait_until_clickable(self._select_option.format(option_text)).click()
 
     def fill_date(self, date_str):
         """Enter a date in the date picker."""
@@ -193,7 +187,7 @@ class Form(BasePage):
 
     def select_radio_option(self, value):
         """Select a radio button by its value."""
-        self.wait_until_clickable((By.XPATH, self._radio_button_xpath.format(value))).click()
+        self.wait_until_clickable(self._radio_button.format(value)).click()
 
     def check_agree_checkbox(self):
         """Check the agreement checkbox."""
@@ -203,8 +197,27 @@ class Form(BasePage):
         """Click the submit button."""
         self.wait_until_clickable(self._submit_button).click()
 
+    def fill_form(self, text, option, date, choice, agree=True, strict=False):
+        """
+        Fill every field of the form with one script execution.
+
+        :param date: date or yyyy-mm-dd string
+        :param strict: type the text input with send_keys instead of setting its value
+        """
+        self.fill_fields({
+            self._text_input: text,
+            self._option_dropdown: option,
+            self._date_input: date,
+            self._radio_button.format(choice): True,
+            self._agree_checkbox: agree,
+        }, strict=[self._text_input] if strict else [])
+
     def get_form_message(self):
         """Return the text message of the form"""
         return self.wait_until_visible(self._form_message).text
 
+    def click_go_back_to_dashboard(self):
+        """Click the button to go back to dashboard."""
+        self.wait_until_visible(self._back_to_dashboard).click()
+
 
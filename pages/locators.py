@@ -0,0 +1,172 @@
+"""
+Locator registry shared by every page object.
+
+Locator tuples declared as class attributes of a BasePage subclass are compiled once, when the class is created:
+simple XPaths such as //*[@id="login-section"] or //ul[@id="item-list"]/li are rewritten into the faster ID or
+CSS strategies. Versioned selectors (OrderedDict of version to locator) are resolved once per app version and
+formatted dynamic locators are interned. The registry also records how long each locator took to be found.
+"""
+import re
+import threading
+from collections import OrderedDict
+
+from packaging import version
+from selenium.webdriver.common.by import By
+
+BY_STRATEGIES = frozenset(value for name, value in vars(By).items() if name.isupper())
+
+# One location step of a simple XPath: an axis, a tag (or *) and at most one attribute equality predicate,
+# e.g. //ul[@id="item-list"] or /li
+_XPATH_STEP = re.compile(r'''(//|/)(\*|[a-z][a-z0-9-]*)(?:\[@([a-zA-Z_][\w-]*)=(["'])([^"'\\]*)\4\])?''')
+_CSS_IDENTIFIER = re.compile(r'^[A-Za-z_][\w-]*$')
+
+# Formatted locators kept before the intern table is cleared, item names differ on every load test iteration
+MAX_FORMATTED = 10000
+# Locators timed separately, the others are recorded together under OTHER_LOCATORS
+MAX_TIMED = 1000
+OTHER_LOCATORS = '<other locators>'
+
+
+def is_locator(value):
+    """True for a (By strategy, value) tuple"""
+    return (isinstance(value, tuple) and len(value) == 2 and value[0] in BY_STRATEGIES
+            and isinstance(value[1], str))
+
+
+def optimize(selector):
+    """
+    Rewrite a simple XPath into the equivalent ID or CSS locator, other locators are returned as is.
+
+    Only paths made of tag steps with at most one attribute equality each are rewritten, for example
+    //*[@id="x"] -> (id, x), //button[@onclick="login()"] -> button[onclick="login()"] and
+    //ul[@id="item-list"]/li -> ul#item-list > li. Text, position and function predicates keep their XPath.
+    """
+    if selector[0] != By.XPATH or not selector[1].startswith('//'):
+        return selector
+    xpath = selector[1]
+    steps = []
+    position = 0
+    while position < len(xpath):
+        match = _XPATH_STEP.match(xpath, position)
+        if not match:
+            return selector
+        steps.append(match.groups())
+        position = match.end()
+
+    if len(steps) == 1 and steps[0][1] == '*' and steps[0][2] == 'id':
+        return By.ID, steps[0][4]
+
+    css = []
+    for index, (axis, tag, attribute, _, value) in enumerate(steps):
+        tag = '' if tag == '*' and attribute else tag
+        if attribute is None:
+            step = tag
+        elif attribute == 'id' and _CSS_IDENTIFIER.match(value):
+            step = f'{tag}#{value}'
+        else:
+            step = f'{tag}[{attribute}="{value}"]'
+        if index:
+            css.append(' ' if axis == '//' else ' > ')
+        css.append(step)
+    return By.CSS_SELECTOR, ''.join(css)
+
+
+class LocatorTemplate:
+    """A locator whose value is formatted at run time, e.g. the edit button of an item with a given name"""
+
+    def __init__(self, by, template):
+        self.by = by
+        self.template = template
+
+    def format(self, *args):
+        """Return the compiled locator for the arguments, the same tuple for the same arguments"""
+        return LOCATORS.format(self, args)
+
+    def __repr__(self):
+        return f'LocatorTemplate({self.by!r}, {self.template!r})'
+
+
+class LocatorRegistry:
+    """Compiled locators of every page class, plus the time spent finding each locator"""
+
+    def __init__(self):
+        self.pages = {}
+        self._compiled = {}
+        self._formatted = {}
+        # Formatted locator -> its template, their timings are recorded under the template
+        self._templates = {}
+        self._versioned = {}
+        self._timings = {}
+        self._lock = threading.Lock()
+
+    def register(self, page_class):
+        """Compile the locator class attributes of a page class in place"""
+        locators = {}
+        for name, value in list(vars(page_class).items()):
+            if is_locator(value):
+                locators[name] = self.compile(value)
+                setattr(page_class, name, locators[name])
+        self.pages[page_class.__name__] = locators
+
+    def compile(self, selector):
+        """Return the optimized and interned version of a locator"""
+        compiled = self._compiled.get(selector)
+        if compiled is None:
+            compiled = self._compiled.setdefault(selector, optimize(selector))
+        return compiled
+
+    def format(self, template, args):
+        """Return the interned, compiled locator of a template formatted with the arguments"""
+        key = (template.by, template.template, args)
+        locator = self._formatted.get(key)
+        if locator is None:
+            if len(self._formatted) >= MAX_FORMATTED:
+                self._formatted.clear()
+                self._templates.clear()
+            locator = optimize((template.by, template.template.format(*args)))
+            locator = self._formatted.setdefault(key, locator)
+            self._templates[locator] = (template.by, template.template)
+        return locator
+
+    def resolve(self, selector, app_version):
+        """
+        Return the locator of a versioned selector for the app version: the one declared for the highest version
+        lower or equal to it, or the first one. The versions are parsed and the choice cached once per app version.
+        """
+        if type(selector) is not OrderedDict:
+            return selector
+        key = (id(selector), app_version)
+        cached = self._versioned.get(key)
+        if cached is not None and cached[0] is selector:
+            return cached[1]
+
+        result = next(iter(selector.values()))
+        if app_version is not None:
+            current = version.parse(str(app_version))
+            for sel_version, sel in selector.items():
+                if current >= version.parse(sel_version):
+                    result = sel
+        result = self.compile(result) if is_locator(result) else result
+        # Keep a reference to the selector so that its id cannot be reused by another object
+        self._versioned[key] = (selector, result)
+        return result
+
+    def record(self, selector, elapsed):
+        """Record the time a wait or find took for a locator, formatted locators are recorded under their template"""
+        template = self._templates.get(selector) if isinstance(selector, tuple) else None
+        key = str(template or selector)
+        with self._lock:
+            if key not in self._timings and len(self._timings) >= MAX_TIMED:
+                key = OTHER_LOCATORS
+            count, total, slowest = self._timings.get(key, (0, 0.0, 0.0))
+            self._timings[key] = (count + 1, total + elapsed, max(slowest, elapsed))
+
+    def slowest(self, limit=10):
+        """Return (locator, count, mean, max) of the locators with the highest mean time"""
+        with self._lock:
+            rows = [(locator, count, total / count, slowest)
+                    for locator, (count, total, slowest) in self._timings.items()]
+        return sorted(rows, key=lambda row: row[2], reverse=True)[:limit]
+
+
+LOCATORS = LocatorRegistry()
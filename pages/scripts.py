@@ -0,0 +1,348 @@
+"""JavaScript executed in the page by BasePage."""
+
+# Helpers shared by the scripts below. Locators are (by, value) pairs using the selenium By strings.
+LOCATOR_HELPERS = """
+function findAll(by, value) {
+    switch (by) {
+        case 'id': {
+            const el = document.getElementById(value);
+            return el ? [el] : [];
+        }
+        case 'css selector':
+            return Array.from(document.querySelectorAll(value));
+        case 'xpath': {
+            const snapshot = document.evaluate(value, document, null, XPathResult.ORDERED_NODE_SNAPSHOT_TYPE, null);
+            const nodes = [];
+            for (let i = 0; i < snapshot.snapshotLength; i++) {
+                nodes.push(snapshot.snapshotItem(i));
+            }
+            return nodes;
+        }
+        case 'name':
+            return Array.from(document.getElementsByName(value));
+        case 'class name':
+            return Array.from(document.getElementsByClassName(value));
+        case 'tag name':
+            return Array.from(document.getElementsByTagName(value));
+        case 'link text':
+            return Array.from(document.links).filter(a => a.innerText.trim() === value);
+        case 'partial link text':
+            return Array.from(document.links).filter(a => a.innerText.includes(value));
+    }
+    throw new Error('Unsupported locator strategy: ' + by);
+}
+
+function isVisible(el) {
+    if (!el || !el.isConnected) {
+        return false;
+    }
+    // Options are displayed when their select is
+    if (el.tagName === 'OPTION' || el.tagName === 'OPTGROUP') {
+        const select = el.closest('select');
+        return select ? isVisible(select) : false;
+    }
+    if (el.checkVisibility) {
+        if (!el.checkVisibility({opacityProperty: true, visibilityProperty: true})) {
+            return false;
+        }
+    } else {
+        for (let node = el; node && node.nodeType === 1; node = node.parentElement) {
+            const style = getComputedStyle(node);
+            if (style.display === 'none' || style.visibility === 'hidden' || style.opacity === '0') {
+                return false;
+            }
+        }
+    }
+    const rect = el.getBoundingClientRect();
+    return rect.width > 0 && rect.height > 0;
+}
+"""
+
+# Resolve when the conditions hold, re-checking on DOM mutations (coalesced per animation frame) and on a slow
+# interval for changes that do not mutate the DOM. Arguments: conditions, mode ('one' or 'any'), timeout in ms.
+WAIT_FOR_CONDITION_JS = LOCATOR_HELPERS + """
+const conditions = arguments[0];
+const mode = arguments[1];
+const timeoutMs = arguments[2];
+const done = arguments[arguments.length - 1];
+
+function evaluate(condition) {
+    const elements = findAll(condition.by, condition.value);
+    switch (condition.kind) {
+        case 'present':
+            return elements.length ? elements[0] : null;
+        case 'visible':
+            return elements.length && isVisible(elements[0]) ? elements[0] : null;
+        case 'clickable':
+            return elements.length && isVisible(elements[0]) && !elements[0].disabled ? elements[0] : null;
+        case 'invisible':
+            return !elements.length || !isVisible(elements[0]) ? true : null;
+        case 'any_visible': {
+            const visible = elements.filter(isVisible);
+            return visible.length ? visible : null;
+        }
+        case 'text':
+            return elements.length && elements[0].innerText.includes(condition.text) ? true : null;
+    }
+    throw new Error('Unsupported condition: ' + condition.kind);
+}
+
+function check() {
+    for (const condition of conditions) {
+        let value = null;
+        try {
+            value = evaluate(condition);
+        } catch (e) {
+            if (mode !== 'any') {
+                throw e;
+            }
+        }
+        if (value !== null) {
+            return {ok: true, value: mode === 'any' ? true : value};
+        }
+    }
+    return null;
+}
+
+let finished = false;
+let scheduled = false;
+let observer = null;
+let interval = null;
+let timer = null;
+
+function finish(result) {
+    if (finished) {
+        return;
+    }
+    finished = true;
+    if (observer) observer.disconnect();
+    clearInterval(interval);
+    clearTimeout(timer);
+    done(result);
+}
+
+function run() {
+    scheduled = false;
+    try {
+        const result = check();
+        if (result) {
+            finish(result);
+        }
+    } catch (e) {
+        finish({ok: false, error: String(e)});
+    }
+}
+
+function schedule() {
+    if (!scheduled && !finished) {
+        scheduled = true;
+        requestAnimationFrame(run);
+    }
+}
+
+run();
+if (!finished) {
+    observer = new MutationObserver(schedule);
+    observer.observe(document, {subtree: true, childList: true, attributes: true, characterData: true});
+    interval = setInterval(run, 100);
+    timer = setTimeout(() => finish({ok: false}), timeoutMs);
+}
+"""
+
+# Resolve when `return <expression>` equals the expected value (compared as JSON). The expression is re-evaluated
+# on DOM mutations and on a short interval, since script state can change without touching the DOM.
+# Arguments: expression, expected value, timeout in ms, interval in ms.
+WAIT_FOR_JS_STATEMENT_JS = """
+const evaluate = new Function('return ' + arguments[0]);
+const expected = JSON.stringify(arguments[1]);
+const timeoutMs = arguments[2];
+const intervalMs = arguments[3];
+const done = arguments[arguments.length - 1];
+const start = performance.now();
+let evaluations = 0;
+let value;
+let finished = false;
+let observer = null;
+let interval = null;
+let timer = null;
+
+function finish(ok, error) {
+    if (finished) {
+        return;
+    }
+    finished = true;
+    if (observer) observer.disconnect();
+    clearInterval(interval);
+    clearTimeout(timer);
+    let lastValue = null;
+    try {
+        lastValue = JSON.parse(JSON.stringify(value === undefined ? null : value));
+    } catch (e) {
+        lastValue = String(value);
+    }
+    done({ok: ok, error: error || null, evaluations: evaluations, value: lastValue,
+          elapsed: performance.now() - start});
+}
+
+function check() {
+    if (finished) {
+        return;
+    }
+    evaluations += 1;
+    try {
+        value = evaluate();
+    } catch (e) {
+        value = undefined;
+        if (!(e instanceof ReferenceError || e instanceof TypeError)) {
+            finish(false, String(e));
+            return;
+        }
+    }
+    if (JSON.stringify(value) === expected) {
+        finish(true);
+    }
+}
+
+check();
+if (!finished) {
+    observer = new MutationObserver(() => requestAnimationFrame(check));
+    observer.observe(document, {subtree: true, childList: true, attributes: true, characterData: true});
+    interval = setInterval(check, intervalMs);
+    timer = setTimeout(() => finish(false), timeoutMs);
+}
+"""
+
+# Set many fields in one call. Arguments: list of [by, value, field value]. Text-like inputs get their value through
+# the native setter followed by input and change events, selects are matched on option value then text, checkboxes
+# and radios are clicked when their state differs so their click handlers run too.
+# Returns the fields that could not be filled.
+FILL_FIELDS_JS = LOCATOR_HELPERS + """
+const fields = arguments[0];
+const problems = [];
+
+function fire(el, type) {
+    el.dispatchEvent(new Event(type, {bubbles: true}));
+}
+
+function setValue(el, value) {
+    const proto = el.tagName === 'TEXTAREA' ? HTMLTextAreaElement.prototype : HTMLInputElement.prototype;
+    Object.getOwnPropertyDescriptor(proto, 'value').set.call(el, value);
+    fire(el, 'input');
+    fire(el, 'change');
+}
+
+for (const [by, locator, value] of fields) {
+    const el = findAll(by, locator)[0];
+    if (!el) {
+        problems.push({by: by, value: locator, reason: 'not found'});
+        continue;
+    }
+    if (!isVisible(el) || el.disabled) {
+        problems.push({by: by, value: locator, reason: 'not interactable'});
+        continue;
+    }
+    if (el.tagName === 'SELECT') {
+        const option = Array.from(el.options).find(o => o.value === String(value)) ||
+                       Array.from(el.options).find(o => o.text.trim() === String(value));
+        if (!option) {
+            problems.push({by: by, value: locator, reason: 'no option ' + value});
+            continue;
+        }
+        el.value = option.value;
+        fire(el, 'input');
+        fire(el, 'change');
+    } else if (el.type === 'checkbox' || el.type === 'radio') {
+        if (el.checked !== Boolean(value)) {
+            el.click();
+        }
+    } else if (el.tagName === 'INPUT' || el.tagName === 'TEXTAREA') {
+        setValue(el, value === null ? '' : String(value));
+    } else {
+        problems.push({by: by, value: locator, reason: 'unsupported element ' + el.tagName});
+    }
+}
+return problems;
+"""
+
+# Cheap validation of a cached element handle. Arguments: element, whether it must also be enabled.
+VALIDATE_ELEMENT_JS = LOCATOR_HELPERS + """
+const el = arguments[0];
+return isVisible(el) && (!arguments[1] || !el.disabled);
+"""
+
+# Read columns of every row matching a locator in one call. Arguments: by, value, list of [sub selector, property].
+# The sub selector is a CSS selector relative to the row (null for the row itself). The property is a DOM property,
+# 'text' for the trimmed textContent or 'visible'. Returns one array of values per row.
+EXTRACT_ROWS_JS = LOCATOR_HELPERS + """
+const rows = findAll(arguments[0], arguments[1]);
+const columns = arguments[2];
+return rows.map(row => columns.map(([selector, property]) => {
+    const node = selector ? row.querySelector(selector) : row;
+    if (!node) {
+        return null;
+    }
+    if (property === 'text') {
+        return node.textContent.trim();
+    }
+    if (property === 'visible') {
+        return isVisible(node);
+    }
+    const value = node[property];
+    return value === undefined ? null : value;
+}));
+"""
+
+# App state of a logged in page: classes of the elements with an id (which sections are shown), cookies readable by
+# scripts and web storage. Restored by RESTORE_STATE_JS.
+CAPTURE_STATE_JS = """
+const classes = {};
+document.querySelectorAll('[id]').forEach(el => { classes[el.id] = el.className; });
+// Storage can be unavailable, e.g. when it is disabled for file:// pages
+function dump(name) {
+    try {
+        const storage = window[name];
+        return Object.fromEntries(Object.keys(storage).map(key => [key, storage.getItem(key)]));
+    } catch (e) {
+        return {};
+    }
+}
+return {classes: classes, cookies: document.cookie, localStorage: dump('localStorage'),
+        sessionStorage: dump('sessionStorage')};
+"""
+
+# Apply a captured state to the freshly loaded page. Arguments: state, by and value of the element that must be
+# visible afterwards. Returns whether it is.
+RESTORE_STATE_JS = LOCATOR_HELPERS + """
+const state = arguments[0];
+for (const [id, className] of Object.entries(state.classes)) {
+    const el = document.getElementById(id);
+    if (el) {
+        el.className = className;
+    }
+}
+for (const cookie of state.cookies ? state.cookies.split('; ') : []) {
+    document.cookie = cookie;
+}
+for (const name of ['localStorage', 'sessionStorage']) {
+    for (const [key, value] of Object.entries(state[name])) {
+        window[name].setItem(key, value);
+    }
+}
+const check = findAll(arguments[1], arguments[2]);
+return check.length > 0 && isVisible(check[0]);
+"""
+
+# Rectangles of the elements masked in a screenshot comparison. Argument: list of [by, value]. Returns the device
+# pixel ratio and one [x, y, width, height] per matching element, in CSS pixels of the viewport.
+MASK_RECTS_JS = LOCATOR_HELPERS + """
+const rects = [];
+for (const [by, value] of arguments[0]) {
+    for (const el of findAll(by, value)) {
+        const rect = el.getBoundingClientRect();
+        if (rect.width > 0 && rect.height > 0) {
+            rects.push([rect.left, rect.top, rect.width, rect.height]);
+        }
+    }
+}
+return [window.devicePixelRatio || 1, rects];
+"""
@@ -0,0 +1,110 @@
+"""
+Step spans of the page-object methods.
+
+Every public method declared by a BasePage subclass (LoginPage.fill_username, ItemList.click_save, ...) becomes a
+step once enable() is called: each call is timed as a span, nested under the page method calling it. Spans are only
+collected on a thread between begin() and end(), the conftest does it around every test. Methods are wrapped by
+enable() and restored by disable(), so page objects run unchanged while step timing is off.
+"""
+import functools
+import inspect
+import threading
+import time
+
+_PAGE_CLASSES = []
+_ORIGINALS = {}
+_state = threading.local()
+_enabled = False
+
+
+def register(page_class):
+    """Called for every BasePage subclass, its methods are wrapped right away when steps are enabled"""
+    _PAGE_CLASSES.append(page_class)
+    if _enabled:
+        _instrument(page_class)
+
+
+def enable():
+    """Wrap the public methods of every page class"""
+    global _enabled
+    if not _enabled:
+        _enabled = True
+        for page_class in _PAGE_CLASSES:
+            _instrument(page_class)
+
+
+def disable():
+    """Restore the original page methods"""
+    global _enabled
+    _enabled = False
+    for (page_class, name), method in _ORIGINALS.items():
+        setattr(page_class, name, method)
+    _ORIGINALS.clear()
+
+
+def is_enabled():
+    return _enabled
+
+
+def begin():
+    """Start collecting the spans of the current thread, e.g. of one test"""
+    _state.spans = []
+    _state.depth = 0
+
+
+def end():
+    """
+    Stop collecting and return the spans in call order. A span is a dict with the step name (PageClass.method),
+    its nesting depth, its duration in milliseconds and whether it succeeded.
+    """
+    spans = getattr(_state, 'spans', None)
+    _state.spans = None
+    return spans or []
+
+
+def breakdown(spans):
+    """
+    Aggregate spans per call path, the step with the steps calling it, in tree order:
+    [(depth, step, calls, total ms, failures)]. A step called from two different steps gets a row under each.
+    """
+    steps = {}
+    first_call = {}
+    path = []
+    for span in spans:
+        # Spans are recorded when a step starts, the caller of a span is the last step one level up
+        del path[span['depth']:]
+        path.append(span['step'])
+        key = tuple(path)
+        first_call.setdefault(key, len(first_call))
+        calls, total, failures = steps.get(key, (0, 0.0, 0))
+        steps[key] = (calls + 1, total + span['ms'], failures + (not span['ok']))
+    order = sorted(steps, key=lambda key: [first_call[key[:length]] for length in range(1, len(key) + 1)])
+    return [(len(key) - 1, key[-1], steps[key][0], round(steps[key][1], 1), steps[key][2]) for key in order]
+
+
+def _instrument(page_class):
+    for name, value in list(vars(page_class).items()):
+        if name.startswith('_') or not inspect.isfunction(value):
+            continue
+        _ORIGINALS[(page_class, name)] = value
+        setattr(page_class, name, _step(value))
+
+
+def _step(method):
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        spans = getattr(_state, 'spans', None)
+        if spans is None:
+            return method(self, *args, **kwargs)
+        span = {'step': f'{type(self).__name__}.{method.__name__}', 'depth': _state.depth, 'ms': 0.0, 'ok': False}
+        spans.append(span)
+        _state.depth += 1
+        start = time.perf_counter()
+        try:
+            result = method(self, *args, **kwargs)
+            span['ok'] = True
+            return result
+        finally:
+            span['ms'] = round((time.perf_counter() - start) * 1000, 1)
+            _state.depth -= 1
+    return wrapper
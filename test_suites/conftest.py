@@ -3,36 +3,85 @@ import tempfile
 from datetime import datetime
 
 import functools
+from collections import defaultdict
 import time
 import sys
 import os.path
+import shutil
 from pathlib import Path
-import inspect
-import pandas
-
-# Provide multiple browser support for running tests
-from selenium.webdriver import Chrome, Firefox
-from selenium.webdriver.chrome.options import Options as ChromeOptions
-from selenium.webdriver.firefox.options import Options as FirefoxOptions
 
+# Created first so that the profile covers the imports below
+from test_util.startup_profile import StartupProfile
+STARTUP = StartupProfile()
+
+from pages import steps
+from pages.base_page import BasePage, ELEMENT_CACHE_STATS, WAIT_ENGINES
+from pages.local_app import Dashboard, LoginPage
+from pages.locators import LOCATORS
+from test_util import metrics, perf_timeline, visual_diff
+from test_util.artifacts import IMAGE_FORMATS, ArtifactWriter, format_stats as format_artifact_stats, \
+    pillow_available, safe_name
+from test_util.browser_pool import BrowserPool, format_stats
+from test_util.command_counter import COMMANDS, check_budget, format_table, merge
 from test_util.config import TEST_ENV
-
-filename = inspect.getframeinfo(inspect.currentframe()).filename
-path = os.path.dirname(os.path.abspath(filename))
+from test_util.devtools import PERF_PROFILES, DevToolsSession, lean_profile, perf_profile
+from test_util.downloads import DownloadWatcher
+# Provide multiple browser support for running tests
+from test_util.driver_factory import (LAUNCH_TIMINGS, create_driver, format_launch_timings,
+                                     prepare_profile_template)
+from test_util.leak_check import LeakCheck
+from test_util.perf_history import PerfHistory, format_regressions, write_report
+from test_util.scheduling import SchedulingPlugin
+from test_util.site_server import SiteServer, format_stats as format_server_stats
+from test_util.test_data import ExcelDataStore, parse_shard
+
+# inspect.getframeinfo would scan sys.modules and execute the lazily imported selenium modules
+path = os.path.dirname(os.path.abspath(__file__))
 EXCEL_DATA = Path(__file__).parents[1]/'test_data/testdata.xlsx'
+APP_URL = (Path(__file__).parents[1]/'test_site/index.html').as_uri()
+POOL_STATS = pytest.StashKey[list]()
+WORKER_TIMINGS = pytest.StashKey[list]()
+STARTUP_REPORTS = pytest.StashKey[list]()
+ARTIFACTS = pytest.StashKey[ArtifactWriter]()
+ARTIFACT_STATS = pytest.StashKey[list]()
+WORKER_LAUNCH_TIMINGS = pytest.StashKey[list]()
+DATA_STORE = pytest.StashKey[ExcelDataStore]()
+LOGIN_STATE = pytest.StashKey[dict]()
+SERVER_STATS = pytest.StashKey[list]()
+TEST_DURATIONS = pytest.StashKey[dict]()
+PERF_REGRESSIONS = pytest.StashKey[list]()
+REMOTE_STATS = pytest.StashKey[list]()
+VISUAL = pytest.StashKey[visual_diff.VisualBaselines]()
+VISUAL_STATS = pytest.StashKey[list]()
+ELEMENT_CACHE = pytest.StashKey[list]()
+
+
+def cache_dir(config, name):
+    """
+    Directory kept between runs under .pytest_cache. With -p no:cacheprovider a temporary directory removed at the
+    end of the session is used instead.
+    """
+    if getattr(config, 'cache', None) is not None:
+        return config.cache.mkdir(name)
+    directory = tempfile.mkdtemp(prefix=f'pytest_{name}_')
+    config.add_cleanup(functools.partial(shutil.rmtree, directory, ignore_errors=True))
+    return Path(directory)
 
 
-def get_excel_test_data(sheet_name):
-    """Read excel and get the needed test data"""
-    excel_data_df = pandas.read_excel(EXCEL_DATA, sheet_name=sheet_name)
-    json_list = excel_data_df.to_dict('records')
-    return json_list
+def get_excel_test_data(sheet_name, config):
+    """Get the rows of an excel sheet from the test data cache, converting the workbook when it changed"""
+    store = config.stash.get(DATA_STORE, None)
+    if store is None:
+        store = config.stash[DATA_STORE] = ExcelDataStore(EXCEL_DATA, cache_dir(config, 'test_data'))
+    return store.sheet(sheet_name)
 
 
 def pytest_generate_tests(metafunc):
-    """Check if a fixture is requested, then get the data"""
+    """Check if a fixture is requested, then get the data. Rows are only read when a test uses them"""
     if "form_test" in metafunc.fixturenames:
-        metafunc.parametrize("form_test", get_excel_test_data('form_test'))
+        shard = metafunc.config.getoption("--data-shard")
+        rows = get_excel_test_data('form_test', metafunc.config)
+        metafunc.parametrize("form_test", rows.lazy_rows(shard=parse_shard(shard) if shard else None))
 
 
 #
@@ -40,9 +89,253 @@ def pytest_addoption(parser):
     """
     Add option to accept different kind of browser to run the test. Default is set to chrome. Supports firefox
     """
+    STARTUP.phase('conftest import')
+    parser.addoption(
+        "--driver", action="store", default="chrome",
+        help="default: chrome, options: firefox, remote (a W3C endpoint, see --remote-url)"
+    )
+    parser.addoption(
+        "--remote-url", action="store", default=None, metavar="URL",
+        help="W3C endpoint of --driver=remote, e.g. http://grid:4444. default: a local chromedriver or geckodriver"
+    )
+    parser.addoption(
+        "--remote-browser", action="store", default="chrome", choices=("chrome", "firefox"),
+        help="browser requested from the --driver=remote endpoint. default: chrome"
+    )
+    parser.addoption(
+        "--remote-pool-size", action="store", type=int, default=4,
+        help="keep-alive HTTP connections per remote driver. default: 4"
+    )
+    parser.addoption(
+        "--remote-connect-timeout", action="store", type=float, default=10, metavar="SECONDS",
+        help="timeout to open a connection to the remote endpoint. default: 10"
+    )
+    parser.addoption(
+        "--remote-read-timeout", action="store", type=float, default=120, metavar="SECONDS",
+        help="timeout to wait for the response of a remote command. default: 120"
+    )
+    parser.addoption(
+        "--data-shard", action="store", default=None, metavar="INDEX/COUNT",
+        help="only parametrize the excel rows of one shard, e.g. 2/8 on the second of eight machines"
+    )
+    parser.addoption(
+        "--shard", action="store", default=None, metavar="INDEX/COUNT",
+        help="only run one of COUNT shards of similar total duration, based on the durations of previous runs"
+    )
+    parser.addoption(
+        "--longest-first", action="store_true", default=False,
+        help="run the tests that took the longest in previous runs first"
+    )
+    parser.addoption(
+        "--app-server", action="store", default="file", choices=("file", "http"),
+        help="load the test site from file:// or from a local HTTP server. default: file"
+    )
+    parser.addoption(
+        "--server-delay", action="store", type=int, default=0, metavar="MS",
+        help="delay added by the local HTTP server to every response. default: 0"
+    )
+    parser.addoption(
+        "--server-bandwidth", action="store", type=int, default=0, metavar="KIB_PER_S",
+        help="bandwidth cap of every response of the local HTTP server, 0 for no cap. default: 0"
+    )
+    parser.addoption(
+        "--server-gzip", action="store_true", default=False,
+        help="gzip the text responses of the local HTTP server"
+    )
+    parser.addoption(
+        "--server-cache", action="store", type=int, default=None, metavar="SECONDS",
+        help="Cache-Control max-age of the local HTTP server responses. default: no-store"
+    )
+    parser.addoption(
+        "--pool-size", action="store", type=int, default=1,
+        help="maximum number of browsers kept per process or xdist worker. default: 1"
+    )
+    parser.addoption(
+        "--pool-max-uses", action="store", type=int, default=0,
+        help="recycle a browser after this many tests, 0 never recycles. default: 0"
+    )
+    parser.addoption(
+        "--pool-prewarm", action="store_true", default=False,
+        help="launch all pool browsers at session start"
+    )
+    parser.addoption(
+        "--warm-start", action="store_true", default=False,
+        help="prepare a template browser profile once and start every session from a copy-on-write clone of it"
+    )
+    parser.addoption(
+        "--perf-profile", action="store", default=None, choices=sorted(PERF_PROFILES),
+        help="CPU and network throttling applied to every chrome test, the perf_profile marker overrides it"
+    )
+    parser.addoption(
+        "--cdp-metrics", action="store_true", default=False,
+        help="add the chrome Performance.getMetrics counters of every print_timing interaction to the records"
+    )
+    parser.addoption(
+        "--trace-dir", action="store", default=None,
+        help="write a chrome trace file per test to this directory, viewable in Chrome DevTools or Perfetto"
+    )
+    parser.addoption(
+        "--metrics-sink", action="store", default="csv", choices=sorted(metrics.SINKS),
+        help="destination of the print_timing records. default: csv"
+    )
+    parser.addoption(
+        "--metrics-file", action="store", default=None,
+        help="file written by the csv and jsonl sinks, '-' for stdout. default: results/timings.<csv|jsonl>"
+    )
+    parser.addoption(
+        "--wait-engine", action="store", default="webdriver", choices=WAIT_ENGINES,
+        help="webdriver: poll with WebDriverWait, browser: resolve waits inside the page. default: webdriver"
+    )
+    parser.addoption(
+        "--element-cache", action="store_true", default=False,
+        help="reuse the elements found by wait_until_visible and wait_until_clickable within a page object"
+    )
+    parser.addoption(
+        "--page-steps", action="store_true", default=False,
+        help="time every public page-object method as a step and print the step breakdown of every test"
+    )
+    parser.addoption(
+        "--command-report", action="store", type=int, default=0, metavar="N",
+        help="summarize the WebDriver round-trips per command, page method and the N tests sending the most"
+    )
+    parser.addoption(
+        "--locator-report", action="store", type=int, default=0, metavar="N",
+        help="list the N locators with the highest mean wait or find time. default: 0"
+    )
+    parser.addoption(
+        "--artifacts-max", action="store", type=int, default=50,
+        help="failed tests captured per process (screenshot, DOM, console log), 0 for no limit. default: 50"
+    )
+    parser.addoption(
+        "--artifact-format", action="store", default="png", choices=IMAGE_FORMATS,
+        help="screenshot format, jpeg and webp need Pillow. default: png"
+    )
+    parser.addoption(
+        "--artifact-max-width", action="store", type=int, default=0, metavar="PIXELS",
+        help="downscale screenshots to this width, needs Pillow. default: 0, full size"
+    )
+    parser.addoption(
+        "--perf-history", action="store", default=None, metavar="FILE",
+        help="store the test durations and interaction timings of the run in this SQLite file, by commit and browser"
+    )
+    parser.addoption(
+        "--perf-report", action="store", default=None, metavar="FILE",
+        help="with --perf-history, write the HTML trend and regression report of the stored runs to this file"
+    )
     parser.addoption(
-        "--driver", action="store", default="chrome", help="default: chrome, option: firefox"
+        "--leak-iterations", action="store", type=int, default=30,
+        help="measured runs of the scenario of a leak test, after 3 warm-up runs. default: 30"
     )
+    parser.addoption(
+        "--leak-snapshots", action="store", default=None, metavar="DIR",
+        help="write chrome heap snapshots of the first and last measured runs of every leak test to this directory"
+    )
+    parser.addoption(
+        "--visual-baselines", action="store", default=None, metavar="DIR",
+        help="compare screenshots to the baselines in this directory, a name without baseline records one"
+    )
+    parser.addoption(
+        "--visual-update", action="store_true", default=False,
+        help="store the screenshots that do not match as the new baselines instead of failing"
+    )
+    parser.addoption(
+        "--visual-tolerance", action="store", type=int, default=16,
+        help="largest channel difference (0-255) of a pixel that is not a change. default: 16"
+    )
+    parser.addoption(
+        "--visual-max-diff", action="store", type=float, default=0.1, metavar="PERCENT",
+        help="share of changed pixels above which a screenshot does not match its baseline. default: 0.1"
+    )
+    parser.addoption(
+        "--visual-steps", action="store_true", default=False,
+        help="with --visual-baselines, also check a screenshot after every print_timing interaction"
+    )
+    parser.addoption(
+        "--startup-profile", action="store_true", default=False,
+        help="report the conftest import, configure and collection times and the heavy modules they imported"
+    )
+    parser.addoption(
+        "--startup-budget", action="store", type=float, default=None, metavar="SECONDS",
+        help="fail the run when the startup up to the end of the collection takes longer, e.g. with --collect-only"
+    )
+
+
+def pytest_configure(config):
+    """Install the metrics sink used by print_timing and select the page-object wait engine"""
+    BasePage.wait_engine = config.getoption("--wait-engine")
+    BasePage.element_cache = config.getoption("--element-cache")
+    DevToolsSession.collect_metrics = config.getoption("--cdp-metrics")
+    if config.getoption("--page-steps"):
+        steps.enable()
+    kind = config.getoption("--metrics-sink")
+    file_name = config.getoption("--metrics-file")
+    if file_name is None and kind != 'memory':
+        worker_input = getattr(config, 'workerinput', None)
+        suffix = f"_{worker_input['workerid']}" if worker_input else ''
+        file_name = f'{path}/../results/timings{suffix}.{kind}'
+    metrics.set_sink(metrics.build_sink(kind, file_name))
+    if getattr(config, 'cache', None) is not None:
+        shard = config.getoption("--shard")
+        config.pluginmanager.register(
+            SchedulingPlugin(config.cache, shard=parse_shard(shard) if shard else None,
+                             longest_first=config.getoption("--longest-first"),
+                             record=getattr(config, 'workerinput', None) is None),
+            'scheduling')
+    if config.getoption("--visual-baselines"):
+        if not pillow_available() and not hasattr(config, 'workerinput'):
+            config.issue_config_time_warning(pytest.PytestConfigWarning(
+                "--visual-baselines needs Pillow (pip install -r requirements.txt) to decode screenshots quickly, "
+                "the NumPy fallback takes more than a second per changed screenshot"), stacklevel=2)
+        baselines = config.stash[VISUAL] = visual_diff.VisualBaselines(
+            config.getoption("--visual-baselines"), f'{path}/../results/visual_diffs',
+            tolerance=config.getoption("--visual-tolerance"), max_diff=config.getoption("--visual-max-diff") / 100,
+            update=config.getoption("--visual-update"))
+        if config.getoption("--visual-steps"):
+            visual_diff.set_step_checker(baselines)
+    screenshot_path = f'{path}/../results/screenshots/Functional_Test_{datetime.today().strftime("%Y-%m-%d")}'
+    image_format, max_width = config.getoption("--artifact-format"), config.getoption("--artifact-max-width")
+    if (image_format != 'png' or max_width) and not pillow_available() and not hasattr(config, 'workerinput'):
+        config.issue_config_time_warning(pytest.PytestConfigWarning(
+            "--artifact-format and --artifact-max-width need Pillow (pip install -r requirements.txt), "
+            "screenshots are written as full-size PNG"), stacklevel=2)
+    config.stash[ARTIFACTS] = ArtifactWriter(screenshot_path, max_artifacts=config.getoption("--artifacts-max"),
+                                             image_format=image_format, max_width=max_width)
+    STARTUP.phase('configure')
+
+
+def pytest_unconfigure(config):
+    """Write the records still buffered by the metrics sink"""
+    sink = metrics.set_sink(None)
+    if sink is not None:
+        sink.close()
+
+
+@pytest.hookimpl(tryfirst=True)
+def pytest_collection(session):
+    STARTUP.start('collection')
+
+
+def pytest_collectstart(collector):
+    if isinstance(collector, pytest.Module):
+        STARTUP.start(collector.nodeid)
+
+
+def pytest_collectreport(report):
+    STARTUP.stop(report.nodeid, module=True)
+
+
+def pytest_collection_finish(session):
+    """End of the startup profile, the heavy modules imported so far are recorded"""
+    STARTUP.stop('collection')
+    STARTUP.finish()
+
+
+def startup_reports(config):
+    """(total seconds, report lines) of this process and of the xdist workers"""
+    reports = config.stash.get(STARTUP_REPORTS, [])
+    if getattr(config, 'workerinput', None) is None and STARTUP.finished is not None:
+        reports = [(STARTUP.total(), STARTUP.format())] + reports
+    return reports
 
 
 @pytest.fixture(scope='session')
@@ -56,47 +349,265 @@ def create_temp_dir():
 
 
 @pytest.fixture(scope='session')
-def web_driver(request, create_temp_dir):
+def site_server(request):
+    """
+    Local HTTP server of the test site for --app-server=http, None otherwise. Every process or xdist worker runs its
+    own, logging its requests to results/site_server<_worker>.jsonl
+    """
+    config = request.config
+    if config.getoption("--app-server") != 'http':
+        yield None
+        return
+    worker_input = getattr(config, 'workerinput', None)
+    suffix = f"_{worker_input['workerid']}" if worker_input else ''
+    server = SiteServer(f'{path}/../test_site', delay=config.getoption("--server-delay"),
+                        bandwidth=config.getoption("--server-bandwidth") * 1024,
+                        compress=config.getoption("--server-gzip"),
+                        cache_seconds=config.getoption("--server-cache"),
+                        log_file=f'{path}/../results/site_server{suffix}.jsonl')
+    yield server.start()
+
+    server.close()
+    config.stash.setdefault(SERVER_STATS, []).append(server.stats())
+
+
+@pytest.fixture(scope='session')
+def app_url(site_server):
+    """URL of test_site/index.html, served by the local HTTP server or as a file"""
+    return f'{site_server.url}index.html' if site_server is not None else APP_URL
+
+
+@pytest.fixture(scope='session')
+def remote_endpoint(request):
+    """
+    W3C endpoint of --driver=remote for this process or xdist worker, None for local browsers. The round-trips of
+    its drivers are reported in the terminal summary
+    """
+    config = request.config
+    if config.getoption("--driver") != 'remote':
+        yield None
+        return
+    # Imported here, urllib3 and the selenium remote connection are not needed by local runs
+    from test_util.remote_driver import RemoteEndpoint
+
+    endpoint = RemoteEndpoint(config.getoption("--remote-url"), browser=config.getoption("--remote-browser"),
+                              pool_size=config.getoption("--remote-pool-size"),
+                              connect_timeout=config.getoption("--remote-connect-timeout"),
+                              read_timeout=config.getoption("--remote-read-timeout")).start()
+    endpoint.probe()
+    yield endpoint
+
+    endpoint.close()
+    config.stash.setdefault(REMOTE_STATS, []).append(endpoint.stats.to_dict())
+
+
+@pytest.fixture(scope='session')
+def browser_pool(request, create_temp_dir, app_url, remote_endpoint):
+    """
+    Warm browser sessions for this process or xdist worker. Drivers are leased to tests by the web_driver fixture
+    """
     selected_driver = request.config.getoption("--driver")
-    driver = None
-    if selected_driver == 'chrome':
-        chrome_options = ChromeOptions()
-        if not TEST_ENV.webdriver_visible:
-            chrome_options.add_argument("--headless=new")
-        chrome_options.add_argument("--disable-gpu")
-        chrome_options.add_argument("--log-level=3")
-        chrome_options.add_argument('--ignore-certificate-errors')
-        chrome_options.add_argument("--no-sandbox")
-        chrome_options.add_argument("--disable-dev-shm-usage")
-        chrome_options.add_argument("--disable-infobars")
-        chrome_options.add_argument("--enable-precise-memory-info")
-        chrome_options.add_argument('lang=en')
-        chrome_options.add_argument("--disable-features=InsecureDownloadWarnings")
-        chrome_options.add_experimental_option('prefs', {'intl.accept_languages': 'en,en_US'})
-        default_download_location = {'download.default_directory': create_temp_dir}
-        chrome_options.add_experimental_option('prefs', default_download_location)
-        driver = Chrome(options=chrome_options)
-        driver.maximize_window()
-    elif selected_driver == 'firefox':
-        firefox_options = FirefoxOptions()
-        if not TEST_ENV.webdriver_visible:
-            firefox_options.headless = True
-        firefox_options.set_preference("browser.download.folderList", 2)
-        firefox_options.set_preference("browser.download.dir", create_temp_dir)
-        firefox_options.set_preference("browser.download.manager.showWhenStarting", False)
-        firefox_options.set_preference("browser.download.viewableInternally.enabledTypes", "")
-        firefox_options.set_preference("browser.helperApps.neverAsk.saveToDisk",
-                                       "application/octet-stream,application/vnd.ms-excel,application/xml,text/xml")
-        firefox_options.add_argument("--window-size=1920,1080")
-        firefox_options.add_argument('--ignore-certificate-errors')
-        driver = Firefox(options=firefox_options)
-        driver.maximize_window()
-
-    # Return the driver object at the end of setup
-    yield driver
-
-    # For cleanup, quit the driver
-    driver.quit()
+    if remote_endpoint is not None:
+        selected_driver = remote_endpoint.browser
+    # Launch options are per browser, the background services follow the rendering profile of local.yaml
+    lean = TEST_ENV.rendering == 'lean'
+    profile_template = None
+    if request.config.getoption("--warm-start") and remote_endpoint is not None:
+        print("--warm-start clones a local profile, ignored with --driver=remote")
+    elif request.config.getoption("--warm-start"):
+        # The template outlives the run, the random port origin of --app-server=http would never be visited again
+        warm_urls = [app_url] if app_url.startswith('file://') else []
+        profile_template = prepare_profile_template(selected_driver, cache_dir(request.config, 'browser_profiles'),
+                                                    warm_urls=warm_urls, lean=lean)
+    pool = BrowserPool(factory=functools.partial(create_driver, selected_driver, create_temp_dir,
+                                                 profile_template=profile_template,
+                                                 tracing=request.config.getoption("--trace-dir") is not None,
+                                                 lean=lean, remote=remote_endpoint),
+                       size=request.config.getoption("--pool-size"),
+                       max_uses=request.config.getoption("--pool-max-uses"))
+    if request.config.getoption("--pool-prewarm"):
+        pool.prewarm()
+
+    yield pool
+
+    # For cleanup, quit the drivers and keep the statistics for the terminal summary
+    pool.close()
+    request.config.stash.setdefault(POOL_STATS, []).append(pool.stats())
+
+
+@pytest.fixture(scope='function')
+def web_driver(request, browser_pool):
+    """
+    Lease a driver from the pool for a single test. It is reset and returned to the pool after the test
+    """
+    with browser_pool.lease() as driver:
+        yield COMMANDS.install(driver)
+
+        # Grab the failure artifacts before the driver is reset for the next test, they are written in the background
+        rep_call = getattr(request.node, 'rep_call', None)
+        if rep_call is not None and rep_call.failed:
+            request.config.stash[ARTIFACTS].capture(driver, request.node.name)
+
+
+@pytest.fixture(scope='function')
+def logged_in(request, web_driver, app_url):
+    """
+    Open the app logged in and return the Dashboard. The UI login runs once per process, later tests restore the
+    state captured after it in a single script call and fall back to the UI login when that fails
+    """
+    login_page = LoginPage(web_driver)
+    dashboard = Dashboard(web_driver)
+    state = request.config.stash.get(LOGIN_STATE, None)
+    login_page.go_to_url(app_url)
+    if state is None or not dashboard.restore_state(state):
+        if state is not None:
+            print("restoring the login state failed, logging in through the UI")
+        login_page.fill_username(TEST_ENV.username)
+        login_page.fill_password(TEST_ENV.password)
+        login_page.click_login_button()
+        dashboard.is_page_loaded()
+        request.config.stash[LOGIN_STATE] = dashboard.capture_state()
+    return dashboard
+
+
+@pytest.fixture(scope='function')
+def downloads(request, web_driver, create_temp_dir):
+    """
+    DownloadWatcher of the downloads of the test. Chrome switches its downloads to a directory of the test alone with
+    Browser.setDownloadBehavior. Other browsers keep the download directory shared by the browsers of the process
+    (xdist workers have their own), the watcher only returns the files created after it started. Tests using it are
+    skipped with --driver=remote, the browser saves its downloads on the remote node
+    """
+    if request.config.getoption("--driver") == 'remote':
+        pytest.skip("--driver=remote saves downloads on the remote node, out of reach of the download watcher")
+    session = DevToolsSession.for_driver(web_driver)
+    directory = Path(create_temp_dir)
+    if session is not None:
+        directory = directory / safe_name(request.node.name)
+        directory.mkdir(parents=True, exist_ok=True)
+        web_driver.execute_cdp_cmd('Browser.setDownloadBehavior', {'behavior': 'allow',
+                                                                   'downloadPath': str(directory)})
+    with DownloadWatcher(directory) as watcher:
+        yield watcher
+
+    if session is not None:
+        web_driver.execute_cdp_cmd('Browser.setDownloadBehavior', {'behavior': 'allow',
+                                                                   'downloadPath': create_temp_dir})
+
+
+@pytest.fixture(scope='function')
+def visual(request, web_driver):
+    """
+    Screenshot checks of a test: visual.check(name, masks) compares the page to the baseline of test_name/name and
+    fails on a mismatch. Without --visual-baselines the checks are skipped and return None
+    """
+    return visual_diff.VisualCheck(request.config.stash.get(VISUAL, None), web_driver, request.node.name)
+
+
+@pytest.fixture(scope='function')
+def leak_check(request, web_driver):
+    """LeakCheck of the driver of a leak test, with the iterations of --leak-iterations"""
+    snapshot_dir = request.config.getoption("--leak-snapshots")
+    return LeakCheck(web_driver, iterations=request.config.getoption("--leak-iterations"),
+                     snapshot_dir=snapshot_dir, name=request.node.name)
+
+
+@pytest.fixture(scope='function', autouse=True)
+def devtools(request):
+    """
+    DevTools session of the chrome driver of a test, None otherwise. Applies the throttling of the perf_profile
+    marker or --perf-profile and writes the trace file of the test when --trace-dir is set
+    """
+    marker = request.node.get_closest_marker('perf_profile')
+    profile_name = request.config.getoption("--perf-profile")
+    trace_dir = request.config.getoption("--trace-dir")
+    if 'web_driver' not in request.fixturenames or not (marker or profile_name or trace_dir):
+        yield None
+        return
+
+    session = DevToolsSession.for_driver(request.getfixturevalue('web_driver'))
+    if session is None:
+        print(f"perf_profile and --trace-dir need chrome, ignored for {request.node.name}")
+        yield None
+        return
+
+    if trace_dir:
+        # Drop the events of the previous test on this pooled driver
+        session.drain_trace_events()
+    if marker:
+        session.apply_profile(perf_profile(*marker.args, **marker.kwargs))
+    elif profile_name:
+        session.apply_profile(perf_profile(profile_name))
+
+    yield session
+
+    session.reset_profile()
+    if trace_dir:
+        session.write_trace(Path(trace_dir)/f'{safe_name(request.node.name)}.json')
+
+
+@pytest.fixture(scope='function', autouse=True)
+def rendering(request):
+    """
+    Rendering profile of a test, from its rendering marker or the rendering setting of local.yaml. The lean profile
+    blocks the resources of the lean setting and disables animations and transitions, chrome only
+    """
+    marker = request.node.get_closest_marker('rendering')
+    mode = marker.args[0] if marker else TEST_ENV.rendering
+    if mode not in ('full', 'lean'):
+        raise ValueError(f"Unknown rendering profile {mode!r}, expected full or lean")
+    if mode == 'full' or 'web_driver' not in request.fixturenames:
+        yield mode
+        return
+
+    session = DevToolsSession.for_driver(request.getfixturevalue('web_driver'))
+    if session is None:
+        print(f"the lean rendering profile needs chrome, {request.node.name} runs with full rendering")
+        yield 'full'
+        return
+
+    session.apply_lean(lean_profile(**TEST_ENV.lean))
+
+    yield mode
+
+    session.reset_lean()
+
+
+@pytest.hookimpl(tryfirst=True)
+def pytest_runtest_setup(item):
+    """Collect the page steps and WebDriver commands of the test, from its fixtures setup to their teardown"""
+    COMMANDS.begin('setup')
+    if steps.is_enabled():
+        steps.begin()
+
+
+@pytest.hookimpl(wrapper=True)
+def pytest_runtest_call(item):
+    """
+    Count the WebDriver round-trips of the test body. A test marked budget(round_trips=N, seconds=S) fails when
+    its body sends more commands or spends longer in them
+    """
+    COMMANDS.set_phase('call')
+    result = yield
+    marker = item.get_closest_marker('budget')
+    stats = COMMANDS.current()
+    if marker is not None and stats is not None:
+        message = check_budget(stats, **marker.kwargs)
+        if message:
+            pytest.fail(message, pytrace=False)
+    return result
+
+
+@pytest.hookimpl(hookwrapper=True)
+def pytest_runtest_teardown(item):
+    """Attach the page steps and commands to the teardown report, which also carries them to the xdist controller"""
+    COMMANDS.set_phase('teardown')
+    yield
+    stats = COMMANDS.end()
+    if stats is not None and stats.count:
+        item.user_properties.append(('webdriver_commands', stats.to_dict()))
+    if steps.is_enabled():
+        item.user_properties.append(('page_steps', steps.end()))
 
 
 @pytest.hookimpl(tryfirst=True, hookwrapper=True)
@@ -108,30 +619,228 @@ def pytest_runtest_makereport(item):
     rep = outcome.get_result()
 
     setattr(item, "rep_" + rep.when, rep)
+    if item.config.getoption("--perf-history"):
+        durations = item.config.stash.setdefault(TEST_DURATIONS, {})
+        ms, result = durations.get(rep.nodeid, (0.0, 'passed'))
+        durations[rep.nodeid] = (ms + rep.duration * 1000, 'failed' if rep.failed else result)
 
 
 @pytest.fixture(scope="function", autouse=True)
 def test_failed_check(request):
     """
-    Check if the test fails and take a screenshot of the state of the UI
+    Check if the setup of a test fails. Screenshots of failed tests are taken by web_driver before the driver is reset
     """
     yield
     if request.node.rep_setup.failed:
         print("setting up a test failed!", request.node.name)
-    elif request.node.rep_setup.passed:
-        if request.node.rep_call.failed:
-            driver = request.node.funcargs['web_driver']
-            take_screenshot(driver, request.node.name)
-
-
-def take_screenshot(web_driver, test_name):
-    screenshot_path = f'{path}/../results/screenshots/Functional_Test_{datetime.today().strftime("%Y-%m-%d")}/'
-    file_name = f'{datetime.today().strftime("%H%M%S")}_{test_name}'
 
-    if not os.path.exists(screenshot_path):
-        os.makedirs(screenshot_path)
 
-    web_driver.save_screenshot(f'{screenshot_path}/{file_name}.png')
+def pytest_sessionfinish(session):
+    """
+    Finish writing the failure artifacts. Hand the statistics of an xdist worker over to the controller, fail the
+    run over the startup budget
+    """
+    baselines = session.config.stash.get(VISUAL, None)
+    if baselines is not None:
+        baselines.save()
+        session.config.stash.setdefault(VISUAL_STATS, []).insert(0, baselines.stats())
+    writer = session.config.stash.get(ARTIFACTS, None)
+    if writer is not None:
+        writer.close()
+        session.config.stash.setdefault(ARTIFACT_STATS, []).insert(0, writer.stats())
+    workeroutput = getattr(session.config, 'workeroutput', None)
+    if workeroutput is not None:
+        workeroutput['browser_pool'] = session.config.stash.get(POOL_STATS, [])
+        workeroutput['artifacts'] = session.config.stash.get(ARTIFACT_STATS, [])
+        workeroutput['site_server'] = session.config.stash.get(SERVER_STATS, [])
+        workeroutput['test_durations'] = session.config.stash.get(TEST_DURATIONS, {})
+        workeroutput['remote_network'] = session.config.stash.get(REMOTE_STATS, [])
+        workeroutput['visual'] = session.config.stash.get(VISUAL_STATS, [])
+        workeroutput['element_cache'] = dict(ELEMENT_CACHE_STATS)
+        workeroutput['launch_timings'] = [[browser, mode, values] for (browser, mode), values in LAUNCH_TIMINGS.items()]
+        sink = metrics.get_sink()
+        workeroutput['timings'] = {'timings': dict(sink.timings), 'failures': dict(sink.failures)}
+        workeroutput['startup'] = (STARTUP.total(), STARTUP.format())
+        return
+
+    if session.config.getoption("--perf-history"):
+        record_perf_history(session.config)
+
+    budget = session.config.getoption("--startup-budget")
+    if budget is not None and session.exitstatus == pytest.ExitCode.OK:
+        if any(total > budget for total, _ in startup_reports(session.config)):
+            session.exitstatus = pytest.ExitCode.TESTS_FAILED
+
+
+@pytest.hookimpl(optionalhook=True)
+def pytest_testnodedown(node, error):
+    """Collect the pool statistics and interaction timings sent by an xdist worker"""
+    workeroutput = getattr(node, 'workeroutput', {})
+    node.config.stash.setdefault(POOL_STATS, []).extend(workeroutput.get('browser_pool', []))
+    node.config.stash.setdefault(ARTIFACT_STATS, []).extend(workeroutput.get('artifacts', []))
+    node.config.stash.setdefault(SERVER_STATS, []).extend(workeroutput.get('site_server', []))
+    node.config.stash.setdefault(TEST_DURATIONS, {}).update(workeroutput.get('test_durations', {}))
+    node.config.stash.setdefault(REMOTE_STATS, []).extend(workeroutput.get('remote_network', []))
+    node.config.stash.setdefault(VISUAL_STATS, []).extend(workeroutput.get('visual', []))
+    if 'element_cache' in workeroutput:
+        node.config.stash.setdefault(ELEMENT_CACHE, []).append(workeroutput['element_cache'])
+    node.config.stash.setdefault(WORKER_LAUNCH_TIMINGS, []).extend(workeroutput.get('launch_timings', []))
+    if 'timings' in workeroutput:
+        node.config.stash.setdefault(WORKER_TIMINGS, []).append(workeroutput['timings'])
+    if 'startup' in workeroutput:
+        node.config.stash.setdefault(STARTUP_REPORTS, []).append(tuple(workeroutput['startup']))
+
+
+def pytest_terminal_summary(terminalreporter, config):
+    """Report browser pool usage and the timing percentiles of every print_timing interaction"""
+    stats = config.stash.get(POOL_STATS, [])
+    if stats:
+        terminalreporter.write_sep("-", "browser pool")
+        for worker_stats in stats:
+            terminalreporter.write_line(format_stats(worker_stats))
+
+    launch_timings = defaultdict(list, {key: list(values) for key, values in LAUNCH_TIMINGS.items()})
+    for browser, mode, values in config.stash.get(WORKER_LAUNCH_TIMINGS, []):
+        launch_timings[(browser, mode)].extend(values)
+    if launch_timings:
+        terminalreporter.write_sep("-", "driver launch")
+        for line in format_launch_timings(launch_timings):
+            terminalreporter.write_line(line)
+
+    artifact_stats = [stats for stats in config.stash.get(ARTIFACT_STATS, []) if stats['captured'] or stats['skipped']
+                      or stats['dropped']]
+    if artifact_stats:
+        terminalreporter.write_sep("-", "failure artifacts")
+        for worker_stats in artifact_stats:
+            terminalreporter.write_line(format_artifact_stats(worker_stats))
+
+    server_stats = config.stash.get(SERVER_STATS, [])
+    if server_stats:
+        terminalreporter.write_sep("-", "test site server")
+        for line in format_server_stats(server_stats):
+            terminalreporter.write_line(line)
+
+    remote_stats = config.stash.get(REMOTE_STATS, [])
+    if remote_stats:
+        from test_util.remote_driver import format_network_stats, merge_stats
+
+        terminalreporter.write_sep("-", "remote webdriver network")
+        for line in format_network_stats(merge_stats(remote_stats), limit=15):
+            terminalreporter.write_line(line)
+
+    visual_stats = config.stash.get(VISUAL_STATS, [])
+    if visual_stats:
+        terminalreporter.write_sep("-", "visual regression")
+        for line in visual_diff.format_stats(visual_stats):
+            terminalreporter.write_line(line)
+
+    timings, failures = interaction_timings(config)
+    if timings:
+        terminalreporter.write_sep("-", "interaction timings (ms)")
+        for line in metrics.format_summary(metrics.aggregate(timings, failures)):
+            terminalreporter.write_line(line)
+
+    regressions = config.stash.get(PERF_REGRESSIONS, [])
+    if regressions:
+        terminalreporter.write_sep("-", "performance regressions")
+        for line in format_regressions(regressions):
+            terminalreporter.write_line(line, red=True)
+
+    element_cache = dict(ELEMENT_CACHE_STATS)
+    for worker_stats in config.stash.get(ELEMENT_CACHE, []):
+        for name, count in worker_stats.items():
+            element_cache[name] = element_cache.get(name, 0) + count
+    if any(element_cache.values()):
+        terminalreporter.write_sep("-", "element cache")
+        terminalreporter.write_line(', '.join(f'{name}={count}' for name, count in element_cache.items()))
+
+    if config.getoption("--page-steps"):
+        write_page_steps(terminalreporter)
+
+    if config.getoption("--command-report"):
+        write_command_report(terminalreporter, config.getoption("--command-report"))
+
+    slowest = LOCATORS.slowest(config.getoption("--locator-report"))
+    if slowest:
+        terminalreporter.write_sep("-", "slowest locators")
+        for locator, count, mean, slowest_time in slowest:
+            terminalreporter.write_line(f"{mean:8.3f}s mean {slowest_time:8.3f}s max {count:6} calls  {locator}")
+
+    budget = config.getoption("--startup-budget")
+    reports = startup_reports(config)
+    over_budget = [total for total, _ in reports if budget is not None and total > budget]
+    if config.getoption("--startup-profile") or over_budget:
+        terminalreporter.write_sep("-", "startup profile")
+        for _, lines in reports:
+            for line in lines:
+                terminalreporter.write_line(line)
+        if over_budget:
+            terminalreporter.write_line(f"startup took {max(over_budget):.3f}s, over the budget of {budget:.3f}s",
+                                        red=True)
+
+
+def interaction_timings(config):
+    """Timings and failure counts per print_timing interaction of this process and every xdist worker"""
+    sink = metrics.get_sink()
+    timings, failures = defaultdict(list), defaultdict(int)
+    for worker in [{'timings': sink.timings, 'failures': sink.failures}] + config.stash.get(WORKER_TIMINGS, []):
+        for interaction, values in worker['timings'].items():
+            timings[interaction].extend(values)
+        for interaction, count in worker['failures'].items():
+            failures[interaction] += count
+    return timings, failures
+
+
+def record_perf_history(config):
+    """Store the run in the --perf-history file and write the --perf-report of the stored runs"""
+    history = PerfHistory(config.getoption("--perf-history"))
+    try:
+        browser = config.getoption("--driver")
+        history.record_run(browser, config.stash.get(TEST_DURATIONS, {}), interaction_timings(config)[0])
+        if config.getoption("--perf-report"):
+            analysis = write_report(history, config.getoption("--perf-report"), browser)
+            config.stash[PERF_REGRESSIONS] = analysis.regressions()
+    finally:
+        history.close()
+
+
+def write_page_steps(terminalreporter):
+    """Print the step breakdown of every test, nested steps indented under the step calling them"""
+    terminalreporter.write_sep("-", "page steps (ms)")
+    for reports in terminalreporter.stats.values():
+        for report in reports:
+            page_steps = dict(getattr(report, 'user_properties', ())).get('page_steps')
+            if getattr(report, 'when', None) != 'teardown' or not page_steps:
+                continue
+            total = sum(span['ms'] for span in page_steps if span['depth'] == 0)
+            terminalreporter.write_line(f"{report.nodeid} {total:.1f}")
+            for depth, step, calls, step_total, failures in steps.breakdown(page_steps):
+                failed = f" {failures} failed" if failures else ''
+                terminalreporter.write_line(f"{'  ' * (depth + 1)}{step:<{50 - 2 * depth}}{calls:>5}x"
+                                            f"{step_total:>10.1f}{failed}")
+
+
+def write_command_report(terminalreporter, limit):
+    """Print the WebDriver round-trips per command and page method, and the tests sending the most of them"""
+    tests = []
+    for reports in terminalreporter.stats.values():
+        for report in reports:
+            commands = dict(getattr(report, 'user_properties', ())).get('webdriver_commands')
+            if getattr(report, 'when', None) == 'teardown' and commands:
+                tests.append((report.nodeid, commands))
+    if not tests:
+        return
+    totals = merge(commands for _, commands in tests)
+    terminalreporter.write_sep("-", "webdriver commands")
+    for line in format_table(totals['commands']):
+        terminalreporter.write_line(line)
+    terminalreporter.write_sep("-", "webdriver commands per page method")
+    for line in format_table(totals['methods'], limit):
+        terminalreporter.write_line(line)
+    terminalreporter.write_sep("-", "tests sending the most webdriver commands")
+    for nodeid, commands in sorted(tests, key=lambda test: test[1]['count'], reverse=True)[:limit]:
+        phases = ' '.join(f'{phase}={count}' for phase, (count, _) in commands['phases'].items())
+        terminalreporter.write_line(f"{commands['count']:>6} {commands['seconds']:>8.3f}s  {nodeid}  ({phases})")
 
 
 def print_timing(web_driver, interaction=None, ):
@@ -140,36 +849,23 @@ def print_timing(web_driver, interaction=None, ):
     def deco_wrapper(func):
         # noinspection PyBroadException
         @functools.wraps(func)
-        def wrapper():
+        def wrapper(*args, **kwargs):
+            # Observers in place before the first interaction on a document, see perf_timeline.install
+            perf_timeline.install(web_driver)
+            cdp = DevToolsSession.for_driver(web_driver) if DevToolsSession.collect_metrics else None
+            cdp_before = cdp.get_metrics() if cdp is not None else None
             start = time.time()
             error_msg = 'Success'
-            memory_usage = 0
-            backend_performance = 0
-            frontend_performance = 0
-            latency = 0
-            server_response_time = 0
-            page_load_time = 0
-            transfer_page_download_time = 0
+            browser_metrics = {}
+            result = None
             try:
-                func()
-                json_obj = web_driver.execute_script("return window.performance.memory.usedJSHeapSize")
-                memory_usage = round(json_obj / (1024 * 1024), 2)
+                result = func(*args, **kwargs)
+                # The PerformanceObserver entries of the interaction are drained in one round-trip
+                browser_metrics = perf_timeline.drain(web_driver).summary()
+                if cdp is not None:
+                    browser_metrics.update(cdp.metrics_delta(cdp_before, cdp.get_metrics()))
                 success = True
 
-                navigation_start = web_driver.execute_script("return window.performance.timing.navigationStart")
-                response_start = web_driver.execute_script("return window.performance.timing.responseStart")
-                dom_complete = web_driver.execute_script("return window.performance.timing.domComplete")
-                fetch_start = web_driver.execute_script("return window.performance.timing.fetchStart")
-                request_start = web_driver.execute_script("return window.performance.timing.requestStart")
-                load_event_start = web_driver.execute_script("return window.performance.timing.loadEventStart")
-                response_end = web_driver.execute_script("return window.performance.timing.responseEnd")
-                backend_performance = response_start - navigation_start
-                frontend_performance = dom_complete - response_start
-                latency = response_start - fetch_start
-                server_response_time = response_start - request_start
-                page_load_time = load_event_start - navigation_start
-                transfer_page_download_time = response_end - response_start
-
             except Exception:
                 success = False
                 # https://docs.python.org/2/library/sys.html#sys.exc_info
@@ -179,10 +875,14 @@ def print_timing(web_driver, interaction=None, ):
             timing = str(int((end - start) * 1000))
             timestamp = round(time.time() * 1000)
 
-            print(f"{timestamp},{timing},{memory_usage},{interaction},{error_msg},{success},{backend_performance},"
-                  f"{frontend_performance},{latency}, {server_response_time},{page_load_time},"
-                  f"{transfer_page_download_time}")
+            metrics.get_sink().emit({'timestamp': timestamp, 'timing': timing, 'interaction': interaction,
+                                     'error_msg': error_msg, 'success': success, **browser_metrics})
             assert success, error_msg
+            # After the timing, the screenshot check is not part of the interaction
+            checker = visual_diff.step_checker()
+            if checker is not None:
+                test_name = os.environ.get('PYTEST_CURRENT_TEST', '').split(' ')[0].rpartition('::')[2]
+                checker.check(web_driver, f'{test_name}/{interaction}')
+            return result
         return wrapper
     return deco_wrapper
-
@@ -0,0 +1,253 @@
+import asyncio
+import threading
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlencode
+
+import pytest
+
+from pages.async_local_app import AsyncLoginPage, AsyncDashboard, AsyncItemList
+from pages.local_app import LoginPage, Dashboard, ItemList, Form
+from test_suites.conftest import print_timing
+from test_util import metrics
+from test_util.async_webdriver import create_async_driver
+from test_util.config import TEST_ENV
+from test_util.driver_factory import create_driver
+
+# Query parameters of the stress mode of the test site, see the end of test_site/index.html
+STRESS_PROFILES = {
+    'baseline': {},
+    'long_list': {'items': 20000},
+    'many_forms': {'forms': 50, 'fields': 40},
+    'deep_dom': {'depth': 500},
+    'delayed': {'delay': 300},
+    'decorated': {'assets': 200, 'animate': 600},
+    'heavy': {'items': 20000, 'forms': 50, 'fields': 40, 'depth': 500, 'delay': 300},
+}
+
+# Browser sessions driven at once by test_benchmark_concurrency, and scenario runs per session
+CONCURRENT_SESSIONS = [4, 16]
+SCENARIO_RUNS = 3
+
+
+def stress_url(app_url, **params):
+    """URL of the test site in stress mode"""
+    query = urlencode({name: value for name, value in params.items() if value})
+    return app_url + (f'?{query}' if query else '')
+
+
+def login(web_driver, app_url, profile, prefix=None):
+    login_page = LoginPage(web_driver)
+    dashboard = Dashboard(web_driver)
+    prefix = prefix or profile
+
+    @print_timing(web_driver, f'{prefix}_open_login_page')
+    def open_login_page():
+        login_page.go_to_url(stress_url(app_url, **STRESS_PROFILES[profile]))
+        login_page.is_page_loaded()
+
+    @print_timing(web_driver, f'{prefix}_login')
+    def log_in():
+        login_page.fill_username(TEST_ENV.username)
+        login_page.fill_password(TEST_ENV.password)
+        login_page.click_login_button()
+        dashboard.is_page_loaded()
+
+    open_login_page()
+    log_in()
+    return dashboard
+
+
+# Run with -m benchmark, the timings of every profile are printed in the interaction timings summary and written
+# to the metrics sink. Add --app-server=http to include the network columns
+@pytest.mark.parametrize('profile', STRESS_PROFILES)
+@pytest.mark.benchmark
+def test_benchmark_item_list(web_driver, app_url, profile):
+    dashboard = login(web_driver, app_url, profile)
+    item_list = ItemList(web_driver)
+    item_name = f'benchmark item {profile}'
+    expected_count = STRESS_PROFILES[profile].get('items', 0) + 1
+
+    @print_timing(web_driver, f'{profile}_open_item_list')
+    def open_item_list():
+        dashboard.click_go_to_item_list()
+        item_list.is_page_loaded()
+
+    @print_timing(web_driver, f'{profile}_add_item')
+    def add_item():
+        item_list.fill_item_input(item_name)
+        item_list.click_add_item()
+
+    @print_timing(web_driver, f'{profile}_snapshot')
+    def snapshot():
+        return item_list.get_items_snapshot()
+
+    @print_timing(web_driver, f'{profile}_edit_item')
+    def edit_item(items):
+        item_list.click_edit_by_item_name(item_name, items)
+        item_list.click_save()
+
+    @print_timing(web_driver, f'{profile}_delete_item')
+    def delete_item(items):
+        item_list.click_delete_by_item_name(item_name, items)
+
+    open_item_list()
+    add_item()
+    items = snapshot()
+    assert len(items) == expected_count
+    edit_item(items)
+    delete_item(items)
+    assert len(item_list.get_item_names()) == expected_count - 1
+
+
+@pytest.mark.parametrize('profile', STRESS_PROFILES)
+@pytest.mark.benchmark
+def test_benchmark_form(web_driver, app_url, profile):
+    dashboard = login(web_driver, app_url, profile)
+    form = Form(web_driver)
+
+    @print_timing(web_driver, f'{profile}_open_form')
+    def open_form():
+        dashboard.click_go_to_form_page()
+        form.is_page_loaded()
+
+    @print_timing(web_driver, f'{profile}_fill_form_fields')
+    def fill_form_fields():
+        form.fill_text_input('benchmark')
+        form.select_dropdown_option('Option B')
+        form.fill_date('01/02/2024')
+        form.select_radio_option('Yes')
+        form.check_agree_checkbox()
+
+    @print_timing(web_driver, f'{profile}_fill_form_bulk')
+    def fill_form_bulk():
+        form.fill_form('benchmark bulk', 'Option C', '2024-01-02', 'No')
+
+    @print_timing(web_driver, f'{profile}_submit_form')
+    def submit_form():
+        form.submit_form()
+        return form.get_form_message()
+
+    open_form()
+    fill_form_fields()
+    fill_form_bulk()
+    assert submit_form().startswith('Form submitted successfully!')
+
+
+# Same steps with full and lean rendering on the page with images and animations, the page load and the waits on
+# sections that animate in are compared as <mode>_open_login_page, <mode>_login and <mode>_open_item_list
+@pytest.mark.parametrize('mode', [pytest.param(mode, marks=pytest.mark.rendering(mode)) for mode in ('full', 'lean')])
+@pytest.mark.benchmark
+def test_benchmark_rendering(web_driver, app_url, rendering, mode):
+    dashboard = login(web_driver, app_url, 'decorated', prefix=mode)
+    item_list = ItemList(web_driver)
+    images = web_driver.execute_script(
+        "return Array.from(document.querySelectorAll('#stress-assets img')).filter(img => img.naturalWidth).length")
+    print(f"{mode} rendering ({rendering} applied): {images} images loaded")
+
+    @print_timing(web_driver, f'{mode}_open_item_list')
+    def open_item_list():
+        dashboard.click_go_to_item_list()
+        item_list.is_page_loaded()
+
+    open_item_list()
+
+
+def item_scenario(driver, app_url, name):
+    """Log in, add an item, read the list back and log out with the blocking page objects"""
+    login_page, dashboard, item_list = LoginPage(driver), Dashboard(driver), ItemList(driver)
+    login_page.go_to_url(app_url)
+    login_page.fill_username(TEST_ENV.username)
+    login_page.fill_password(TEST_ENV.password)
+    login_page.click_login_button()
+    dashboard.click_go_to_item_list()
+    item_list.fill_item_input(name)
+    item_list.click_add_item()
+    assert name in item_list.get_item_names()
+    item_list.click_go_back_to_dashboard()
+    dashboard.click_logout()
+
+
+async def async_item_scenario(driver, app_url, name):
+    """item_scenario with the asyncio page objects"""
+    login_page, dashboard, item_list = AsyncLoginPage(driver), AsyncDashboard(driver), AsyncItemList(driver)
+    await login_page.go_to_url(app_url)
+    await login_page.fill_username(TEST_ENV.username)
+    await login_page.fill_password(TEST_ENV.password)
+    await login_page.click_login_button()
+    await dashboard.click_go_to_item_list()
+    await item_list.fill_item_input(name)
+    await item_list.click_add_item()
+    assert name in await item_list.get_item_names()
+    await item_list.click_go_back_to_dashboard()
+    await dashboard.click_logout()
+
+
+def run_threads(browser, download_dir, app_url, sessions):
+    """One thread and one blocking driver per session"""
+    def session(index):
+        driver = create_driver(browser, download_dir)
+        try:
+            for run in range(SCENARIO_RUNS):
+                item_scenario(driver, app_url, f'session {index} run {run}')
+        finally:
+            driver.quit()
+
+    with ThreadPoolExecutor(max_workers=sessions) as executor:
+        for future in [executor.submit(session, index) for index in range(sessions)]:
+            future.result()
+
+
+def run_asyncio(browser, download_dir, app_url, sessions):
+    """Every session on one event loop"""
+    async def session(index):
+        driver = await create_async_driver(browser, download_dir)
+        try:
+            for run in range(SCENARIO_RUNS):
+                await async_item_scenario(driver, app_url, f'session {index} run {run}')
+        finally:
+            await driver.quit()
+
+    async def all_sessions():
+        await asyncio.gather(*[session(index) for index in range(sessions)])
+
+    asyncio.run(all_sessions())
+
+
+# Same scenario on N browsers, driven by N threads or by one event loop. The wall time lands in the interaction
+# timings as <mode>_<N>_sessions; throughput, peak Python memory and thread count are printed
+@pytest.mark.parametrize('sessions', CONCURRENT_SESSIONS)
+@pytest.mark.parametrize('mode', ['threads', 'asyncio'])
+@pytest.mark.benchmark
+def test_benchmark_concurrency(pytestconfig, create_temp_dir, app_url, mode, sessions):
+    runner = run_threads if mode == 'threads' else run_asyncio
+    peak_threads = threading.active_count()
+    sampling = threading.Event()
+
+    def sample_threads():
+        nonlocal peak_threads
+        while not sampling.wait(0.05):
+            peak_threads = max(peak_threads, threading.active_count())
+
+    sampler = threading.Thread(target=sample_threads, daemon=True)
+    tracemalloc.start()
+    sampler.start()
+    start = time.time()
+    error_msg = 'Success'
+    try:
+        runner(pytestconfig.getoption("--driver"), create_temp_dir, app_url, sessions)
+    except Exception as e:
+        error_msg = f"Failed measure: {mode}_{sessions}_sessions - {type(e).__name__}"
+        raise
+    finally:
+        elapsed = time.time() - start
+        sampling.set()
+        sampler.join()
+        _, peak_memory = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        metrics.get_sink().emit({'timestamp': round(time.time() * 1000), 'timing': str(int(elapsed * 1000)),
+                                 'interaction': f'{mode}_{sessions}_sessions', 'error_msg': error_msg,
+                                 'success': error_msg == 'Success'})
+        print(f"{mode}: {sessions} sessions, {sessions * SCENARIO_RUNS / elapsed:.2f} scenarios/s, "
+              f"peak Python memory {peak_memory / 1024 / 1024:.1f} MiB, peak threads {peak_threads - 1}")
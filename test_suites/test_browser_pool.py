@@ -0,0 +1,109 @@
+import threading
+
+import pytest
+from urllib3.exceptions import MaxRetryError
+
+from test_util.browser_pool import BrowserPool
+
+
+class FakeDriver:
+    """The part of a WebDriver used by BrowserPool, optionally failing like a crashed driver server"""
+
+    def __init__(self, error=None):
+        self.error = error
+        self.quit_count = 0
+        self.urls = []
+
+    @property
+    def window_handles(self):
+        if self.error is not None:
+            raise self.error
+        return ['main']
+
+    def execute_script(self, script):
+        pass
+
+    def delete_all_cookies(self):
+        pass
+
+    def get(self, url):
+        self.urls.append(url)
+
+    def quit(self):
+        self.quit_count += 1
+        if self.error is not None:
+            raise self.error
+
+
+def test_release_resets_and_reuses_the_driver():
+    pool = BrowserPool(FakeDriver)
+
+    first = pool.acquire()
+    pool.release(first)
+    second = pool.acquire()
+
+    assert second is first
+    assert first.driver.urls == ['about:blank']
+    assert pool.stats()['launches'] == 1
+
+
+def test_release_recycles_a_crashed_driver():
+    pool = BrowserPool(FakeDriver)
+    slot = pool.acquire()
+    # Commands sent to a closed chromedriver port fail in urllib3, not with a WebDriverException
+    slot.driver.error = MaxRetryError(None, 'http://localhost:1/session/1/window/handles')
+
+    pool.release(slot)
+
+    # The slot is freed, the next lease launches a new driver
+    assert slot.driver.quit_count == 1
+    assert pool.stats()['recycled'] == 1
+    assert pool.acquire(timeout=1) is not slot
+    assert pool.stats()['launches'] == 2
+
+
+def test_release_recycles_after_max_uses():
+    pool = BrowserPool(FakeDriver, max_uses=2)
+
+    first = pool.acquire()
+    pool.release(first)
+    assert pool.acquire() is first
+    pool.release(first)
+
+    assert first.driver.quit_count == 1
+    assert pool.acquire() is not first
+    assert pool.stats()['recycled'] == 1
+
+
+def test_acquire_times_out_when_every_driver_is_leased():
+    pool = BrowserPool(FakeDriver, size=1)
+    pool.acquire()
+
+    with pytest.raises(TimeoutError):
+        pool.acquire(timeout=0.05)
+
+
+def test_acquire_waits_for_a_released_driver():
+    pool = BrowserPool(FakeDriver, size=1)
+    slot = pool.acquire()
+    timer = threading.Timer(0.05, pool.release, args=(slot,))
+    timer.start()
+
+    assert pool.acquire(timeout=5) is slot
+    timer.join()
+
+
+def test_failed_launch_frees_its_slot():
+    launches = []
+
+    def factory():
+        launches.append(1)
+        if len(launches) == 1:
+            raise RuntimeError('browser did not start')
+        return FakeDriver()
+
+    pool = BrowserPool(factory, size=1)
+    with pytest.raises(RuntimeError):
+        pool.acquire()
+
+    assert pool.acquire(timeout=1).driver is not None
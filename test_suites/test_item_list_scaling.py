@@ -0,0 +1,69 @@
+import pytest
+
+from pages.local_app import LoginPage, Dashboard, ItemList
+from test_suites.conftest import print_timing
+from test_util.command_counter import COMMANDS
+from test_util.config import TEST_ENV
+
+# Items are created by the page's own createItemElement() so they behave like the ones a user adds
+SEED_ITEMS_JS = "seedItems(arguments[0]);"
+
+# Commands of a click on a located element: find, displayed and enabled checks, click, and one extra wait poll
+MAX_CLICK_ROUND_TRIPS = 5
+
+
+def measure(web_driver, interaction, operation, *args):
+    """Time an operation with print_timing and return its result with the number of WebDriver commands it sent"""
+    @print_timing(web_driver, interaction)
+    def counted():
+        before = COMMANDS.current().count
+        result = operation(*args)
+        return result, COMMANDS.current().count - before
+    return counted()
+
+
+# Run with -m scaling, the timings of every size are printed in the interaction timings summary
+@pytest.mark.parametrize('item_count', [1000, 10000, 100000])
+@pytest.mark.scaling
+def test_item_list_bulk_read_scaling(web_driver, app_url, item_count):
+    # Initialize page objects
+    login_page = LoginPage(web_driver)
+    dashboard = Dashboard(web_driver)
+    item_list = ItemList(web_driver)
+    last_item = f'item {item_count - 1}'
+
+    # Log in and open the item list
+    login_page.go_to_url(app_url)
+    login_page.fill_username(TEST_ENV.username)
+    login_page.fill_password(TEST_ENV.password)
+    login_page.click_login_button()
+    dashboard.is_page_loaded()
+    dashboard.click_go_to_item_list()
+    item_list.is_page_loaded()
+
+    # Seed the list in a single script call
+    web_driver.execute_script(SEED_ITEMS_JS, item_count)
+
+    # Read every item in one round-trip, whatever the size of the list
+    snapshot, round_trips = measure(web_driver, f'items_{item_count}_snapshot', item_list.get_items_snapshot)
+    assert round_trips == 1
+    assert len(snapshot) == item_count
+    assert snapshot.find(last_item)['index'] == item_count - 1
+    assert not any(snapshot.column('editing'))
+
+    # Locate the last item by its position in the snapshot instead of scanning the item texts
+    _, round_trips = measure(web_driver, f'items_{item_count}_edit_by_snapshot',
+                             item_list.click_edit_by_item_name, last_item, snapshot)
+    assert round_trips <= MAX_CLICK_ROUND_TRIPS
+    item_list.click_save()
+
+    # The same click located by text, for comparison in the timings summary
+    measure(web_driver, f'items_{item_count}_edit_by_text', item_list.click_edit_by_item_name, last_item)
+    item_list.click_save()
+
+    # Delete the last item with a fresh snapshot
+    snapshot, _ = measure(web_driver, f'items_{item_count}_snapshot', item_list.get_items_snapshot)
+    _, round_trips = measure(web_driver, f'items_{item_count}_delete_by_snapshot',
+                             item_list.click_delete_by_item_name, last_item, snapshot)
+    assert round_trips <= MAX_CLICK_ROUND_TRIPS
+    assert len(item_list.get_item_names()) == item_count - 1
@@ -1,9 +1,9 @@
+import hashlib
+
 import pytest
-import pandas as pd
 
-from pages.local_app import LoginPage, Dashboard, ItemList, Form
-from test_suites.conftest import path
-from test_util.config import TEST_ENV
+from pages.local_app import LoginPage, ItemList, Form
+from test_util.downloads import verify_download
 
 
 # Test invalid login with multiple incorrect credential combinations
@@ -12,12 +12,12 @@ from test_util.config import TEST_ENV
     ('invalid_username', 'password123')
 ])
 @pytest.mark.login_test
-def test_invalid_login(web_driver, username, password):
+def test_invalid_login(web_driver, app_url, username, password):
     # Initialize the LoginPage object
     login_page = LoginPage(web_driver)
 
     # Open the login page URL
-    login_page.go_to_url(f'{path}/../test_site/index.html')
+    login_page.go_to_url(app_url)
 
     # Fill in the username and password fields with invalid credentials
     login_page.fill_username(username)
@@ -31,27 +31,15 @@ def test_invalid_login(web_driver, username, password):
 
 
 @pytest.mark.item_test
-def test_add_edit_delete_item(web_driver):
-    # Initialize page objects
-    login_page = LoginPage(web_driver)
-    dashboard = Dashboard(web_driver)
+def test_add_edit_delete_item(web_driver, logged_in):
+    # Initialize page objects, logged_in opens the dashboard
+    dashboard = logged_in
     item_list = ItemList(web_driver)
 
     # Define the variables for the test
     item_name = 'test item'
     updated_item_name = 'updated test item'
 
-    # Navigate to the login page
-    login_page.go_to_url(f'{path}/../test_site/index.html')
-
-    # Perform login with valid credentials
-    login_page.fill_username(TEST_ENV.username)
-    login_page.fill_password(TEST_ENV.password)
-    login_page.click_login_button()
-
-    # Verify dashboard is loaded
-    dashboard.is_page_loaded()
-
     # Navigate to the item list page
     dashboard.click_go_to_item_list()
 
@@ -81,32 +69,22 @@ def test_add_edit_delete_item(web_driver):
     dashboard.click_logout()
 
 
+# fields: one page-object call per field, bulk: every field in a single script execution
+@pytest.mark.parametrize('fill', ['fields', 'bulk'])
 @pytest.mark.form_test
-def test_fill_submit_form(web_driver, form_test):
-    # Initialize page objects
-    login_page = LoginPage(web_driver)
-    dashboard = Dashboard(web_driver)
+def test_fill_submit_form(web_driver, logged_in, form_test, fill):
+    # Initialize page objects, logged_in opens the dashboard
+    dashboard = logged_in
     form = Form(web_driver)
 
     # Define the variables for the test
-    timestamp = pd.Timestamp(form_test['date'])
+    timestamp = form_test['date']
     expected_message = f"Form submitted successfully! " \
                        f"Text: {form_test['text_input']}, " \
                        f"Option: {form_test['selected_dropdown']}, " \
                        f"Date: {timestamp.strftime('%Y-%m-%d')}, " \
                        f"Choice: {form_test['select_radio']}, Agreed: true"
 
-    # Navigate to the login page
-    login_page.go_to_url(f'{path}/../test_site/index.html')
-
-    # Perform login with valid credentials
-    login_page.fill_username(TEST_ENV.username)
-    login_page.fill_password(TEST_ENV.password)
-    login_page.click_login_button()
-
-    # Verify dashboard is loaded
-    dashboard.is_page_loaded()
-
     # Navigate to the form page
     dashboard.click_go_to_form_page()
 
@@ -114,13 +92,42 @@ def test_fill_submit_form(web_driver, form_test):
     form.is_page_loaded()
 
     # Fill out and submit the form
-    form.fill_text_input(form_test['text_input'])
-    form.select_dropdown_option(form_test['selected_dropdown'])
-    form.fill_date(timestamp.strftime('%m/%d/%Y'))  # Supported format by the page mm/dd/yyyy
-    form.select_radio_option(form_test['select_radio'])
-    form.check_agree_checkbox()
+    if fill == 'bulk':
+        form.fill_form(form_test['text_input'], form_test['selected_dropdown'], timestamp,
+                       form_test['select_radio'])
+    else:
+        form.fill_text_input(form_test['text_input'])
+        form.select_dropdown_option(form_test['selected_dropdown'])
+        form.fill_date(timestamp.strftime('%m/%d/%Y'))  # Supported format by the page mm/dd/yyyy
+        form.select_radio_option(form_test['select_radio'])
+        form.check_agree_checkbox()
     form.submit_form()
 
     # Verify form message
     assert form.get_form_message() == expected_message
 
+
+@pytest.mark.item_test
+def test_export_items(web_driver, logged_in, downloads):
+    # Initialize page objects, logged_in opens the dashboard
+    dashboard = logged_in
+    item_list = ItemList(web_driver)
+
+    # Define the variables for the test
+    item_names = ['first export item', 'second export item']
+    expected_csv = 'name\n' + ''.join(f'"{name}"\n' for name in item_names)
+
+    # Navigate to the item list page and add the items
+    dashboard.click_go_to_item_list()
+    item_list.is_page_loaded()
+    for name in item_names:
+        item_list.fill_item_input(name)
+        item_list.click_add_item()
+
+    # Export the items and wait for the download to complete
+    item_list.click_export_items()
+    exported = downloads.wait('items*.csv', timeout=10)
+
+    # Verify the size and content of the downloaded file
+    verify_download(exported, size=len(expected_csv.encode()),
+                    digest=hashlib.sha256(expected_csv.encode()).hexdigest())
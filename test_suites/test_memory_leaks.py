@@ -0,0 +1,34 @@
+import pytest
+
+from pages.local_app import ItemList
+
+
+# Run with -m leak. Every iteration adds, edits and deletes an item, which creates the closures and DOM nodes of
+# createItemElement() on the page; after it the page should be back where it started
+@pytest.mark.leak
+def test_item_list_cycle_does_not_leak(web_driver, logged_in, leak_check):
+    # Initialize page objects, logged_in opens the dashboard
+    dashboard = logged_in
+    item_list = ItemList(web_driver)
+
+    # Navigate to the item list page
+    dashboard.click_go_to_item_list()
+    item_list.is_page_loaded()
+
+    def add_edit_delete(iteration):
+        item_name = f'leak item {iteration}'
+        item_list.fill_item_input(item_name)
+        item_list.click_add_item()
+        item_list.click_edit_by_item_name(item_name)
+        item_list.clear_item_edit_input()
+        item_list.fill_item_edit_input(f'{item_name} updated')
+        item_list.click_save()
+        item_list.click_delete_by_item_name(f'{item_name} updated')
+
+    # Repeat the cycle, sampling the heap, DOM nodes and listeners after each run
+    leak_check.run(add_edit_delete)
+    print('\n'.join(leak_check.format()))
+
+    # Verify that no metric grows steadily with the iterations
+    assert not leak_check.problems(), '\n'.join(leak_check.problems())
+    assert len(item_list.get_item_lists()) == 0, 'List is not empty'
@@ -0,0 +1,73 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from test_util.perf_history import Analysis, PerfHistory, compare, format_regressions, mann_whitney_greater
+
+
+@pytest.mark.parametrize('current, baseline, p_value', [
+    # Example of the scipy.stats.mannwhitneyu documentation: two-sided p 0.11134688653314041, halved
+    ([19, 22, 16, 29, 24], [20, 11, 17, 12], 0.05567344326657024),
+    # No overlap: U = 25, z = 12 / sqrt(25 * 11 / 12)
+    ([6, 7, 8, 9, 10], [1, 2, 3, 4, 5], 0.006092890177672409),
+    ([1, 2, 3, 4, 5], [6, 7, 8, 9, 10], 0.9966923245172357),
+    # Ties: U = 29, tie term 4^3 - 4 + 3^3 - 3 + 2^3 - 2 = 90, variance 3 * (13 - 90 / 132)
+    ([3, 3, 4, 5, 5, 6], [1, 2, 3, 3, 4, 4], 0.042061328301191254),
+])
+def test_mann_whitney_greater(current, baseline, p_value):
+    assert mann_whitney_greater(current, baseline) == pytest.approx(p_value, rel=1e-9)
+
+
+def test_mann_whitney_greater_all_equal():
+    # Every value tied, the variance is 0 and nothing can be concluded
+    assert mann_whitney_greater([5] * 6, [5] * 6) == 1.0
+
+
+def test_compare_flags_a_slower_run():
+    baseline = [100, 102, 98, 101, 99, 100, 103, 97]
+    current = [120, 118, 125, 121, 119, 122, 124, 117]
+
+    row = compare(current, baseline)
+
+    assert row['regression']
+    assert row['p_value'] < 0.01
+    assert row['change'] == pytest.approx(121 / 100 - 1, abs=0.01)
+
+
+def test_compare_does_not_flag_a_faster_or_equal_run():
+    baseline = [100, 102, 98, 101, 99, 100, 103, 97]
+
+    assert not compare([80, 81, 79, 82, 78, 80], baseline)['regression']
+    assert not compare([100] * 8, [100] * 8)['regression']
+
+
+def test_compare_needs_enough_samples():
+    row = compare([200, 210, 205], [100, 101, 99, 100, 102])
+
+    # The medians are reported, the p-value needs MIN_SAMPLES on both sides
+    assert row['current_p50'] == 205 and row['baseline_p50'] == 100
+    assert row['p_value'] is None and not row['regression']
+
+
+def test_compare_single_test_duration():
+    baseline = [1000, 1040, 980, 1010, 1020]
+
+    # One duration per run: flagged above the baseline p95 plus MIN_SLOWDOWN, not within it
+    assert compare([1300], baseline)['regression']
+    assert not compare([1060], baseline)['regression']
+    assert not compare([1300], baseline[:2])['regression']
+
+
+def test_analysis_flags_a_slowed_test(tmp_path):
+    history = PerfHistory(tmp_path / 'history.sqlite')
+    started = datetime(2025, 6, 1)
+    for run, ms in enumerate([1000, 1040, 980, 1010, 1020, 1500]):
+        tests = {'test_a.py::test_slow': (ms, 'passed'), 'test_a.py::test_steady': (500, 'passed')}
+        history.record_run('chrome', tests, {'login': [100 + run % 3] * 10}, commit=f'c{run}',
+                           started=started + timedelta(days=run))
+
+    regressions = Analysis(history).regressions()
+    history.close()
+
+    assert [(kind, name) for kind, name, _ in regressions] == [('test', 'test_a.py::test_slow')]
+    assert format_regressions(regressions)[0].endswith('> p95 1036')
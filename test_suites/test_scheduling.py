@@ -0,0 +1,93 @@
+from types import SimpleNamespace
+
+import pytest
+
+from test_util.scheduling import DEFAULT_ESTIMATE, DurationStore, balanced_shards
+
+
+class FakeCache:
+    """The get/set part of the pytest cache used by DurationStore"""
+
+    def __init__(self, values=None):
+        self.values = dict(values or {})
+
+    def get(self, key, default):
+        return self.values.get(key, default)
+
+    def set(self, key, value):
+        self.values[key] = value
+
+
+def items(durations):
+    return [SimpleNamespace(nodeid=nodeid) for nodeid in durations]
+
+
+@pytest.mark.parametrize('count', [1, 2, 3, 4])
+def test_balanced_shards_cover_every_item_once(count):
+    durations = {f'test_a.py::test_{index}': seconds for index, seconds in enumerate([8, 7, 6, 5, 4, 3, 2, 1, 1])}
+    collected = items(durations)
+
+    shards = balanced_shards(collected, count, durations.get)
+
+    # Every item is in exactly one shard, in collection order, and the totals add up
+    assert len(shards) == count
+    selected = [item.nodeid for _, shard in shards for item in shard]
+    assert sorted(selected) == sorted(durations)
+    for total, shard in shards:
+        assert [item.nodeid for item in shard] == [item.nodeid for item in collected if item in shard]
+        assert total == sum(durations[item.nodeid] for item in shard)
+
+
+@pytest.mark.parametrize('seconds, count', [([5, 5, 4, 4, 3, 3], 3), ([8, 7, 6, 5, 4, 3, 2, 1], 3),
+                                             ([30, 1, 1, 1, 1, 1], 2), ([2.5, 1.5, 1.0, 0.5] * 10, 4)])
+def test_balanced_shards_totals_are_balanced(seconds, count):
+    durations = {f'test_a.py::test_{index}': value for index, value in enumerate(seconds)}
+
+    totals = [total for total, _ in balanced_shards(items(durations), count, durations.get)]
+
+    # Each test goes to the shard with the smallest total, so no shard ends more than one test above another
+    assert sum(totals) == pytest.approx(sum(seconds))
+    assert max(totals) - min(totals) <= max(seconds)
+
+
+def test_balanced_shards_even_split():
+    durations = {f'test_a.py::test_{index}': value for index, value in enumerate([5, 5, 4, 4, 3, 3])}
+
+    assert [total for total, _ in balanced_shards(items(durations), 3, durations.get)] == [8, 8, 8]
+
+
+def test_balanced_shards_keep_empty_shards():
+    durations = {'test_a.py::test_1': 3}
+
+    shards = balanced_shards(items(durations), 3, durations.get)
+
+    assert [len(shard) for _, shard in shards] == [1, 0, 0]
+
+
+def test_estimate_falls_back_to_the_medians_of_the_known_tests():
+    store = DurationStore(FakeCache({'scheduling/durations': {
+        'test_a.py::test_x[1]': 2.0, 'test_a.py::test_x[2]': 4.0, 'test_a.py::test_y': 10.0,
+        'test_b.py::test_z': 30.0}}))
+
+    # Known test, new parameter of a known function, new test of a known module, new module
+    assert store.estimate('test_a.py::test_y') == 10.0
+    assert store.estimate('test_a.py::test_x[3]') == 3.0
+    assert store.estimate('test_a.py::test_new') == 4.0
+    assert store.estimate('test_c.py::test_q') == 7.0
+
+
+def test_estimate_without_history():
+    assert DurationStore(FakeCache()).estimate('test_a.py::test_x') == DEFAULT_ESTIMATE
+
+
+def test_save_smooths_the_stored_durations():
+    cache = FakeCache({'scheduling/durations': {'test_a.py::test_x': 2.0}})
+    store = DurationStore(cache)
+
+    # setup and call of test_x, then a test without history
+    store.add('test_a.py::test_x', 1.0)
+    store.add('test_a.py::test_x', 5.0)
+    store.add('test_a.py::test_new', 3.0)
+    store.save()
+
+    assert cache.values['scheduling/durations'] == {'test_a.py::test_x': 4.0, 'test_a.py::test_new': 3.0}
@@ -0,0 +1,26 @@
+import pytest
+from selenium.webdriver.common.by import By
+
+from pages.local_app import ItemList
+
+
+# Run with -m visual --visual-baselines <dir>. The first run records the baselines, later runs fail when a page
+# differs from them and write the screenshot and a diff image to results/visual_diffs
+@pytest.mark.visual
+def test_item_list_visual(web_driver, logged_in, visual):
+    # Initialize page objects, logged_in opens the dashboard
+    dashboard = logged_in
+    item_list = ItemList(web_driver)
+
+    # Compare the dashboard
+    dashboard.is_page_loaded()
+    visual.check('dashboard')
+
+    # Navigate to the item list page and add an item
+    dashboard.click_go_to_item_list()
+    item_list.is_page_loaded()
+    item_list.fill_item_input('visual item')
+    item_list.click_add_item()
+
+    # Compare the item list, the caret of the focused input blinks and is left out
+    visual.check('item_list', masks=[(By.ID, 'item-input')])
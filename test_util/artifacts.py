@@ -0,0 +1,203 @@
+"""
+Failure artifacts written in the background.
+
+The test thread only grabs the screenshot, the DOM and the browser console log from the driver, everything else
+(directories, image conversion, disk writes) happens on a writer thread fed through a bounded queue. When the queue
+is full the artifact is dropped rather than blocking the next test, and no more artifacts are captured once the
+per-run cap is reached, so an outage failing every test costs a few round-trips per test at most.
+
+JPEG or WebP conversion and downscaling need Pillow (see requirements.txt), without it screenshots are written as
+PNG at their full size.
+"""
+import importlib.util
+import io
+import itertools
+import json
+import queue
+import re
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+
+from selenium.common.exceptions import WebDriverException
+
+from test_util.browser_pool import worker_id
+
+IMAGE_FORMATS = ('png', 'jpeg', 'webp')
+QUEUE_SIZE = 16
+_UNSAFE_CHARACTERS = re.compile(r'[^\w.-]+')
+
+
+def safe_name(test_name, max_length=100):
+    """Turn a test name such as test_login[user/pass] into a file name"""
+    return _UNSAFE_CHARACTERS.sub('_', test_name).strip('_')[:max_length] or 'test'
+
+
+def pillow_available():
+    """Whether Pillow can be imported, checked without importing it"""
+    return importlib.util.find_spec('PIL') is not None
+
+
+def convert_image(png, image_format='png', max_width=0, quality=80):
+    """
+    Downscale and convert a PNG screenshot. Returns (bytes, extension), the PNG itself when Pillow is missing.
+
+    :param png: screenshot as returned by get_screenshot_as_png
+    :param image_format: png, jpeg or webp
+    :param max_width: width in pixels the image is downscaled to, 0 keeps the size
+    :param quality: jpeg and webp quality
+    """
+    if image_format == 'png' and not max_width:
+        return png, 'png'
+    try:
+        from PIL import Image
+    except ImportError:
+        return png, 'png'
+
+    image = Image.open(io.BytesIO(png))
+    if max_width and image.width > max_width:
+        image = image.resize((max_width, round(image.height * max_width / image.width)))
+    if image_format == 'jpeg':
+        image = image.convert('RGB')
+    output = io.BytesIO()
+    options = {'optimize': True} if image_format == 'png' else {'quality': quality}
+    image.save(output, format=image_format.upper(), **options)
+    return output.getvalue(), 'jpg' if image_format == 'jpeg' else image_format
+
+
+class ArtifactWriter:
+    """Capture failure artifacts from a driver and write them to disk on a background thread"""
+
+    def __init__(self, directory, max_artifacts=50, image_format='png', max_width=0, quality=80,
+                 queue_size=QUEUE_SIZE):
+        """
+        :param directory: directory the artifacts are written to, created on the first write
+        :param max_artifacts: number of failures captured by this process, 0 for no limit
+        :param image_format: png, jpeg or webp
+        :param max_width: width in pixels screenshots are downscaled to, 0 keeps the size
+        :param quality: jpeg and webp quality
+        :param queue_size: artifacts waiting to be written before new ones are dropped
+        """
+        if image_format not in IMAGE_FORMATS:
+            raise ValueError(f'Unsupported image format: {image_format}')
+        self.directory = Path(directory)
+        self.max_artifacts = max_artifacts
+        self.image_format = image_format
+        self.max_width = max_width
+        self.quality = quality
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._sequence = itertools.count(1)
+        self._thread = None
+        self._lock = threading.Lock()
+
+        # Statistics printed in the terminal summary
+        self.captured = 0
+        self.written = 0
+        self.dropped = 0
+        self.skipped = 0
+        self.errors = 0
+        self.last_error = None
+        self.bytes_written = 0
+        self.capture_time = 0.0
+
+    def capture(self, driver, test_name):
+        """
+        Grab the screenshot, DOM and console log of a failed test and queue them for writing.
+        Returns the base path of the artifact files, or None when the artifact was skipped or dropped.
+        """
+        with self._lock:
+            if self.max_artifacts and self.captured >= self.max_artifacts:
+                self.skipped += 1
+                return None
+            sequence = next(self._sequence)
+
+        start = time.perf_counter()
+        # Worker id, sequence and microseconds keep names unique across xdist workers and fast failures
+        base_name = f"{datetime.now().strftime('%H%M%S_%f')}_{worker_id()}_{sequence:04d}_{safe_name(test_name)}"
+        artifact = {'name': base_name, 'test': test_name, 'url': None, 'screenshot': None, 'dom': None,
+                    'console': None}
+        for key, grab in (('url', lambda: driver.current_url),
+                          ('screenshot', driver.get_screenshot_as_png),
+                          ('dom', lambda: driver.page_source),
+                          ('console', lambda: driver.get_log('browser'))):
+            try:
+                artifact[key] = grab()
+            except (WebDriverException, AttributeError, ValueError):
+                # A dead session or a browser without console log support, keep what could be captured
+                pass
+        elapsed = time.perf_counter() - start
+
+        self._start()
+        try:
+            self._queue.put_nowait(artifact)
+        except queue.Full:
+            with self._lock:
+                self.dropped += 1
+            return None
+        with self._lock:
+            self.captured += 1
+            self.capture_time += elapsed
+        return self.directory / base_name
+
+    def close(self, timeout=30):
+        """Wait for the queued artifacts to be written and stop the writer thread"""
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join(timeout)
+            self._thread = None
+
+    def stats(self):
+        """Capture and write counters of this process"""
+        with self._lock:
+            return {'worker': worker_id(), 'captured': self.captured, 'written': self.written,
+                    'dropped': self.dropped, 'skipped': self.skipped, 'errors': self.errors,
+                    'last_error': self.last_error,
+                    'bytes_written': self.bytes_written, 'capture_time': self.capture_time}
+
+    def _start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='artifact-writer', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            artifact = self._queue.get()
+            if artifact is None:
+                return
+            try:
+                size = self._write(artifact)
+            except Exception as e:
+                with self._lock:
+                    self.errors += 1
+                    self.last_error = f"{artifact['test']}: {type(e).__name__}: {e}"
+            else:
+                with self._lock:
+                    self.written += 1
+                    self.bytes_written += size
+
+    def _write(self, artifact):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        base = self.directory / artifact['name']
+        size = 0
+        if artifact['screenshot'] is not None:
+            image, extension = convert_image(artifact['screenshot'], self.image_format, self.max_width,
+                                             self.quality)
+            size += base.with_name(f'{base.name}.{extension}').write_bytes(image)
+        if artifact['dom'] is not None:
+            size += base.with_name(f'{base.name}.html').write_bytes(artifact['dom'].encode())
+        metadata = {'test': artifact['test'], 'url': artifact['url'], 'console': artifact['console']}
+        size += base.with_name(f'{base.name}.json').write_bytes(json.dumps(metadata, indent=2, default=str).encode())
+        return size
+
+
+def format_stats(stats):
+    """Format the artifact statistics of one process for the terminal summary"""
+    mean_capture = stats['capture_time'] / stats['captured'] if stats['captured'] else 0
+    line = (f"{stats['worker']}: captured={stats['captured']} written={stats['written']} "
+            f"dropped={stats['dropped']} skipped={stats['skipped']} errors={stats['errors']} "
+            f"size={stats['bytes_written'] / 1024:.0f}KiB capture={mean_capture * 1000:.0f}ms/test")
+    if stats.get('last_error'):
+        line += f" last error: {stats['last_error']}"
+    return line
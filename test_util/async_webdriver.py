@@ -0,0 +1,297 @@
+"""
+Minimal asyncio WebDriver client.
+
+Speaks the W3C WebDriver protocol to chromedriver or geckodriver over one keep-alive HTTP connection per session,
+with asyncio streams. Every command is awaitable, so one event loop can drive dozens of browser sessions and
+interleave their waits instead of parking a thread per browser on a blocking HTTP call. Only the commands used by
+pages/async_base_page.py are implemented; errors are raised as the usual selenium exceptions.
+"""
+import asyncio
+import json
+import time
+from urllib.parse import urlsplit
+
+from selenium.common.exceptions import ElementClickInterceptedException, ElementNotInteractableException, \
+    InvalidSelectorException, JavascriptException, NoSuchElementException, NoSuchWindowException, \
+    StaleElementReferenceException, TimeoutException, WebDriverException
+from selenium.webdriver.common.by import By
+
+from test_util.driver_factory import browser_options, record_launch, start_service
+
+# Key of the element references in the W3C protocol
+ELEMENT_KEY = 'element-6066-11e4-a52e-4f735466cecf'
+
+ERRORS = {
+    'no such element': NoSuchElementException,
+    'stale element reference': StaleElementReferenceException,
+    'javascript error': JavascriptException,
+    'script timeout': TimeoutException,
+    'timeout': TimeoutException,
+    'element not interactable': ElementNotInteractableException,
+    'element click intercepted': ElementClickInterceptedException,
+    'invalid selector': InvalidSelectorException,
+    'no such window': NoSuchWindowException,
+}
+
+
+def w3c_locator(by, value):
+    """Translate the selenium strategies the W3C protocol lacks into CSS, like selenium does"""
+    if by == By.ID:
+        return 'css selector', f'[id="{value}"]'
+    if by == By.NAME:
+        return 'css selector', f'[name="{value}"]'
+    if by == By.CLASS_NAME:
+        return 'css selector', f'.{value}'
+    return by, value
+
+
+class HttpConnection:
+    """One keep-alive HTTP/1.1 connection sending JSON requests one at a time"""
+
+    def __init__(self, url):
+        parts = urlsplit(url)
+        self.host = parts.hostname
+        self.port = parts.port or 80
+        self.prefix = parts.path.rstrip('/')
+        self._reader = None
+        self._writer = None
+        self._lock = asyncio.Lock()
+
+    async def request(self, method, path, payload=None):
+        """Send a request and return the status and the decoded JSON body"""
+        body = b'' if payload is None else json.dumps(payload).encode()
+        head = (f'{method} {self.prefix}{path} HTTP/1.1\r\nHost: {self.host}:{self.port}\r\n'
+                f'Content-Type: application/json; charset=utf-8\r\nContent-Length: {len(body)}\r\n'
+                f'Connection: keep-alive\r\n\r\n').encode()
+        async with self._lock:
+            try:
+                reused = self._writer is not None
+                if not reused:
+                    self._reader, self._writer = await asyncio.open_connection(self.host, self.port)
+                self._writer.write(head + body)
+                await self._writer.drain()
+                status_line = await self._reader.readline()
+                if not status_line and reused:
+                    # The server closed the idle connection before reading the request, send it again on a new one
+                    self.close()
+                    self._reader, self._writer = await asyncio.open_connection(self.host, self.port)
+                    self._writer.write(head + body)
+                    await self._writer.drain()
+                    status_line = await self._reader.readline()
+                if not status_line:
+                    self.close()
+                    raise ConnectionResetError(f'{self.host}:{self.port} closed the connection')
+                return await self._read_response(status_line)
+            except BaseException:
+                # A cancelled or broken exchange leaves its response unread on the connection, the next request
+                # would read it as its own. Start over on a new connection
+                self.close()
+                raise
+
+    async def _read_response(self, status_line):
+        status = int(status_line.split()[1])
+        headers = {}
+        while True:
+            line = await self._reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+        if 'content-length' in headers:
+            body = await self._reader.readexactly(int(headers['content-length']))
+        elif headers.get('transfer-encoding', '').lower() == 'chunked':
+            chunks = []
+            while True:
+                size = int((await self._reader.readline()).split(b';')[0], 16)
+                chunks.append(await self._reader.readexactly(size + 2))
+                if not size:
+                    break
+            body = b''.join(chunk[:-2] for chunk in chunks)
+        else:
+            body = await self._reader.read()
+            headers['connection'] = 'close'
+        if headers.get('connection', '').lower() == 'close':
+            self.close()
+        return status, json.loads(body) if body else {}
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+            self._reader = self._writer = None
+
+
+class AsyncWebElement:
+    """Element reference of an AsyncWebDriver session"""
+
+    def __init__(self, driver, element_id):
+        self.driver = driver
+        self.id = element_id
+
+    def __eq__(self, other):
+        return isinstance(other, AsyncWebElement) and other.id == self.id
+
+    def __hash__(self):
+        return hash(self.id)
+
+    def __repr__(self):
+        return f'AsyncWebElement({self.id!r})'
+
+    async def _execute(self, method, command, payload=None):
+        return await self.driver.execute(method, f'/element/{self.id}{command}', payload)
+
+    async def click(self):
+        await self._execute('POST', '/click', {})
+
+    async def clear(self):
+        await self._execute('POST', '/clear', {})
+
+    async def send_keys(self, text):
+        text = str(text)
+        await self._execute('POST', '/value', {'text': text, 'value': list(text)})
+
+    async def text(self):
+        return await self._execute('GET', '/text')
+
+    async def is_displayed(self):
+        return await self._execute('GET', '/displayed')
+
+    async def is_enabled(self):
+        return await self._execute('GET', '/enabled')
+
+    async def get_property(self, name):
+        return await self._execute('GET', f'/property/{name}')
+
+    async def find_element(self, by, value):
+        using, value = w3c_locator(by, value)
+        return self.driver.wrap(await self._execute('POST', '/element', {'using': using, 'value': value}))
+
+    async def find_elements(self, by, value):
+        using, value = w3c_locator(by, value)
+        return self.driver.wrap(await self._execute('POST', '/elements', {'using': using, 'value': value}))
+
+
+class AsyncWebDriver:
+    """A W3C WebDriver session driven from asyncio"""
+
+    def __init__(self, server_url, capabilities, service=None):
+        """
+        :param server_url: URL of the driver server, e.g. the service_url of a started chromedriver service
+        :param capabilities: capabilities the session is created with, e.g. options.to_capabilities()
+        :param service: selenium service stopped by quit
+        """
+        self.connection = HttpConnection(server_url)
+        self.capabilities = capabilities
+        self.service = service
+        self.session_id = None
+        self.command_count = 0
+        self.command_seconds = 0.0
+        self._script_timeout = None
+
+    async def start(self):
+        status, data = await self.connection.request('POST', '/session',
+                                                     {'capabilities': {'alwaysMatch': self.capabilities}})
+        value = data.get('value', {})
+        if status >= 400:
+            raise self._exception(value)
+        self.session_id = value['sessionId']
+        return self
+
+    async def quit(self):
+        try:
+            if self.session_id is not None:
+                await self.execute('DELETE', '')
+        finally:
+            self.session_id = None
+            self.connection.close()
+            if self.service is not None:
+                await asyncio.to_thread(self.service.stop)
+
+    async def execute(self, method, command, payload=None):
+        """Send a command of the session, e.g. ('POST', '/url', {'url': ...}), and return its value"""
+        start = time.perf_counter()
+        try:
+            status, data = await self.connection.request(method, f'/session/{self.session_id}{command}', payload)
+        finally:
+            self.command_count += 1
+            self.command_seconds += time.perf_counter() - start
+        value = data.get('value')
+        # Errors come with a 4xx or 5xx status, a script result may well have an error key
+        if status >= 400:
+            raise self._exception(value if isinstance(value, dict) else {})
+        return value
+
+    @staticmethod
+    def _exception(value):
+        error = ERRORS.get(value.get('error'), WebDriverException)
+        return error(value.get('message', value.get('error', 'unknown error')), stacktrace=None)
+
+    def wrap(self, value):
+        """Turn the element references of a command result into AsyncWebElements"""
+        if isinstance(value, list):
+            return [self.wrap(item) for item in value]
+        if isinstance(value, dict):
+            if ELEMENT_KEY in value:
+                return AsyncWebElement(self, value[ELEMENT_KEY])
+            return {key: self.wrap(item) for key, item in value.items()}
+        return value
+
+    def _unwrap(self, value):
+        if isinstance(value, AsyncWebElement):
+            return {ELEMENT_KEY: value.id}
+        if isinstance(value, (list, tuple)):
+            return [self._unwrap(item) for item in value]
+        if isinstance(value, dict):
+            return {key: self._unwrap(item) for key, item in value.items()}
+        return value
+
+    async def get(self, url):
+        await self.execute('POST', '/url', {'url': url})
+
+    async def current_url(self):
+        return await self.execute('GET', '/url')
+
+    async def title(self):
+        return await self.execute('GET', '/title')
+
+    async def find_element(self, by, value):
+        using, value = w3c_locator(by, value)
+        return self.wrap(await self.execute('POST', '/element', {'using': using, 'value': value}))
+
+    async def find_elements(self, by, value):
+        using, value = w3c_locator(by, value)
+        return self.wrap(await self.execute('POST', '/elements', {'using': using, 'value': value}))
+
+    async def execute_script(self, script, *args):
+        return self.wrap(await self.execute('POST', '/execute/sync', {'script': script, 'args': self._unwrap(args)}))
+
+    async def execute_async_script(self, script, *args):
+        return self.wrap(await self.execute('POST', '/execute/async', {'script': script, 'args': self._unwrap(args)}))
+
+    async def set_script_timeout(self, seconds):
+        if self._script_timeout != seconds:
+            await self.execute('POST', '/timeouts', {'script': int(seconds * 1000)})
+            self._script_timeout = seconds
+
+    async def maximize_window(self):
+        await self.execute('POST', '/window/maximize', {})
+
+
+async def create_async_driver(browser, download_dir):
+    """
+    Start a driver server and a browser session for asyncio page objects.
+
+    :param browser: chrome or firefox
+    :param download_dir: directory the browser saves downloads into
+    """
+    start = time.perf_counter()
+    options = browser_options(browser, download_dir)
+    service = await asyncio.to_thread(start_service, browser, options)
+    driver = AsyncWebDriver(service.service_url, options.to_capabilities(), service=service)
+    try:
+        await driver.start()
+        await driver.maximize_window()
+    except BaseException:
+        await driver.quit()
+        raise
+    record_launch(browser, 'async', time.perf_counter() - start)
+    return driver
@@ -0,0 +1,205 @@
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+# Script run on the page a driver is returned from, before it navigates away
+CLEAR_STORAGE_JS = """
+try { window.localStorage.clear(); } catch (e) {}
+try { window.sessionStorage.clear(); } catch (e) {}
+"""
+
+
+def worker_id():
+    """Return the pytest-xdist worker name (gw0, gw1, ...) or 'main' when tests run in a single process"""
+    return os.environ.get('PYTEST_XDIST_WORKER', 'main')
+
+
+class PooledDriver:
+    """A driver owned by the pool together with its usage counter"""
+
+    def __init__(self, driver):
+        self.driver = driver
+        self.uses = 0
+
+
+class BrowserPool:
+    """
+    Keep up to `size` warm browser sessions for the current process (or xdist worker) and lease them to tests.
+
+    A leased driver is reset on return (storage, cookies, extra windows, navigation) so the next test starts clean.
+    Drivers are quit and replaced after `max_uses` leases or as soon as the reset fails, which is how a crashed
+    browser or a dead session is detected.
+    """
+
+    def __init__(self, factory, size=1, max_uses=0, reset_url='about:blank'):
+        """
+        :param factory: callable without arguments that launches a new driver
+        :param size: maximum number of drivers alive at the same time
+        :param max_uses: number of leases after which a driver is recycled, 0 to never recycle
+        :param reset_url: page loaded into a driver when it is returned to the pool
+        """
+        self.factory = factory
+        self.size = max(1, size)
+        self.max_uses = max_uses
+        self.reset_url = reset_url
+        self._idle = []
+        self._live = 0
+        self._closed = False
+        self._condition = threading.Condition()
+
+        # Statistics used to size the pool
+        self.launch_count = 0
+        self.launch_time = 0.0
+        self.recycle_count = 0
+        self.lease_count = 0
+        self.lease_wait_times = []
+
+    def prewarm(self, count=None):
+        """Launch drivers up front, in parallel, so the first tests do not pay the browser start up"""
+        count = self.size if count is None else min(count, self.size)
+        slots = []
+        with self._condition:
+            missing = max(0, count - self._live)
+            self._live += missing
+
+        def launch():
+            try:
+                slots.append(self._launch())
+            except Exception:
+                with self._condition:
+                    self._live -= 1
+                    self._condition.notify()
+                raise
+
+        threads = [threading.Thread(target=launch, daemon=True) for _ in range(missing)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        with self._condition:
+            self._idle.extend(slots)
+            self._condition.notify_all()
+
+    def acquire(self, timeout=None):
+        """Take a driver out of the pool, launching a new one when none is idle and the pool is not full"""
+        start = time.perf_counter()
+        slot = None
+        with self._condition:
+            while True:
+                if self._closed:
+                    raise RuntimeError('Browser pool is closed')
+                if self._idle:
+                    slot = self._idle.pop()
+                    break
+                if self._live < self.size:
+                    self._live += 1
+                    break
+                remaining = None if timeout is None else timeout - (time.perf_counter() - start)
+                if remaining is not None and remaining <= 0:
+                    raise TimeoutError(f'No browser became available in the pool after {timeout} s.')
+                self._condition.wait(remaining)
+
+        if slot is None:
+            try:
+                slot = self._launch()
+            except Exception:
+                with self._condition:
+                    self._live -= 1
+                    self._condition.notify()
+                raise
+
+        slot.uses += 1
+        with self._condition:
+            self.lease_count += 1
+            self.lease_wait_times.append(time.perf_counter() - start)
+        return slot
+
+    def release(self, slot, broken=False):
+        """Return a driver to the pool, recycling it when it is broken, worn out or cannot be reset"""
+        recycle = broken or self._closed or (self.max_uses and slot.uses >= self.max_uses)
+        if not recycle:
+            try:
+                self._reset(slot.driver)
+            except Exception:
+                # A dead driver server raises urllib3 errors such as MaxRetryError rather than WebDriverException
+                recycle = True
+
+        if recycle:
+            self._quit(slot)
+            with self._condition:
+                self._live -= 1
+                self.recycle_count += 1
+                self._condition.notify()
+        else:
+            with self._condition:
+                self._idle.append(slot)
+                self._condition.notify()
+
+    @contextmanager
+    def lease(self, timeout=None):
+        """Context manager yielding a driver and returning it to the pool afterwards"""
+        slot = self.acquire(timeout=timeout)
+        try:
+            yield slot.driver
+        finally:
+            self.release(slot)
+
+    def close(self):
+        """Quit every idle driver. Drivers still leased are quit when they are released."""
+        with self._condition:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            self._live -= len(idle)
+            self._condition.notify_all()
+        for slot in idle:
+            self._quit(slot)
+
+    def stats(self):
+        """Return the counters needed to size the pool"""
+        waits = self.lease_wait_times
+        return {
+            'worker': worker_id(),
+            'size': self.size,
+            'launches': self.launch_count,
+            'launch_time_s': round(self.launch_time, 3),
+            'recycled': self.recycle_count,
+            'leases': self.lease_count,
+            'lease_wait_total_s': round(sum(waits), 3),
+            'lease_wait_max_s': round(max(waits), 3) if waits else 0,
+            'lease_wait_mean_s': round(sum(waits) / len(waits), 3) if waits else 0,
+        }
+
+    def _launch(self):
+        start = time.perf_counter()
+        driver = self.factory()
+        with self._condition:
+            self.launch_count += 1
+            self.launch_time += time.perf_counter() - start
+        return PooledDriver(driver)
+
+    def _reset(self, driver):
+        handles = driver.window_handles
+        if len(handles) > 1:
+            for handle in handles[1:]:
+                driver.switch_to.window(handle)
+                driver.close()
+            driver.switch_to.window(handles[0])
+        driver.execute_script(CLEAR_STORAGE_JS)
+        driver.delete_all_cookies()
+        driver.get(self.reset_url)
+
+    @staticmethod
+    def _quit(slot):
+        try:
+            slot.driver.quit()
+        except Exception:
+            pass
+
+
+def format_stats(stats):
+    """Format the pool statistics of one process for the terminal summary"""
+    return (f"[{stats['worker']}] size={stats['size']} launches={stats['launches']} "
+            f"launch_time={stats['launch_time_s']}s recycled={stats['recycled']} leases={stats['leases']} "
+            f"lease_wait total={stats['lease_wait_total_s']}s max={stats['lease_wait_max_s']}s "
+            f"mean={stats['lease_wait_mean_s']}s")
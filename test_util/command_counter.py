@@ -0,0 +1,142 @@
+"""
+WebDriver round-trip accounting.
+
+Every command a driver sends (find element, execute script, click, each WebDriverWait poll, ...) is one HTTP
+round-trip to the driver server. install() wraps the command executor of a driver so that the name and latency of
+every command is recorded for the current test and phase, and attributed to the outermost page-object method on the
+stack, e.g. LoginPage.fill_username. The cost is a clock read and a short stack walk per command, small next to the
+round-trip itself.
+"""
+import sys
+import threading
+import time
+
+from pages.base_page import BasePage
+
+
+def page_method(frame):
+    """Return PageClass.method of the outermost page-object method on the stack of frame, or None"""
+    method = None
+    while frame is not None:
+        code = frame.f_code
+        if code.co_argcount and code.co_varnames[0] == 'self' and not code.co_name.startswith('_'):
+            page = frame.f_locals.get('self')
+            # Method wrappers such as the page steps ones are not attributes of the page class
+            if isinstance(page, BasePage) and hasattr(type(page), code.co_name):
+                method = f'{type(page).__name__}.{code.co_name}'
+        frame = frame.f_back
+    return method
+
+
+class CommandStats:
+    """Commands of one test: count and seconds per phase, command name and page method"""
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self.phases = {}
+        self.commands = {}
+        self.methods = {}
+
+    def record(self, phase, command, method, elapsed):
+        self.count += 1
+        self.seconds += elapsed
+        for table, key in ((self.phases, phase), (self.commands, command), (self.methods, method or '(test)')):
+            count, seconds = table.get(key, (0, 0.0))
+            table[key] = (count + 1, seconds + elapsed)
+
+    def phase(self, name):
+        """(count, seconds) of one phase: setup, call or teardown"""
+        return self.phases.get(name, (0, 0.0))
+
+    def to_dict(self):
+        """Plain data attached to the test report"""
+        return {'count': self.count, 'seconds': round(self.seconds, 4),
+                'phases': {key: [count, round(seconds, 4)] for key, (count, seconds) in self.phases.items()},
+                'commands': {key: [count, round(seconds, 4)] for key, (count, seconds) in self.commands.items()},
+                'methods': {key: [count, round(seconds, 4)] for key, (count, seconds) in self.methods.items()}}
+
+
+class CommandCounter:
+    """Attribute the commands of the installed drivers to the test running on the current thread"""
+
+    def __init__(self):
+        self._state = threading.local()
+
+    def install(self, driver):
+        """Wrap the command executor of a driver, installing twice has no effect"""
+        executor = driver.command_executor
+        if getattr(executor, '_command_counter', None) is not None:
+            return driver
+        execute = executor.execute
+
+        def counted_execute(command, params):
+            stats = getattr(self._state, 'stats', None)
+            if stats is None:
+                return execute(command, params)
+            start = time.perf_counter()
+            try:
+                return execute(command, params)
+            finally:
+                stats.record(self._state.phase, command, page_method(sys._getframe(1)),
+                             time.perf_counter() - start)
+
+        executor.execute = counted_execute
+        executor._command_counter = self
+        return driver
+
+    def begin(self, phase='setup'):
+        """Start counting the commands of a test on the current thread"""
+        self._state.stats = CommandStats()
+        self._state.phase = phase
+
+    def set_phase(self, phase):
+        self._state.phase = phase
+
+    def current(self):
+        """CommandStats of the test running on the current thread, None outside tests"""
+        return getattr(self._state, 'stats', None)
+
+    def end(self):
+        """Stop counting and return the CommandStats of the test"""
+        stats = self.current()
+        self._state.stats = None
+        return stats
+
+
+def check_budget(stats, round_trips=None, seconds=None, phase='call'):
+    """Return a message when the commands of a phase exceed the budget, None otherwise"""
+    count, elapsed = stats.phase(phase)
+    problems = []
+    if round_trips is not None and count > round_trips:
+        problems.append(f'{count} round-trips > {round_trips}')
+    if seconds is not None and elapsed > seconds:
+        problems.append(f'{elapsed:.3f}s in WebDriver commands > {seconds}s')
+    if not problems:
+        return None
+    busiest = sorted(stats.commands.items(), key=lambda item: item[1][0], reverse=True)[:5]
+    return (f"WebDriver budget exceeded: {', '.join(problems)}. Top commands: "
+            + ', '.join(f'{command} x{count}' for command, (count, _) in busiest))
+
+
+def merge(reports):
+    """Sum the per-test command dicts into totals per command and per page method"""
+    totals = {'commands': {}, 'methods': {}}
+    for report in reports:
+        for table in ('commands', 'methods'):
+            for key, (count, seconds) in report[table].items():
+                total_count, total_seconds = totals[table].get(key, (0, 0.0))
+                totals[table][key] = (total_count + count, total_seconds + seconds)
+    return totals
+
+
+def format_table(table, limit=None):
+    """Format (count, seconds) per name as lines sorted by count"""
+    rows = sorted(table.items(), key=lambda item: item[1][0], reverse=True)[:limit]
+    lines = [f"{'name':<50}{'count':>8}{'total s':>10}{'mean ms':>10}"]
+    for name, (count, seconds) in rows:
+        lines.append(f'{name[:49]:<50}{count:>8}{seconds:>10.3f}{seconds / count * 1000:>10.1f}')
+    return lines
+
+
+COMMANDS = CommandCounter()
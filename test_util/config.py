@@ -1,4 +1,3 @@
-import yaml
 from pathlib import Path
 
 # Specify the file to read to get the settings
@@ -6,6 +5,8 @@ JIRA_YML = Path(__file__).parents[1]/'local.yaml'
 
 
 def read_yml_file(file):
+    import yaml
+
     with file.open(mode='r') as file:
         return yaml.load(file, Loader=yaml.FullLoader)
 
@@ -20,6 +21,22 @@ class AppSettings:
         self.username = env_settings['username']
         self.password = env_settings['password']
         self.webdriver_visible = env_settings['webdriver_visible']
+        # Rendering profile, 'full' or 'lean', and the resources the lean one blocks
+        self.rendering = env_settings.get('rendering', 'full')
+        self.lean = env_settings.get('lean') or {}
+
+
+class LazySettings:
+    """Settings read from the yaml file the first time one of them is accessed, not when the module is imported"""
+
+    def __init__(self, load):
+        self._load = load
+        self._settings = None
+
+    def __getattr__(self, name):
+        if self._settings is None:
+            self._settings = self._load()
+        return getattr(self._settings, name)
 
 
-TEST_ENV = AppSettings(config_yml=JIRA_YML)
+TEST_ENV = LazySettings(lambda: AppSettings(config_yml=JIRA_YML))
@@ -0,0 +1,256 @@
+"""
+Chrome DevTools protocol helpers: performance counters, CPU and network throttling and trace files.
+
+Performance.getMetrics gives the counters the page pays for (layouts, style recalculations, script and task
+durations, JS heap, DOM nodes). print_timing reads them before and after an interaction when --cdp-metrics is set.
+Throttling profiles are applied per test with the perf_profile marker or --perf-profile. Trace events are collected
+by chromedriver in the performance log (goog:loggingPrefs with traceCategories, see driver_factory) and written
+per test as a trace file that Chrome DevTools or Perfetto can open.
+
+The lean rendering profile blocks resource types or URL patterns with Network.setBlockedURLs and turns animations
+and transitions off with a style injected into every new document, see lean_profile and DevToolsSession.apply_lean.
+"""
+import json
+import weakref
+from pathlib import Path
+
+from selenium.common.exceptions import WebDriverException
+
+# Performance.getMetrics counters kept, with the column they are reported in
+METRICS = {
+    'LayoutCount': 'layout_count',
+    'RecalcStyleCount': 'recalc_style_count',
+    'LayoutDuration': 'layout_duration',
+    'RecalcStyleDuration': 'recalc_style_duration',
+    'ScriptDuration': 'script_duration',
+    'TaskDuration': 'task_duration',
+    'JSHeapUsedSize': 'js_heap_used_size',
+    'Nodes': 'dom_nodes',
+    'JSEventListeners': 'js_event_listeners',
+}
+# Counters reported as a difference over the interaction, the others as their value at its end
+CUMULATIVE_METRICS = ('LayoutCount', 'RecalcStyleCount', 'LayoutDuration', 'RecalcStyleDuration', 'ScriptDuration',
+                      'TaskDuration')
+# Durations are in seconds, reported in milliseconds like the other timing columns
+DURATION_METRICS = ('LayoutDuration', 'RecalcStyleDuration', 'ScriptDuration', 'TaskDuration')
+
+# Network conditions of the Chrome DevTools presets, throughputs in bytes per second
+NETWORK_PROFILES = {
+    'slow_3g': {'latency': 2000, 'downloadThroughput': 50000, 'uploadThroughput': 50000},
+    'fast_3g': {'latency': 562.5, 'downloadThroughput': 180000, 'uploadThroughput': 84375},
+    'slow_4g': {'latency': 150, 'downloadThroughput': 200000, 'uploadThroughput': 93750},
+}
+_NO_THROTTLING = {'offline': False, 'latency': 0, 'downloadThroughput': -1, 'uploadThroughput': -1}
+
+# Profiles selectable with --perf-profile or @pytest.mark.perf_profile(name), cpu is the slowdown factor
+PERF_PROFILES = {
+    'default': {'cpu': 1, 'network': None},
+    'slow_device': {'cpu': 4, 'network': None},
+    'slow_device_3g': {'cpu': 4, 'network': 'fast_3g'},
+    'slow_3g': {'cpu': 1, 'network': 'slow_3g'},
+    'slow_4g': {'cpu': 1, 'network': 'slow_4g'},
+}
+
+# File extensions of the resource types the lean profile can block. Network.setBlockedURLs matches URL patterns
+# only, a type is blocked through the extensions of its files
+RESOURCE_EXTENSIONS = {
+    'image': ('png', 'jpg', 'jpeg', 'gif', 'webp', 'avif', 'svg', 'ico', 'bmp'),
+    'font': ('woff', 'woff2', 'ttf', 'otf', 'eot'),
+    'media': ('mp4', 'webm', 'ogg', 'mp3', 'wav', 'm4a', 'mov'),
+    'stylesheet': ('css',),
+}
+LEAN_BLOCKED_TYPES = ('image', 'font', 'media')
+
+# Animations and transitions end at once. Durations are set to 0 rather than removed so that the final state is
+# applied and animationend and transitionend still fire
+NO_ANIMATIONS_JS = """
+(() => {
+    const css = '*, *::before, *::after { animation-duration: 0s !important; animation-delay: 0s !important; '
+        + 'animation-iteration-count: 1 !important; transition-duration: 0s !important; '
+        + 'transition-delay: 0s !important; scroll-behavior: auto !important; }';
+    const inject = () => {
+        const style = document.createElement('style');
+        style.id = 'lean-no-animations';
+        style.textContent = css;
+        (document.head || document.documentElement).appendChild(style);
+    };
+    if (document.documentElement) {
+        inject();
+    } else {
+        document.addEventListener('DOMContentLoaded', inject, {once: true});
+    }
+})();
+"""
+
+TRACE_CATEGORIES = 'devtools.timeline,v8.execute,blink.user_timing,loading,disabled-by-default-devtools.timeline'
+
+_SESSIONS = weakref.WeakKeyDictionary()
+
+
+def perf_profile(name=None, **overrides):
+    """
+    Return the profile of a name with overrides, e.g. perf_profile('slow_device', network='slow_3g') or
+    perf_profile(cpu=6).
+    """
+    if name is not None and name not in PERF_PROFILES:
+        raise ValueError(f"Unknown perf profile {name!r}, expected one of {', '.join(PERF_PROFILES)}")
+    profile = dict(PERF_PROFILES[name or 'default'], **overrides)
+    if profile['network'] is not None and profile['network'] not in NETWORK_PROFILES:
+        raise ValueError(f"Unknown network profile {profile['network']!r}")
+    return profile
+
+
+def lean_profile(blocked_types=LEAN_BLOCKED_TYPES, blocked_urls=()):
+    """
+    Return the lean rendering profile applied by DevToolsSession.apply_lean.
+
+    :param blocked_types: resource types of RESOURCE_EXTENSIONS that are not loaded
+    :param blocked_urls: additional Network.setBlockedURLs patterns, '*' matches any characters
+    """
+    unknown = [name for name in blocked_types if name not in RESOURCE_EXTENSIONS]
+    if unknown:
+        raise ValueError(f"Unknown resource types {unknown}, expected some of {', '.join(RESOURCE_EXTENSIONS)}")
+    patterns = [pattern for name in blocked_types for extension in RESOURCE_EXTENSIONS[name]
+                for pattern in (f'*.{extension}', f'*.{extension}?*')]
+    return {'blocked_urls': patterns + list(blocked_urls)}
+
+
+class DevToolsSession:
+    """DevTools commands on one Chrome driver, created once per driver by for_driver"""
+
+    # Read Performance.getMetrics around every print_timing interaction, set by --cdp-metrics
+    collect_metrics = False
+
+    def __init__(self, driver):
+        self.driver = driver
+        self.profile = None
+        self.lean = None
+        self._performance_enabled = False
+        self._lean_script = None
+
+    @classmethod
+    def for_driver(cls, driver):
+        """Return the session of a driver, None for drivers without the DevTools protocol such as Firefox"""
+        if not hasattr(driver, 'execute_cdp_cmd'):
+            return None
+        session = _SESSIONS.get(driver)
+        if session is None:
+            session = _SESSIONS[driver] = cls(driver)
+        return session
+
+    def get_metrics(self):
+        """Return the Performance.getMetrics counters by name"""
+        if not self._performance_enabled:
+            self.driver.execute_cdp_cmd('Performance.enable', {'timeDomain': 'timeTicks'})
+            self._performance_enabled = True
+        result = self.driver.execute_cdp_cmd('Performance.getMetrics', {})
+        return {metric['name']: metric['value'] for metric in result['metrics']}
+
+    @staticmethod
+    def metrics_delta(before, after):
+        """Return the metric columns of an interaction from the counters read before and after it"""
+        columns = {}
+        for name, column in METRICS.items():
+            if name not in after:
+                continue
+            value = after[name] - before.get(name, 0) if name in CUMULATIVE_METRICS else after[name]
+            columns[column] = round(value * 1000, 1) if name in DURATION_METRICS else int(value)
+        return columns
+
+    def apply_profile(self, profile):
+        """Apply the CPU throttling and network emulation of a profile returned by perf_profile"""
+        self.driver.execute_cdp_cmd('Emulation.setCPUThrottlingRate', {'rate': profile['cpu']})
+        if profile['network'] is not None:
+            self.driver.execute_cdp_cmd('Network.enable', {})
+            self.driver.execute_cdp_cmd('Network.emulateNetworkConditions',
+                                        dict(_NO_THROTTLING, **NETWORK_PROFILES[profile['network']]))
+        self.profile = profile
+
+    def reset_profile(self):
+        """Remove the throttling before the driver goes back to the pool"""
+        if self.profile is None:
+            return
+        self.driver.execute_cdp_cmd('Emulation.setCPUThrottlingRate', {'rate': 1})
+        if self.profile['network'] is not None:
+            self.driver.execute_cdp_cmd('Network.emulateNetworkConditions', _NO_THROTTLING)
+        self.profile = None
+
+    def collect_garbage(self):
+        """Run a full garbage collection of the page, before reading the heap of a leak check"""
+        self.driver.execute_cdp_cmd('HeapProfiler.collectGarbage', {})
+
+    def write_heap_snapshot(self, file_name):
+        """
+        Write a heap snapshot of the current page, viewable in the Memory panel of Chrome DevTools, and return its
+        size in characters. The snapshot is streamed in events that execute_cdp_cmd does not return, it is taken on a
+        second DevTools connection to the page with websocket-client and written chunk by chunk.
+        """
+        import urllib.request
+
+        import websocket
+
+        address = self.driver.capabilities['goog:chromeOptions']['debuggerAddress']
+        with urllib.request.urlopen(f'http://{address}/json/list') as response:
+            pages = [target for target in json.load(response) if target['type'] == 'page']
+        current_url = self.driver.current_url
+        page = next((target for target in pages if target['url'] == current_url), pages[0])
+        file_name = Path(file_name)
+        file_name.parent.mkdir(parents=True, exist_ok=True)
+        connection = websocket.create_connection(page['webSocketDebuggerUrl'], suppress_origin=True, timeout=300)
+        size = 0
+        try:
+            connection.send(json.dumps({'id': 1, 'method': 'HeapProfiler.takeHeapSnapshot',
+                                        'params': {'reportProgress': False}}))
+            with file_name.open('w') as snapshot:
+                while True:
+                    message = json.loads(connection.recv())
+                    if message.get('method') == 'HeapProfiler.addHeapSnapshotChunk':
+                        snapshot.write(message['params']['chunk'])
+                        size += len(message['params']['chunk'])
+                    elif message.get('id') == 1:
+                        if 'error' in message:
+                            raise WebDriverException(f"HeapProfiler.takeHeapSnapshot: {message['error']['message']}")
+                        return size
+        finally:
+            connection.close()
+
+    def apply_lean(self, profile):
+        """Block the URLs of a profile returned by lean_profile and disable animations from the next navigation on"""
+        self.driver.execute_cdp_cmd('Network.enable', {})
+        self.driver.execute_cdp_cmd('Network.setBlockedURLs', {'urls': profile['blocked_urls']})
+        self._lean_script = self.driver.execute_cdp_cmd('Page.addScriptToEvaluateOnNewDocument',
+                                                        {'source': NO_ANIMATIONS_JS})['identifier']
+        self.driver.execute_cdp_cmd('Emulation.setEmulatedMedia',
+                                    {'features': [{'name': 'prefers-reduced-motion', 'value': 'reduce'}]})
+        self.lean = profile
+
+    def reset_lean(self):
+        """Restore full-fidelity rendering before the driver goes back to the pool"""
+        if self.lean is None:
+            return
+        self.driver.execute_cdp_cmd('Network.setBlockedURLs', {'urls': []})
+        self.driver.execute_cdp_cmd('Page.removeScriptToEvaluateOnNewDocument', {'identifier': self._lean_script})
+        self.driver.execute_cdp_cmd('Emulation.setEmulatedMedia', {'features': []})
+        self.lean = self._lean_script = None
+
+    def drain_trace_events(self):
+        """Return the trace events buffered in the performance log since the previous call"""
+        try:
+            entries = self.driver.get_log('performance')
+        except WebDriverException:
+            # The driver was launched without tracing
+            return []
+        events = []
+        for entry in entries:
+            message = json.loads(entry['message'])['message']
+            if message['method'] == 'Tracing.dataCollected':
+                events.append(message['params'])
+        return events
+
+    def write_trace(self, file_name):
+        """Write the buffered trace events to a file in the Trace Event format, return the number of events"""
+        events = self.drain_trace_events()
+        file_name = Path(file_name)
+        file_name.parent.mkdir(parents=True, exist_ok=True)
+        file_name.write_text(json.dumps({'traceEvents': events}))
+        return len(events)
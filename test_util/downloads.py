@@ -0,0 +1,176 @@
+"""
+Waiting for browser downloads without sleeping.
+
+DownloadWatcher follows a download directory with inotify (Linux, through ctypes) and falls back to polling
+elsewhere. A file is complete when it is closed after writing or renamed into place: Chrome writes
+<name>.crdownload and renames it, Firefox writes <name>.part next to an empty <name> and moves it over. Files
+present before the watcher started are ignored, so wait() returns the new download as soon as it is ready.
+verify_download checks the size and digest of a file in fixed-size chunks, a large download is never read into
+memory at once.
+"""
+import ctypes
+import ctypes.util
+import fnmatch
+import hashlib
+import os
+import select
+import struct
+import sys
+import time
+from pathlib import Path
+
+# Suffixes of the files browsers write while downloading
+PARTIAL_SUFFIXES = ('.crdownload', '.part', '.download', '.tmp')
+# Delay between two directory scans of the polling fallback, in seconds
+POLL_INTERVAL = 0.1
+CHUNK_SIZE = 1024 * 1024
+
+# inotify(7)
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+_EVENT = struct.Struct('iIII')
+
+
+def is_partial(name):
+    return name.endswith(PARTIAL_SUFFIXES) or name.startswith('.com.google.Chrome.')
+
+
+class _Inotify:
+    """inotify descriptor watching one directory for completed files"""
+
+    def __init__(self, directory):
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        self.fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+        if libc.inotify_add_watch(self.fd, os.fsencode(directory), IN_CLOSE_WRITE | IN_MOVED_TO) < 0:
+            errno = ctypes.get_errno()
+            os.close(self.fd)
+            raise OSError(errno, f'inotify_add_watch failed on {directory}')
+
+    def read(self, timeout):
+        """Names of the files closed after writing or moved in within timeout seconds"""
+        if not select.select([self.fd], [], [], max(timeout, 0))[0]:
+            return []
+        data = os.read(self.fd, 64 * 1024)
+        names, offset = [], 0
+        while offset < len(data):
+            _, _, _, length = _EVENT.unpack_from(data, offset)
+            offset += _EVENT.size
+            names.append(os.fsdecode(data[offset:offset + length].rstrip(b'\0')))
+            offset += length
+        return names
+
+    def close(self):
+        os.close(self.fd)
+
+
+class DownloadWatcher:
+    """Follow a download directory from creation on, wait() returns the next completed download"""
+
+    def __init__(self, directory, use_inotify=True):
+        """
+        :param directory: directory the browser saves downloads into, created when missing
+        :param use_inotify: False to always poll
+        """
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._seen = {path.name for path in self.directory.iterdir()}
+        self._inotify = None
+        if use_inotify and sys.platform.startswith('linux'):
+            try:
+                self._inotify = _Inotify(self.directory)
+            except (OSError, AttributeError):
+                # No inotify in this libc or no watch left (fs.inotify.max_user_watches), poll instead
+                self._inotify = None
+
+    @property
+    def mode(self):
+        return 'inotify' if self._inotify is not None else 'polling'
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        if self._inotify is not None:
+            self._inotify.close()
+            self._inotify = None
+
+    def _complete(self, name, pattern):
+        """Whether name is a finished download matching pattern that was not returned yet"""
+        if name in self._seen or is_partial(name) or not fnmatch.fnmatch(name, pattern):
+            return False
+        path = self.directory / name
+        # Firefox creates the final name empty before the download starts, the .part file is still there
+        return path.is_file() and not any((self.directory / f'{name}{suffix}').exists() for suffix in PARTIAL_SUFFIXES)
+
+    def wait(self, pattern='*', timeout=30):
+        """
+        Return the path of the next completed download whose name matches pattern.
+
+        :param pattern: shell-style pattern of the file name, e.g. '*.csv'
+        :param timeout: seconds before TimeoutError is raised
+        """
+        deadline = time.monotonic() + timeout
+        sizes = {}
+        while True:
+            # A scan also finds the files completed before the wait or between two inotify reads
+            for name in sorted(os.listdir(self.directory)):
+                if not self._complete(name, pattern):
+                    continue
+                path = self.directory / name
+                if self._inotify is None:
+                    # Polling sees a file being written by a browser that does not use a partial name, its size
+                    # must not change between two scans
+                    try:
+                        size = path.stat().st_size
+                    except FileNotFoundError:
+                        continue
+                    if sizes.get(name) != size:
+                        sizes[name] = size
+                        continue
+                self._seen.add(name)
+                return path
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise TimeoutError(f'No download matching {pattern!r} completed in {self.directory} '
+                                   f'within {timeout}s')
+            if self._inotify is not None:
+                self._inotify.read(remaining)
+            else:
+                time.sleep(min(POLL_INTERVAL, remaining))
+
+
+def file_digest(path, algorithm='sha256', chunk_size=CHUNK_SIZE):
+    """Hex digest of a file, read in chunks of chunk_size bytes"""
+    digest = hashlib.new(algorithm)
+    with open(path, 'rb') as file:
+        for chunk in iter(lambda: file.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def verify_download(path, size=None, digest=None, algorithm='sha256', min_size=None):
+    """
+    Check a downloaded file without loading it into memory, raise AssertionError on a mismatch.
+
+    :param path: downloaded file
+    :param size: exact expected size in bytes
+    :param digest: expected hex digest of algorithm
+    :param min_size: smallest acceptable size in bytes, when the exact size is not known
+    """
+    actual_size = os.path.getsize(path)
+    if size is not None and actual_size != size:
+        raise AssertionError(f'{path}: {actual_size} bytes, expected {size}')
+    if min_size is not None and actual_size < min_size:
+        raise AssertionError(f'{path}: {actual_size} bytes, expected at least {min_size}')
+    if digest is not None:
+        actual = file_digest(path, algorithm)
+        if actual != digest.lower():
+            raise AssertionError(f'{path}: {algorithm} {actual}, expected {digest}')
+    return path
@@ -0,0 +1,269 @@
+import hashlib
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import weakref
+from collections import defaultdict
+from pathlib import Path
+
+# selenium.webdriver loads Chrome and Firefox on first access, the remote webdriver is not imported by collection
+from selenium import webdriver
+from selenium.webdriver.chrome.options import Options as ChromeOptions
+from selenium.webdriver.firefox.options import Options as FirefoxOptions
+
+from test_util.config import TEST_ENV
+from test_util.devtools import TRACE_CATEGORIES
+from test_util.metrics import percentile
+
+# Launch durations in seconds per (browser, 'cold' | 'warm' | 'template'), reported in the terminal summary
+LAUNCH_TIMINGS = defaultdict(list)
+_LAUNCH_LOCK = threading.Lock()
+
+# Files a running browser keeps in its profile, they must not be copied into a clone
+PROFILE_LOCK_FILES = ('SingletonLock', 'SingletonSocket', 'SingletonCookie', 'lock', '.parentlock', 'parent.lock')
+# Stands for the per-session download directory when fingerprinting the options of a template
+_TEMPLATE_DOWNLOAD_DIR = '<download_dir>'
+
+# Background services turned off by the lean rendering profile. They do not change what pages look like, only the
+# network and CPU the browser spends next to the page under test
+LEAN_CHROME_ARGUMENTS = ('--disable-background-networking', '--disable-component-update', '--disable-default-apps',
+                         '--disable-extensions', '--disable-sync', '--disable-client-side-phishing-detection',
+                         '--disable-domain-reliability', '--disable-breakpad', '--metrics-recording-only',
+                         '--no-first-run', '--no-default-browser-check', '--mute-audio')
+LEAN_FIREFOX_PREFERENCES = {
+    'app.update.auto': False,
+    'browser.safebrowsing.malware.enabled': False,
+    'browser.safebrowsing.phishing.enabled': False,
+    'browser.safebrowsing.downloads.enabled': False,
+    'datareporting.healthreport.uploadEnabled': False,
+    'datareporting.policy.dataSubmissionEnabled': False,
+    'toolkit.telemetry.enabled': False,
+    'extensions.update.enabled': False,
+    'network.prefetch-next': False,
+    'media.autoplay.default': 5,
+}
+
+
+def chrome_options(download_dir, tracing=False, lean=False):
+    """
+    Build the Chrome options used by every test session.
+
+    :param download_dir: directory the browser saves downloads into
+    :param tracing: collect trace events in the performance log, read by DevToolsSession.write_trace
+    :param lean: turn off the background services of LEAN_CHROME_ARGUMENTS
+    """
+    options = ChromeOptions()
+    if not TEST_ENV.webdriver_visible:
+        options.add_argument("--headless=new")
+    options.add_argument("--disable-gpu")
+    options.add_argument("--log-level=3")
+    options.add_argument('--ignore-certificate-errors')
+    options.add_argument("--no-sandbox")
+    options.add_argument("--disable-dev-shm-usage")
+    options.add_argument("--disable-infobars")
+    options.add_argument("--enable-precise-memory-info")
+    options.add_argument('lang=en')
+    # Console messages kept for the failure artifacts
+    logging_prefs = {'browser': 'ALL'}
+    if tracing:
+        logging_prefs['performance'] = 'ALL'
+        options.add_experimental_option('perfLoggingPrefs', {'enableNetwork': False, 'enablePage': False,
+                                                             'traceCategories': TRACE_CATEGORIES})
+    options.set_capability('goog:loggingPrefs', logging_prefs)
+    options.add_argument("--disable-features=InsecureDownloadWarnings")
+    if lean:
+        for argument in LEAN_CHROME_ARGUMENTS:
+            options.add_argument(argument)
+    # A second add_experimental_option('prefs', ...) would replace the first one, set every pref at once
+    options.add_experimental_option('prefs', {'intl.accept_languages': 'en,en_US',
+                                              'download.default_directory': download_dir})
+    return options
+
+
+def firefox_options(download_dir, lean=False):
+    """Build the Firefox options used by every test session, without its background services when lean"""
+    options = FirefoxOptions()
+    if not TEST_ENV.webdriver_visible:
+        options.headless = True
+    options.set_preference("browser.download.folderList", 2)
+    options.set_preference("browser.download.dir", download_dir)
+    options.set_preference("browser.download.manager.showWhenStarting", False)
+    options.set_preference("browser.download.viewableInternally.enabledTypes", "")
+    options.set_preference("browser.helperApps.neverAsk.saveToDisk",
+                           "application/octet-stream,application/vnd.ms-excel,application/xml,text/xml")
+    options.add_argument("--window-size=1920,1080")
+    options.add_argument('--ignore-certificate-errors')
+    if lean:
+        for name, value in LEAN_FIREFOX_PREFERENCES.items():
+            options.set_preference(name, value)
+    return options
+
+
+def browser_options(browser, download_dir, profile_dir=None, tracing=False, lean=False):
+    """
+    Build the options of a browser, optionally running on an existing profile directory.
+
+    :param browser: chrome or firefox
+    :param download_dir: directory the browser saves downloads into
+    :param profile_dir: user data directory (chrome) or profile (firefox) the browser uses instead of a new one
+    :param tracing: collect trace events, chrome only
+    :param lean: turn off the background services of the browser
+    """
+    if browser == 'chrome':
+        options = chrome_options(download_dir, tracing=tracing, lean=lean)
+        if profile_dir is not None:
+            options.add_argument(f'--user-data-dir={profile_dir}')
+    elif browser == 'firefox':
+        options = firefox_options(download_dir, lean=lean)
+        if profile_dir is not None:
+            # geckodriver writes the preferences into this profile instead of copying it to a temporary one
+            options.add_argument('-profile')
+            options.add_argument(str(profile_dir))
+    else:
+        raise ValueError(f'Unsupported driver: {browser}')
+    return options
+
+
+def record_launch(browser, mode, elapsed):
+    """Record the launch duration of a browser session"""
+    with _LAUNCH_LOCK:
+        LAUNCH_TIMINGS[(browser, mode)].append(elapsed)
+
+
+def options_fingerprint(browser, lean=False):
+    """Hash of the options a template profile was prepared with, it is rebuilt when they change"""
+    capabilities = browser_options(browser, _TEMPLATE_DOWNLOAD_DIR, lean=lean).to_capabilities()
+    return hashlib.sha256(json.dumps(capabilities, sort_keys=True, default=str).encode()).hexdigest()[:16]
+
+
+def clone_profile(template, destination):
+    """
+    Copy a template profile. GNU cp --reflink=auto makes copy-on-write clones on btrfs, XFS and similar file systems
+    and falls back to a regular copy elsewhere. Lock files left by the browser are removed from the clone.
+    """
+    if sys.platform.startswith('linux') and shutil.which('cp'):
+        try:
+            subprocess.run(['cp', '-a', '--reflink=auto', str(template), str(destination)], check=True,
+                           stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        except (OSError, subprocess.CalledProcessError):
+            shutil.rmtree(destination, ignore_errors=True)
+            shutil.copytree(template, destination, symlinks=True)
+    else:
+        shutil.copytree(template, destination, symlinks=True)
+    for root, _, files in os.walk(destination):
+        for name in files:
+            if name in PROFILE_LOCK_FILES:
+                os.unlink(os.path.join(root, name))
+    return Path(destination)
+
+
+def prepare_profile_template(browser, cache_dir, warm_urls=(), lean=False):
+    """
+    Return the template profile of a browser, launching the browser once to create it when it is missing or was
+    prepared with other options. The first-run setup is done and the pages of warm_urls are cached in the template.
+
+    :param browser: chrome or firefox
+    :param cache_dir: directory the templates are kept in between runs
+    :param warm_urls: pages loaded once to cache their resources in the profile, on origins that are stable across runs
+    :param lean: prepare it with the lean launch options
+    """
+    template = Path(cache_dir) / f'{browser}_{options_fingerprint(browser, lean)}'
+    if (template / '.ready').exists():
+        return template
+
+    start = time.perf_counter()
+    building = Path(tempfile.mkdtemp(prefix=f'.{template.name}.', dir=cache_dir))
+    download_dir = tempfile.mkdtemp(prefix='template_downloads_')
+    try:
+        driver = _launch(browser, browser_options(browser, download_dir, profile_dir=building, lean=lean))
+        try:
+            for url in warm_urls:
+                driver.get(url)
+            driver.get('about:blank')
+        finally:
+            driver.quit()
+        (building / '.ready').touch()
+        try:
+            os.replace(building, template)
+        except OSError:
+            # Another xdist worker prepared the same template first
+            shutil.rmtree(building, ignore_errors=True)
+    except BaseException:
+        shutil.rmtree(building, ignore_errors=True)
+        raise
+    finally:
+        shutil.rmtree(download_dir, ignore_errors=True)
+    record_launch(browser, 'template', time.perf_counter() - start)
+    return template
+
+
+def create_driver(browser, download_dir, profile_template=None, tracing=False, lean=False, remote=None):
+    """
+    Launch a new browser session.
+
+    :param browser: name of the browser given through --driver (chrome or firefox)
+    :param download_dir: directory the browser saves downloads into
+    :param profile_template: template profile from prepare_profile_template, the session starts from a clone of it
+    :param tracing: collect trace events for the trace files of --trace-dir, chrome only
+    :param lean: launch without the background services, see LEAN_CHROME_ARGUMENTS and LEAN_FIREFOX_PREFERENCES
+    :param remote: RemoteEndpoint of test_util/remote_driver.py the session is started on, for --driver=remote
+    """
+    start = time.perf_counter()
+    if remote is not None:
+        driver = remote.new_driver(browser_options(browser, download_dir, tracing=tracing, lean=lean))
+        driver.maximize_window()
+        record_launch(browser, 'remote', time.perf_counter() - start)
+        return driver
+    profile_dir = None
+    if profile_template is not None:
+        profile_dir = clone_profile(profile_template, Path(tempfile.mkdtemp(prefix=f'{browser}_profile_')) / 'p')
+    try:
+        driver = _launch(browser, browser_options(browser, download_dir, profile_dir=profile_dir, tracing=tracing,
+                                                  lean=lean))
+    except BaseException:
+        if profile_dir is not None:
+            shutil.rmtree(profile_dir.parent, ignore_errors=True)
+        raise
+    if profile_dir is not None:
+        # The clone is removed once the driver is quit and garbage collected, or at exit
+        weakref.finalize(driver, shutil.rmtree, str(profile_dir.parent), ignore_errors=True)
+    driver.maximize_window()
+    record_launch(browser, 'cold' if profile_template is None else 'warm', time.perf_counter() - start)
+    return driver
+
+
+def _launch(browser, options):
+    if browser == 'chrome':
+        return webdriver.Chrome(options=options)
+    return webdriver.Firefox(options=options)
+
+
+def start_service(browser, options):
+    """
+    Start the driver server of a browser the way webdriver.Chrome and webdriver.Firefox do, for the clients that
+    talk to it directly such as test_util/async_webdriver.py. The browser path found is set on the options.
+    """
+    from selenium.webdriver.common.driver_finder import DriverFinder
+
+    service = webdriver.ChromeService() if browser == 'chrome' else webdriver.FirefoxService()
+    finder = DriverFinder(service, options)
+    if finder.get_browser_path():
+        options.binary_location = finder.get_browser_path()
+        options.browser_version = None
+    service.path = service.env_path() or finder.get_driver_path()
+    service.start()
+    return service
+
+
+def format_launch_timings(timings):
+    """Format launch durations per (browser, mode) as the lines of a table"""
+    lines = [f"{'browser':<10}{'mode':<10}{'count':>6}{'mean':>9}{'p50':>9}{'max':>9}"]
+    for (browser, mode), values in sorted(timings.items()):
+        lines.append(f"{browser:<10}{mode:<10}{len(values):>6}{sum(values) / len(values):>8.2f}s"
+                     f"{percentile(values, 50):>8.2f}s{max(values):>8.2f}s")
+    return lines
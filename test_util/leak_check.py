@@ -0,0 +1,110 @@
+"""
+Memory-leak detection by repeating a scenario in one browser session.
+
+A leak is memory that every run of a scenario leaves behind: detached DOM nodes kept by a closure, listeners that
+are never removed, caches that only grow. One heap reading cannot tell it from noise, so LeakCheck runs a scenario
+many times, forces a garbage collection after every run (chrome, HeapProfiler.collectGarbage) and samples the JS heap,
+the DOM nodes and the event listeners. A least-squares line through the samples gives the growth per iteration;
+a metric leaks when it grows by more than its threshold per iteration with a steady trend (r squared of the fit).
+Heap snapshots of the first and last measured iterations can be written for the Memory panel of Chrome DevTools.
+"""
+import statistics
+from pathlib import Path
+
+from test_util.devtools import DevToolsSession
+
+# Growth per iteration above which a metric leaks
+DEFAULT_THRESHOLDS = {'js_heap_used_size': 16 * 1024, 'dom_nodes': 1, 'js_event_listeners': 1}
+# Minimal r squared of the fit, lower means the samples go up and down rather than grow
+MIN_FIT = 0.5
+
+# Other browsers: no forced GC, the heap only where performance.memory exists and no listener count
+SAMPLE_JS = """
+return {
+    js_heap_used_size: performance.memory ? performance.memory.usedJSHeapSize : null,
+    dom_nodes: document.getElementsByTagName('*').length,
+    js_event_listeners: null
+};
+"""
+
+
+def linear_trend(values):
+    """Return the slope per step and the r squared of the least-squares line through values"""
+    steps = list(range(len(values)))
+    slope, _ = statistics.linear_regression(steps, values)
+    try:
+        fit = statistics.correlation(steps, values) ** 2
+    except statistics.StatisticsError:
+        # Constant values
+        fit = 0.0
+    return slope, fit
+
+
+class LeakCheck:
+    """Repeat a scenario and report the metrics that grow with every iteration"""
+
+    def __init__(self, driver, iterations=30, warmup=3, thresholds=None, snapshot_dir=None, name='scenario'):
+        """
+        :param driver: WebDriver the scenario runs on
+        :param iterations: measured runs of the scenario
+        :param warmup: runs before the first sample, they fill the caches and compile the code of the page
+        :param thresholds: growth per iteration allowed per metric, merged into DEFAULT_THRESHOLDS
+        :param snapshot_dir: write the heap snapshots of the first and last measured iterations here, chrome only
+        :param name: prefix of the snapshot files
+        """
+        self.driver = driver
+        self.iterations = iterations
+        self.warmup = warmup
+        self.thresholds = dict(DEFAULT_THRESHOLDS, **(thresholds or {}))
+        self.snapshot_dir = snapshot_dir
+        self.name = name
+        self.devtools = DevToolsSession.for_driver(driver)
+        self.samples = []
+        self.snapshots = []
+
+    def sample(self):
+        """Collect garbage where the browser allows it and read the metrics"""
+        if self.devtools is None:
+            return self.driver.execute_script(SAMPLE_JS)
+        self.devtools.collect_garbage()
+        metrics = self.devtools.get_metrics()
+        return {'js_heap_used_size': metrics.get('JSHeapUsedSize'), 'dom_nodes': metrics.get('Nodes'),
+                'js_event_listeners': metrics.get('JSEventListeners')}
+
+    def run(self, scenario):
+        """Run scenario(iteration) warmup + iterations times, sampling after each measured run"""
+        last = self.warmup + self.iterations - 1
+        for iteration in range(self.warmup + self.iterations):
+            scenario(iteration)
+            if iteration < self.warmup:
+                continue
+            self.samples.append(self.sample())
+            if self.snapshot_dir and self.devtools is not None and iteration in (self.warmup, last):
+                file_name = Path(self.snapshot_dir) / f'{self.name}_{iteration}.heapsnapshot'
+                self.devtools.write_heap_snapshot(file_name)
+                self.snapshots.append(file_name)
+        return self
+
+    def trends(self):
+        """(growth per iteration, r squared) per metric the browser reported"""
+        trends = {}
+        for metric in self.thresholds:
+            values = [sample.get(metric) for sample in self.samples]
+            if len(values) >= 3 and None not in values:
+                trends[metric] = linear_trend(values)
+        return trends
+
+    def problems(self):
+        """Messages of the metrics growing faster than their threshold, empty when nothing leaks"""
+        return [f'{metric} grows by {slope:.1f} per iteration (fit {fit:.2f}) > {self.thresholds[metric]}'
+                for metric, (slope, fit) in self.trends().items()
+                if slope > self.thresholds[metric] and fit >= MIN_FIT]
+
+    def format(self):
+        """Report lines: first and last sample and growth per iteration of every metric"""
+        lines = [f"{self.name}: {len(self.samples)} iterations after {self.warmup} warm-up runs"]
+        for metric, (slope, fit) in self.trends().items():
+            lines.append(f"  {metric:<20}{self.samples[0][metric]:>14,.0f} -> {self.samples[-1][metric]:>14,.0f}"
+                         f"  {slope:>+12.1f}/iteration  fit {fit:.2f}")
+        lines.extend(f'  heap snapshot {file_name}' for file_name in self.snapshots)
+        return lines
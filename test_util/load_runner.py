@@ -0,0 +1,240 @@
+"""
+Virtual-user load generation built on the page objects.
+
+A scenario is a plain function taking a VirtualUser. It drives the page objects with `vu.driver` and wraps every
+step it wants measured in `vu.interaction(name)`. The runner starts N virtual users on a thread or process pool,
+ramps them up, keeps them running for a duration or a number of iterations and reports throughput and latency
+percentiles per interaction.
+
+    python -m test_util.load_runner --scenario add_edit_delete_item --users 8 --ramp-up 20 --duration 120
+"""
+import argparse
+import functools
+import itertools
+import random
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import contextmanager
+
+from test_util import metrics, perf_timeline
+from test_util.browser_pool import BrowserPool
+
+
+class VirtualUser:
+    """State of one virtual user: its driver, think time and the sink its measures go to"""
+
+    def __init__(self, user_id, driver, sink, think_time=(0, 0), browser_metrics=False):
+        """
+        :param user_id: index of the virtual user
+        :param driver: Selenium WebDriver instance leased to the user
+        :param sink: metrics sink the interaction records are emitted to
+        :param think_time: (min, max) seconds waited by think()
+        :param browser_metrics: drain the PerformanceObserver entries after every interaction
+        """
+        self.user_id = user_id
+        self.driver = driver
+        self.sink = sink
+        self.think_time = think_time
+        self.browser_metrics = browser_metrics
+        self.iteration = 0
+
+    @contextmanager
+    def interaction(self, name):
+        """Time the enclosed page-object calls as one interaction, like print_timing does for the test suite"""
+        start = time.time()
+        error_msg = 'Success'
+        success = True
+        browser_metrics = {}
+        try:
+            yield
+            if self.browser_metrics:
+                browser_metrics = perf_timeline.drain(self.driver).summary()
+        except Exception as e:
+            success = False
+            error_msg = f"Failed measure: {name} - {type(e).__name__}"
+            raise
+        finally:
+            end = time.time()
+            self.sink.emit({'timestamp': round(end * 1000), 'timing': str(int((end - start) * 1000)),
+                            'interaction': name, 'error_msg': error_msg, 'success': success,
+                            'user': self.user_id, 'iteration': self.iteration, **browser_metrics})
+
+    def think(self):
+        """Pause like a real user between two steps"""
+        low, high = self.think_time
+        if high > 0:
+            time.sleep(random.uniform(low, high))
+
+
+class LoadReport:
+    """Throughput and latency percentiles of a load run"""
+
+    def __init__(self, records, elapsed, iterations, failed_iterations):
+        self.records = records
+        self.elapsed = elapsed
+        self.iterations = iterations
+        self.failed_iterations = failed_iterations
+
+    def summary(self):
+        """Percentiles and throughput (interactions per second) of every interaction"""
+        timings, failures = {}, {}
+        for record in self.records:
+            timings.setdefault(record['interaction'], []).append(int(record['timing']))
+            if not record['success']:
+                failures[record['interaction']] = failures.get(record['interaction'], 0) + 1
+        summary = metrics.aggregate(timings, failures)
+        for row in summary.values():
+            row['throughput'] = round(row['count'] / self.elapsed, 2) if self.elapsed else 0
+        return summary
+
+    def format(self):
+        """Format the report as the lines of a table"""
+        summary = self.summary()
+        lines = [f"elapsed={self.elapsed:.1f}s iterations={self.iterations} failed={self.failed_iterations} "
+                 f"throughput={self.iterations / self.elapsed if self.elapsed else 0:.2f} it/s"]
+        table = metrics.format_summary(summary)
+        lines.append(f"{table[0]} {'per sec':>9}")
+        for line, row in zip(table[1:], summary.values()):
+            lines.append(f"{line} {row['throughput']:>9}")
+        return lines
+
+
+def _run_user(user_id, scenarios, driver_factory, users, ramp_up, deadline, iterations, think_time,
+              browser_metrics, sink=None):
+    """Body of a virtual user. Returns its records, iteration count and failed iteration count."""
+    sink = sink if sink is not None else metrics.MemorySink()
+    if ramp_up and users > 1:
+        time.sleep(ramp_up * user_id / users)
+
+    pool = BrowserPool(driver_factory, size=1)
+    completed = failed = 0
+    scenario_cycle = itertools.cycle(scenarios)
+
+    def running():
+        return (iterations is None or completed < iterations) and (deadline is None or time.time() < deadline)
+
+    try:
+        while running():
+            slot = pool.acquire()
+            vu = VirtualUser(user_id, slot.driver, sink, think_time=think_time, browser_metrics=browser_metrics)
+            try:
+                while running():
+                    vu.iteration = completed
+                    try:
+                        next(scenario_cycle)(vu)
+                    except Exception:
+                        failed += 1
+                        completed += 1
+                        # Reset the driver (or replace it when the session died) before the next iteration
+                        break
+                    completed += 1
+                    vu.think()
+            finally:
+                pool.release(slot)
+    finally:
+        pool.close()
+    records = sink.records if isinstance(sink, metrics.MemorySink) else []
+    return records, completed, failed
+
+
+class LoadRunner:
+    """Run scenarios as N virtual users on a thread or process pool"""
+
+    def __init__(self, scenarios, driver_factory, users=1, ramp_up=0, duration=None, iterations=None,
+                 think_time=(0, 0), executor='thread', browser_metrics=False):
+        """
+        :param scenarios: scenario functions, every virtual user runs them in turn
+        :param driver_factory: picklable callable launching a driver, e.g. partial(create_driver, 'chrome', dir)
+        :param users: number of virtual users
+        :param ramp_up: seconds over which the virtual users are started
+        :param duration: seconds each virtual user keeps iterating
+        :param iterations: number of scenario iterations per virtual user
+        :param think_time: (min, max) seconds between two iterations
+        :param executor: 'thread' or 'process'
+        :param browser_metrics: also collect the PerformanceObserver columns for every interaction
+        """
+        if duration is None and iterations is None:
+            raise ValueError('Either a duration or a number of iterations is needed')
+        if executor not in ('thread', 'process'):
+            raise ValueError(f'Unsupported executor: {executor}')
+        self.scenarios = list(scenarios)
+        self.driver_factory = driver_factory
+        self.users = users
+        self.ramp_up = ramp_up
+        self.duration = duration
+        self.iterations = iterations
+        self.think_time = think_time
+        self.executor = executor
+        self.browser_metrics = browser_metrics
+
+    def run(self):
+        """Run the load and return a LoadReport"""
+        start = time.time()
+        deadline = start + self.ramp_up + self.duration if self.duration is not None else None
+        executor_class = ThreadPoolExecutor if self.executor == 'thread' else ProcessPoolExecutor
+        # Threads share one sink, processes send their records back when they are done
+        sink = metrics.MemorySink() if self.executor == 'thread' else None
+        run_user = functools.partial(_run_user, scenarios=self.scenarios, driver_factory=self.driver_factory,
+                                     users=self.users, ramp_up=self.ramp_up, deadline=deadline,
+                                     iterations=self.iterations, think_time=self.think_time,
+                                     browser_metrics=self.browser_metrics, sink=sink)
+        records, completed, failed = [], 0, 0
+        with executor_class(max_workers=self.users) as executor:
+            for user_records, user_completed, user_failed in executor.map(run_user, range(self.users)):
+                if sink is None:
+                    records.extend(user_records)
+                completed += user_completed
+                failed += user_failed
+        if sink is not None:
+            records = sink.records
+        return LoadReport(records, time.time() - start, completed, failed)
+
+
+def _think_time(value):
+    low, _, high = value.partition('-')
+    return float(low), float(high or low)
+
+
+def main(argv=None):
+    from test_util import scenarios
+    from test_util.driver_factory import create_driver
+
+    parser = argparse.ArgumentParser(description='Run page-object scenarios as concurrent virtual users')
+    parser.add_argument('--scenario', action='append', choices=sorted(scenarios.SCENARIOS),
+                        help='scenario to run, can be repeated. default: every scenario')
+    parser.add_argument('--users', type=int, default=1, help='number of virtual users. default: 1')
+    parser.add_argument('--ramp-up', type=float, default=0, help='seconds to start all users. default: 0')
+    parser.add_argument('--duration', type=float, help='seconds to run after the ramp up')
+    parser.add_argument('--iterations', type=int, help='scenario iterations per user')
+    parser.add_argument('--think-time', type=_think_time, default=(0, 0),
+                        help='seconds between iterations, a value or a min-max range. default: 0')
+    parser.add_argument('--executor', choices=('thread', 'process'), default='thread', help='default: thread')
+    parser.add_argument('--driver', default='chrome', help='default: chrome, option: firefox')
+    parser.add_argument('--browser-metrics', action='store_true', help='collect PerformanceObserver metrics')
+    parser.add_argument('--metrics-sink', choices=('csv', 'jsonl'), default='csv', help='default: csv')
+    parser.add_argument('--metrics-file', help='write every interaction record to this file')
+    args = parser.parse_args(argv)
+    if args.duration is None and args.iterations is None:
+        args.iterations = 1
+
+    download_dir = tempfile.mkdtemp(prefix='load_runner_')
+    runner = LoadRunner([scenarios.SCENARIOS[name] for name in args.scenario or sorted(scenarios.SCENARIOS)],
+                        driver_factory=functools.partial(create_driver, args.driver, download_dir),
+                        users=args.users, ramp_up=args.ramp_up, duration=args.duration,
+                        iterations=args.iterations, think_time=args.think_time, executor=args.executor,
+                        browser_metrics=args.browser_metrics)
+    report = runner.run()
+    if args.metrics_file:
+        sink = metrics.build_sink(args.metrics_sink, args.metrics_file, buffer_size=1000)
+        for record in report.records:
+            sink.emit(record)
+        sink.close()
+    for line in report.format():
+        print(line)
+    return 1 if report.failed_iterations else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,203 @@
+import csv
+import json
+import os
+import sys
+import threading
+from collections import defaultdict
+
+# Columns of a timing record, in the order of the historical print_timing CSV line followed by the
+# PerformanceObserver columns of test_util.perf_timeline
+FIELDS = ('timestamp', 'timing', 'memory_usage', 'interaction', 'error_msg', 'success', 'backend_performance',
+          'frontend_performance', 'latency', 'server_response_time', 'page_load_time', 'transfer_page_download_time',
+          'navigated', 'first_contentful_paint', 'largest_contentful_paint', 'cumulative_layout_shift', 'long_tasks',
+          'long_task_time', 'resource_count', 'resource_transfer_size', 'layout_count', 'recalc_style_count',
+          'layout_duration', 'recalc_style_duration', 'script_duration', 'task_duration', 'js_heap_used_size',
+          'dom_nodes', 'js_event_listeners', 'server_timing')
+
+PERCENTILES = (50, 90, 99)
+
+
+def percentile(values, percent):
+    """Return the percentile of the values using linear interpolation between the closest ranks"""
+    if not values:
+        return 0
+    ordered = sorted(values)
+    rank = (len(ordered) - 1) * percent / 100
+    lower = int(rank)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (rank - lower)
+
+
+def aggregate(timings, failures=None):
+    """
+    Compute the p50/p90/p99 timing of every interaction.
+
+    :param timings: dict of interaction name to list of timings in ms
+    :param failures: dict of interaction name to number of failed measures
+    """
+    failures = failures or {}
+    summary = {}
+    for interaction, values in sorted(timings.items()):
+        summary[interaction] = {'count': len(values), 'failures': failures.get(interaction, 0)}
+        for percent in PERCENTILES:
+            summary[interaction][f'p{percent}'] = round(percentile(values, percent), 1)
+    return summary
+
+
+def format_summary(summary):
+    """Format the aggregated timings as the lines of a table"""
+    lines = [f"{'interaction':40} {'count':>6} {'failed':>6} " + ' '.join(f'{f"p{p}":>9}' for p in PERCENTILES)]
+    for interaction, row in summary.items():
+        lines.append(f"{interaction:40} {row['count']:>6} {row['failures']:>6} " +
+                     ' '.join(f"{row[f'p{p}']:>9}" for p in PERCENTILES))
+    return lines
+
+
+class MetricsSink:
+    """
+    Base class of the destinations of print_timing records.
+
+    Records are buffered and handed to `write` in batches of `buffer_size`. Every sink also keeps the timings per
+    interaction so that percentiles can be reported at the end of the session.
+    """
+
+    def __init__(self, buffer_size=100):
+        self.buffer_size = buffer_size
+        self.timings = defaultdict(list)
+        self.failures = defaultdict(int)
+        self._buffer = []
+        self._lock = threading.Lock()
+
+    def emit(self, record):
+        """Add a timing record to the sink"""
+        with self._lock:
+            self.timings[record['interaction']].append(int(record['timing']))
+            if not record['success']:
+                self.failures[record['interaction']] += 1
+            self._buffer.append(record)
+            if len(self._buffer) >= self.buffer_size:
+                self._flush()
+
+    def flush(self):
+        """Write the buffered records"""
+        with self._lock:
+            self._flush()
+
+    def close(self):
+        self.flush()
+
+    def summary(self):
+        """Return the p50/p90/p99 timing of every interaction recorded so far"""
+        with self._lock:
+            return aggregate(self.timings, self.failures)
+
+    def write(self, records):
+        raise NotImplementedError
+
+    def _flush(self):
+        if self._buffer:
+            records, self._buffer = self._buffer, []
+            self.write(records)
+
+
+class MemorySink(MetricsSink):
+    """Keep every record in memory, mainly for tests and the load runner"""
+
+    def __init__(self, buffer_size=1):
+        super().__init__(buffer_size=buffer_size)
+        self.records = []
+
+    def write(self, records):
+        self.records.extend(records)
+
+
+class FileSink(MetricsSink):
+    """
+    Base class for sinks writing to a file, or to stdout when the file name is '-'.
+
+    The file is opened on the first write so that runs without any measure do not leave empty files behind. It is
+    truncated then, every run writes its own records under the header of the current FIELDS.
+    """
+
+    def __init__(self, file_name, buffer_size=100):
+        super().__init__(buffer_size=buffer_size)
+        self.file_name = file_name
+        self._file = None
+
+    def close(self):
+        super().close()
+        if self._file not in (None, sys.stdout):
+            self._file.close()
+
+    def write(self, records):
+        if self._file is None:
+            self._open()
+        self._write(records)
+        self._file.flush()
+
+    def _open(self):
+        if self.file_name == '-':
+            self._file = sys.stdout
+        else:
+            os.makedirs(os.path.dirname(os.path.abspath(self.file_name)), exist_ok=True)
+            self._file = open(self.file_name, mode='w', newline='', encoding='utf-8')
+        self._opened()
+
+    def _opened(self):
+        pass
+
+    def _write(self, records):
+        raise NotImplementedError
+
+
+class CsvSink(FileSink):
+    """Write records as CSV lines with the print_timing columns"""
+
+    def _opened(self):
+        self._writer = csv.DictWriter(self._file, fieldnames=FIELDS, extrasaction='ignore')
+        self._writer.writeheader()
+
+    def _write(self, records):
+        self._writer.writerows(records)
+
+
+class JsonlSink(FileSink):
+    """Write one JSON object per record"""
+
+    def _write(self, records):
+        self._file.writelines(json.dumps(record, default=str) + '\n' for record in records)
+
+
+SINKS = {'csv': CsvSink, 'jsonl': JsonlSink, 'memory': MemorySink}
+
+_sink = None
+
+
+def build_sink(kind, file_name=None, buffer_size=100):
+    """
+    Create a sink by name.
+
+    :param kind: csv, jsonl or memory
+    :param file_name: destination of the file sinks, '-' for stdout
+    :param buffer_size: number of records written at once
+    """
+    if kind not in SINKS:
+        raise ValueError(f'Unsupported metrics sink: {kind}')
+    if kind == 'memory':
+        return MemorySink(buffer_size=buffer_size)
+    return SINKS[kind](file_name, buffer_size=buffer_size)
+
+
+def set_sink(sink):
+    """Install the sink print_timing records go to and return the previous one"""
+    global _sink
+    previous, _sink = _sink, sink
+    return previous
+
+
+def get_sink():
+    """Return the installed sink, falling back to an in-memory sink"""
+    global _sink
+    if _sink is None:
+        _sink = MemorySink()
+    return _sink
@@ -0,0 +1,345 @@
+"""
+Performance history of the test runs.
+
+Every run stored with --perf-history adds its per-test durations and its print_timing interaction timings to a
+SQLite file, keyed by commit, browser and date. The report compares the latest run of a browser with a baseline
+window of the runs before it: a one-sided Mann-Whitney U test flags the interactions that got significantly slower.
+A test has one duration per run, it is flagged when its latest duration exceeds the 95th percentile of its baseline
+durations by MIN_SLOWDOWN. Every interaction gets a latency histogram and its percentile trend across runs.
+
+    python -m test_util.perf_history --db results/perf_history.sqlite --report results/perf_report.html
+"""
+import argparse
+import html
+import math
+import os
+import socket
+import sqlite3
+import statistics
+import subprocess
+import sys
+from collections import defaultdict
+from datetime import datetime
+
+from test_util.metrics import percentile
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    started TEXT NOT NULL,
+    commit_sha TEXT NOT NULL,
+    browser TEXT NOT NULL,
+    host TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS samples (
+    run_id INTEGER NOT NULL REFERENCES runs(id),
+    kind TEXT NOT NULL,
+    name TEXT NOT NULL,
+    ms REAL NOT NULL,
+    outcome TEXT
+);
+CREATE INDEX IF NOT EXISTS samples_run ON samples(run_id, kind, name);
+CREATE INDEX IF NOT EXISTS runs_browser ON runs(browser, id);
+"""
+
+# Runs before the latest one its samples are compared with
+BASELINE_RUNS = 5
+# Significance level of the regression test
+ALPHA = 0.01
+# Smaller relative increases of the median are not reported, however significant
+MIN_SLOWDOWN = 0.05
+# Samples needed on each side before testing, the normal approximation is meaningless below
+MIN_SAMPLES = 5
+# Baseline samples needed to judge a single observation, such as the duration of a test in the latest run
+MIN_BASELINE_SINGLE = 3
+# Runs shown in the trend charts
+TREND_RUNS = 30
+
+
+def current_commit(cwd=None):
+    """Short hash of the checked out commit, 'unknown' outside a git work tree"""
+    try:
+        result = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=cwd, capture_output=True, text=True,
+                                timeout=10)
+    except (OSError, subprocess.SubprocessError):
+        return 'unknown'
+    return result.stdout.strip() if result.returncode == 0 else 'unknown'
+
+
+class PerfHistory:
+    """Runs and their samples in a SQLite file"""
+
+    def __init__(self, db_path):
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        self.connection = sqlite3.connect(db_path)
+        self.connection.executescript(SCHEMA)
+
+    def close(self):
+        self.connection.close()
+
+    def record_run(self, browser, tests, interactions, commit=None, started=None):
+        """
+        Store one run and return its id.
+
+        :param browser: browser the run used
+        :param tests: dict of test node id to (duration in ms, outcome)
+        :param interactions: dict of interaction name to list of timings in ms
+        :param commit: commit of the run, by default the checked out one
+        :param started: datetime of the run, by default now
+        """
+        with self.connection:
+            cursor = self.connection.execute(
+                'INSERT INTO runs (started, commit_sha, browser, host) VALUES (?, ?, ?, ?)',
+                ((started or datetime.now()).isoformat(timespec='seconds'), commit or current_commit(), browser,
+                 socket.gethostname()))
+            run_id = cursor.lastrowid
+            self.connection.executemany(
+                'INSERT INTO samples (run_id, kind, name, ms, outcome) VALUES (?, ?, ?, ?, ?)',
+                [(run_id, 'test', nodeid, ms, outcome) for nodeid, (ms, outcome) in tests.items()]
+                + [(run_id, 'interaction', name, ms, None) for name, values in interactions.items() for ms in values])
+        return run_id
+
+    def runs(self, browser=None):
+        """Runs as dicts in the order they were stored, optionally of one browser"""
+        query = 'SELECT id, started, commit_sha, browser, host FROM runs'
+        if browser:
+            rows = self.connection.execute(query + ' WHERE browser = ? ORDER BY id', (browser,))
+        else:
+            rows = self.connection.execute(query + ' ORDER BY id')
+        return [dict(zip(('id', 'started', 'commit', 'browser', 'host'), row)) for row in rows]
+
+    def samples(self, run_ids, kind):
+        """Samples of the runs: {name: {run id: [ms]}}. Failed tests are left out"""
+        samples = defaultdict(lambda: defaultdict(list))
+        if not run_ids:
+            return samples
+        rows = self.connection.execute(
+            f"SELECT run_id, name, ms FROM samples WHERE kind = ? AND (outcome IS NULL OR outcome != 'failed') "
+            f"AND run_id IN ({', '.join('?' * len(run_ids))})", (kind, *run_ids))
+        for run_id, name, ms in rows:
+            samples[name][run_id].append(ms)
+        return samples
+
+
+def mann_whitney_greater(current, baseline):
+    """
+    One-sided Mann-Whitney U test of current being stochastically greater (slower) than baseline. Returns the
+    p-value from the normal approximation with tie and continuity corrections.
+    """
+    n1, n2 = len(current), len(baseline)
+    ranked = sorted([(value, 0) for value in current] + [(value, 1) for value in baseline])
+    ranks = [0.0] * len(ranked)
+    tie_term = 0
+    start = 0
+    while start < len(ranked):
+        end = start
+        while end + 1 < len(ranked) and ranked[end + 1][0] == ranked[start][0]:
+            end += 1
+        for index in range(start, end + 1):
+            ranks[index] = (start + end) / 2 + 1
+        tie_term += (end - start + 1) ** 3 - (end - start + 1)
+        start = end + 1
+    u = sum(rank for rank, (_, group) in zip(ranks, ranked) if group == 0) - n1 * (n1 + 1) / 2
+    n = n1 + n2
+    variance = n1 * n2 / 12 * ((n + 1) - tie_term / (n * (n - 1)))
+    if variance <= 0:
+        return 1.0
+    z = (u - n1 * n2 / 2 - 0.5) / math.sqrt(variance)
+    return 0.5 * math.erfc(z / math.sqrt(2))
+
+
+def compare(current, baseline, alpha=ALPHA, min_slowdown=MIN_SLOWDOWN):
+    """
+    Compare the samples of one name. Returns a dict with the medians, the relative change, the p-value (None when
+    there are too few samples) and whether it is a regression. A single current sample, the duration of a test in
+    the latest run, is a regression when it exceeds the 95th percentile of the baseline by min_slowdown.
+    """
+    row = {'current': len(current), 'baseline': len(baseline), 'current_p50': None, 'baseline_p50': None,
+           'baseline_p95': None, 'change': None, 'p_value': None, 'regression': False}
+    if not current or not baseline:
+        return row
+    row['current_p50'] = statistics.median(current)
+    row['baseline_p50'] = statistics.median(baseline)
+    if row['baseline_p50']:
+        row['change'] = row['current_p50'] / row['baseline_p50'] - 1
+    if len(current) >= MIN_SAMPLES and len(baseline) >= MIN_SAMPLES:
+        row['p_value'] = mann_whitney_greater(current, baseline)
+        row['regression'] = row['p_value'] < alpha and (row['change'] or 0) >= min_slowdown
+    elif len(current) == 1 and len(baseline) >= MIN_BASELINE_SINGLE:
+        row['baseline_p95'] = percentile(baseline, 95)
+        row['regression'] = current[0] > row['baseline_p95'] * (1 + min_slowdown)
+    return row
+
+
+class Analysis:
+    """Latest run of a browser compared with its baseline window"""
+
+    def __init__(self, history, browser=None, baseline_runs=BASELINE_RUNS, alpha=ALPHA):
+        runs = history.runs(browser)
+        if not browser and runs:
+            runs = [run for run in runs if run['browser'] == runs[-1]['browser']]
+        self.runs = runs
+        self.alpha = alpha
+        self.latest = runs[-1] if runs else None
+        self.baseline = runs[-baseline_runs - 1:-1]
+        self.comparisons = {}
+        self.samples = {}
+        if self.latest is None:
+            return
+        baseline_ids = {run['id'] for run in self.baseline}
+        run_ids = sorted({run['id'] for run in runs[-TREND_RUNS:]} | baseline_ids)
+        for kind in ('interaction', 'test'):
+            self.samples[kind] = history.samples(run_ids, kind)
+            for name, per_run in self.samples[kind].items():
+                baseline = [ms for run_id, values in per_run.items() if run_id in baseline_ids for ms in values]
+                self.comparisons[(kind, name)] = compare(per_run.get(self.latest['id'], []), baseline, alpha)
+
+    def regressions(self):
+        """[(kind, name, comparison)] of the significant slowdowns, largest first"""
+        flagged = [(kind, name, row) for (kind, name), row in self.comparisons.items() if row['regression']]
+        return sorted(flagged, key=lambda item: item[2]['change'], reverse=True)
+
+
+def format_regressions(regressions):
+    """Lines of the terminal summary"""
+    return [f"{kind:<12}{name[:60]:<61}{row['baseline_p50']:>9.0f} -> {row['current_p50']:<9.0f}"
+            f"{row['change']:>+8.1%}  "
+            + (f"p={row['p_value']:.4f}" if row['p_value'] is not None else f"> p95 {row['baseline_p95']:.0f}")
+            for kind, name, row in regressions]
+
+
+def _histogram_svg(current, baseline, bins=20, width=360, height=120):
+    values = current + baseline
+    low, high = min(values), max(values)
+    step = (high - low) / bins or 1
+
+    def counts(samples):
+        result = [0] * bins
+        for value in samples:
+            result[min(int((value - low) / step), bins - 1)] += 1
+        return [count / len(samples) if samples else 0 for count in result]
+
+    current_share, baseline_share = counts(current), counts(baseline)
+    top = max(current_share + baseline_share) or 1
+    bar = width / bins
+    parts = []
+    for index in range(bins):
+        for share, color, offset in ((baseline_share[index], '#9aa5b1', 0), (current_share[index], '#d9534f', 0.5)):
+            bar_height = share / top * (height - 20)
+            parts.append(f'<rect x="{index * bar + offset * bar:.1f}" y="{height - 15 - bar_height:.1f}" '
+                         f'width="{bar / 2:.1f}" height="{bar_height:.1f}" fill="{color}"/>')
+    parts.append(f'<text x="0" y="{height - 2}" font-size="10">{low:.0f} ms</text>')
+    parts.append(f'<text x="{width}" y="{height - 2}" font-size="10" text-anchor="end">{high:.0f} ms</text>')
+    return f'<svg width="{width}" height="{height}">{"".join(parts)}</svg>'
+
+
+def _trend_svg(points, width=360, height=120):
+    """points: [(label, p50, p90)] in run order"""
+    top = max(p90 for _, _, p90 in points) or 1
+    step = width / max(len(points) - 1, 1)
+
+    def line(index, color):
+        coordinates = ' '.join(f'{position * step:.1f},{height - 15 - point[index] / top * (height - 25):.1f}'
+                               for position, point in enumerate(points))
+        return f'<polyline points="{coordinates}" fill="none" stroke="{color}" stroke-width="1.5"/>'
+
+    return (f'<svg width="{width}" height="{height}">{line(2, "#f0ad4e")}{line(1, "#337ab7")}'
+            f'<text x="0" y="{height - 2}" font-size="10">{html.escape(points[0][0])}</text>'
+            f'<text x="{width}" y="{height - 2}" font-size="10" text-anchor="end">{html.escape(points[-1][0])}</text>'
+            f'<text x="0" y="10" font-size="10">max {top:.0f} ms</text></svg>')
+
+
+def render_report(analysis):
+    """HTML page of an Analysis"""
+    escape = html.escape
+    if analysis.latest is None:
+        return '<html><body><p>No runs recorded yet.</p></body></html>'
+    latest = analysis.latest
+    rows = []
+    for (kind, name), row in sorted(analysis.comparisons.items(), key=lambda item: (not item[1]['regression'],
+                                                                                    item[0])):
+        if row['current_p50'] is None:
+            continue
+        rows.append(
+            f"<tr class=\"{'regression' if row['regression'] else ''}\"><td>{kind}</td><td>{escape(name)}</td>"
+            f"<td>{row['baseline']}</td><td>{row['baseline_p50']:.0f}</td><td>{row['current']}</td>"
+            f"<td>{row['current_p50']:.0f}</td>"
+            f"<td>{'' if row['change'] is None else format(row['change'], '+.1%')}</td>"
+            f"<td>{'' if row['p_value'] is None else format(row['p_value'], '.4f')}</td></tr>")
+
+    labels = {run['id']: f"{run['commit']} {run['started'][5:16]}" for run in analysis.runs}
+    baseline_ids = {run['id'] for run in analysis.baseline}
+    charts = []
+    for name, per_run in sorted(analysis.samples.get('interaction', {}).items()):
+        current = per_run.get(latest['id'], [])
+        baseline = [ms for run_id, values in per_run.items() if run_id in baseline_ids for ms in values]
+        points = [(labels[run_id], percentile(values, 50), percentile(values, 90))
+                  for run_id, values in sorted(per_run.items())]
+        charts.append(f"<div class=\"chart\"><h3>{escape(name)}</h3>"
+                      f"{_histogram_svg(current, baseline) if current or baseline else ''}"
+                      f"{_trend_svg(points) if len(points) > 1 else ''}</div>")
+
+    return f"""<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+<title>Performance report {escape(latest['commit'])}</title>
+<style>
+body {{ font-family: sans-serif; margin: 20px; }}
+table {{ border-collapse: collapse; }}
+td, th {{ border: 1px solid #ccc; padding: 3px 8px; text-align: right; }}
+td:nth-child(2) {{ text-align: left; }}
+tr.regression {{ background: #f8d7da; }}
+.chart {{ display: inline-block; margin: 10px; vertical-align: top; }}
+.chart h3 {{ font-size: 13px; }}
+</style>
+</head>
+<body>
+<h1>Performance report</h1>
+<p>Latest run {latest['id']}: commit {escape(latest['commit'])}, {escape(latest['browser'])}, {latest['started']},
+{escape(latest['host'])}. Baseline: the {len(analysis.baseline)} previous {escape(latest['browser'])} runs.
+{len(analysis.regressions())} significant regressions (one-sided Mann-Whitney U, p &lt; {analysis.alpha},
+median at least {MIN_SLOWDOWN:.0%} slower, {MIN_SAMPLES} samples or more on each side).</p>
+<h2>Latest run against the baseline (ms)</h2>
+<table>
+<tr><th>kind</th><th>name</th><th>baseline n</th><th>baseline p50</th><th>latest n</th><th>latest p50</th>
+<th>change</th><th>p-value</th></tr>
+{''.join(rows)}
+</table>
+<h2>Interactions</h2>
+<p>Histograms: baseline in grey, latest run in red. Trends: p50 in blue, p90 in orange, last {TREND_RUNS} runs.</p>
+{''.join(charts)}
+</body>
+</html>
+"""
+
+
+def write_report(history, file_name, browser=None, baseline_runs=BASELINE_RUNS):
+    """Analyse the latest run of a browser, write the HTML report and return the Analysis"""
+    analysis = Analysis(history, browser, baseline_runs)
+    os.makedirs(os.path.dirname(os.path.abspath(file_name)), exist_ok=True)
+    with open(file_name, 'w', encoding='utf-8') as file:
+        file.write(render_report(analysis))
+    return analysis
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Write the performance report of the stored runs')
+    parser.add_argument('--db', default='results/perf_history.sqlite', help='default: results/perf_history.sqlite')
+    parser.add_argument('--report', default='results/perf_report.html', help='default: results/perf_report.html')
+    parser.add_argument('--browser', help='browser of the runs compared. default: the browser of the latest run')
+    parser.add_argument('--baseline-runs', type=int, default=BASELINE_RUNS,
+                        help=f'runs before the latest one used as baseline. default: {BASELINE_RUNS}')
+    args = parser.parse_args(argv)
+    history = PerfHistory(args.db)
+    try:
+        analysis = write_report(history, args.report, args.browser, args.baseline_runs)
+    finally:
+        history.close()
+    for line in format_regressions(analysis.regressions()):
+        print(line)
+    return 1 if analysis.regressions() else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,171 @@
+"""
+Browser performance timeline collected with PerformanceObserver.
+
+The observers buffer their entries in the page (`window.__perfTimeline`). Every drain returns the entries recorded
+since the previous drain, so that interactions which never navigate, like `showPage()` in test_site/index.html, still
+get their own resource, paint, long task and layout shift entries. Draining is one round-trip per interaction.
+
+`buffered: true` replays the navigation, resource and paint entries to an observer created late, but not the long
+tasks. On Chromium install() therefore adds the observers to every new document with
+Page.addScriptToEvaluateOnNewDocument, before the page runs. Other browsers get them from the first drain of a
+document, the long tasks of the first interaction on each document are missed there.
+"""
+import json
+import weakref
+
+from selenium.common.exceptions import WebDriverException
+
+# Entry types observed when the browser supports them
+ENTRY_TYPES = ('navigation', 'resource', 'paint', 'largest-contentful-paint', 'longtask', 'layout-shift')
+
+# Maximum number of entries kept in the page between two drains
+MAX_BUFFERED_ENTRIES = 5000
+
+# Drivers whose new documents get the observers
+_INSTALLED = weakref.WeakSet()
+
+# Creates window.__perfTimeline and its observers unless the document has them already
+INSTALL_FUNCTION = """
+function (maxEntries, entryTypes) {
+    if (window.__perfTimeline) {
+        return;
+    }
+    const timeline = {entries: [], dropped: 0, observers: [], navigation: null, lastDrain: 0};
+    const push = entries => {
+        for (const entry of entries) {
+            const json = entry.toJSON();
+            if (entry.entryType === 'navigation') {
+                timeline.navigation = json;
+            }
+            if (timeline.entries.length < maxEntries) {
+                timeline.entries.push(json);
+            } else {
+                timeline.dropped += 1;
+            }
+        }
+    };
+    const supported = PerformanceObserver.supportedEntryTypes || [];
+    for (const type of entryTypes.filter(type => supported.includes(type))) {
+        const observer = new PerformanceObserver(list => push(list.getEntries()));
+        observer.observe({type: type, buffered: true});
+        timeline.observers.push(observer);
+    }
+    timeline.push = push;
+    window.__perfTimeline = timeline;
+}
+"""
+
+DRAIN_JS = '(' + INSTALL_FUNCTION.strip() + ')(arguments[0], arguments[1]);' + """
+const timeline = window.__perfTimeline;
+// Entries queued in the observers are only dispatched asynchronously, take them now
+for (const observer of timeline.observers) {
+    timeline.push(observer.takeRecords());
+}
+const now = performance.now();
+const memory = window.performance.memory;
+const result = {
+    url: window.location.href,
+    since: timeline.lastDrain,
+    now: now,
+    entries: timeline.entries,
+    dropped: timeline.dropped,
+    navigation: timeline.navigation,
+    usedJSHeapSize: memory ? memory.usedJSHeapSize : null
+};
+timeline.entries = [];
+timeline.dropped = 0;
+timeline.lastDrain = now;
+return result;
+"""
+
+
+class TimelineSnapshot:
+    """Entries recorded in the page between two drains"""
+
+    def __init__(self, data):
+        self.url = data['url']
+        self.since = data['since']
+        self.now = data['now']
+        self.entries = data['entries']
+        self.dropped = data['dropped']
+        self.navigation = data['navigation']
+        self.used_js_heap_size = data['usedJSHeapSize']
+
+    def of_type(self, entry_type):
+        """Return the entries of one type, e.g. 'resource'"""
+        return [entry for entry in self.entries if entry['entryType'] == entry_type]
+
+    @property
+    def navigated(self):
+        """True when a document was loaded during the interaction"""
+        return bool(self.of_type('navigation'))
+
+    def paint(self, name):
+        """Return the start time of a paint entry such as 'first-contentful-paint', or 0"""
+        return next((entry['startTime'] for entry in self.of_type('paint') if entry['name'] == name), 0)
+
+    def summary(self):
+        """
+        Summarise the snapshot as the browser columns of a print_timing record.
+
+        The navigation columns keep their historical meaning and are computed from the navigation entry of the
+        current document. Times are in ms, rounded to one decimal.
+        """
+        navigation = self.navigation or {}
+        lcp = self.of_type('largest-contentful-paint')
+        shifts = [entry for entry in self.of_type('layout-shift') if not entry.get('hadRecentInput')]
+        resources = self.of_type('resource')
+
+        def nav(end, start=None):
+            if not navigation:
+                return 0
+            return round(navigation[end] - (navigation[start] if start else 0), 1)
+
+        return {
+            'memory_usage': round(self.used_js_heap_size / (1024 * 1024), 2) if self.used_js_heap_size else 0,
+            'backend_performance': nav('responseStart'),
+            'frontend_performance': nav('domComplete', 'responseStart'),
+            'latency': nav('responseStart', 'fetchStart'),
+            'server_response_time': nav('responseStart', 'requestStart'),
+            'page_load_time': nav('loadEventStart'),
+            'transfer_page_download_time': nav('responseEnd', 'responseStart'),
+            'navigated': self.navigated,
+            'first_contentful_paint': round(self.paint('first-contentful-paint'), 1),
+            'largest_contentful_paint': round(lcp[-1]['startTime'], 1) if lcp else 0,
+            'cumulative_layout_shift': round(sum(entry['value'] for entry in shifts), 4),
+            'long_tasks': len(self.of_type('longtask')),
+            'long_task_time': round(sum(entry['duration'] for entry in self.of_type('longtask')), 1),
+            'resource_count': len(resources),
+            'resource_transfer_size': sum(entry.get('transferSize', 0) for entry in resources),
+            # Server-Timing durations of the document, sent by test_util/site_server.py
+            'server_timing': round(sum(metric['duration'] for metric in navigation.get('serverTiming', [])), 1),
+        }
+
+
+def install(driver, max_entries=MAX_BUFFERED_ENTRIES):
+    """
+    Install the observers in every document the driver loads from now on and in the current one, once per driver.
+    Returns False for drivers without the DevTools protocol, their observers are installed by the first drain.
+    """
+    if driver in _INSTALLED:
+        return True
+    if not hasattr(driver, 'execute_cdp_cmd'):
+        return False
+    source = f'({INSTALL_FUNCTION.strip()})({max_entries}, {json.dumps(list(ENTRY_TYPES))});'
+    try:
+        driver.execute_cdp_cmd('Page.addScriptToEvaluateOnNewDocument', {'source': source})
+        driver.execute_script(source)
+    except WebDriverException:
+        return False
+    _INSTALLED.add(driver)
+    return True
+
+
+def drain(driver, max_entries=MAX_BUFFERED_ENTRIES):
+    """
+    Install the observers in the current page if needed and return the entries buffered since the last drain.
+
+    :param driver: Selenium WebDriver instance
+    :param max_entries: cap of the in-page buffer, extra entries are counted as dropped
+    """
+    return TimelineSnapshot(driver.execute_script(DRAIN_JS, max_entries, list(ENTRY_TYPES)))
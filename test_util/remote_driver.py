@@ -0,0 +1,175 @@
+"""
+Remote WebDriver sessions over a pooled keep-alive HTTP client.
+
+--driver=remote sends the commands of every test to a W3C endpoint (Selenium Grid, a browser node, or a locally
+started chromedriver or geckodriver standing in for one). Each driver keeps its HTTP connections open in a urllib3
+pool sized by --remote-pool-size, so a command costs one round-trip instead of a TCP (and TLS) setup plus the
+round-trip. PooledRemoteConnection records the round-trip time of every command and whether it had to open a new
+connection; RemoteEndpoint.probe measures the bare round-trip of GET /status, the part of every command that is
+network and HTTP overhead rather than browser work.
+"""
+import threading
+import time
+
+import urllib3
+from selenium import webdriver
+from selenium.webdriver.remote.client_config import ClientConfig
+from selenium.webdriver.remote.remote_connection import RemoteConnection
+
+from test_util.metrics import percentile
+
+# Bare round-trips sent by RemoteEndpoint.probe
+PROBE_COUNT = 20
+
+
+class NetworkStats:
+    """Round-trips of the remote drivers of this process, per command, shared by their connections"""
+
+    def __init__(self):
+        self.commands = {}
+        self.probes = []
+        self._lock = threading.Lock()
+
+    def record(self, command, elapsed, new_connection):
+        with self._lock:
+            count, seconds, connections = self.commands.get(command, (0, 0.0, 0))
+            self.commands[command] = (count + 1, seconds + elapsed, connections + new_connection)
+
+    def record_probe(self, elapsed):
+        with self._lock:
+            self.probes.append(elapsed)
+
+    def to_dict(self):
+        """Plain data sent from the xdist workers to the controller"""
+        with self._lock:
+            return {'commands': {key: list(value) for key, value in self.commands.items()},
+                    'probes': list(self.probes)}
+
+
+class PooledRemoteConnection(RemoteConnection):
+    """RemoteConnection on a keep-alive urllib3 pool that times every command"""
+
+    def __init__(self, url, pool_size=4, connect_timeout=10, read_timeout=120, stats=None):
+        """
+        :param url: W3C endpoint, e.g. http://grid:4444 or the service_url of a started chromedriver
+        :param pool_size: connections kept open to the endpoint
+        :param connect_timeout: seconds to open a connection
+        :param read_timeout: seconds to wait for a response, longer than the slowest page load or script
+        :param stats: NetworkStats the commands are recorded in
+        """
+        client_config = ClientConfig(
+            remote_server_addr=url.rstrip('/'), keep_alive=True,
+            timeout=urllib3.Timeout(connect=connect_timeout, read=read_timeout),
+            # block: at most pool_size connections, a command waits for a free one instead of opening another
+            init_args_for_pool_manager={'init_args_for_pool_manager': {
+                'maxsize': pool_size, 'block': True, 'retries': urllib3.Retry(connect=2, read=0, redirect=3)}})
+        super().__init__(client_config=client_config)
+        self.stats = stats
+        self._command = threading.local()
+
+    def execute(self, command, params):
+        self._command.name = command
+        return super().execute(command, params)
+
+    def status(self):
+        """GET /status of the endpoint, a round-trip without browser work"""
+        return self._request('GET', f'{self._client_config.remote_server_addr}/status')
+
+    def _request(self, method, url, body=None):
+        if self.stats is None:
+            return super()._request(method, url, body=body)
+        pool = self._conn.connection_from_url(url)
+        opened = pool.num_connections
+        start = time.perf_counter()
+        try:
+            return super()._request(method, url, body=body)
+        finally:
+            self.stats.record(getattr(self._command, 'name', method), time.perf_counter() - start,
+                              pool.num_connections > opened)
+
+
+class RemoteEndpoint:
+    """A W3C endpoint shared by the remote drivers of this process or xdist worker"""
+
+    def __init__(self, url=None, browser='chrome', pool_size=4, connect_timeout=10, read_timeout=120):
+        """
+        :param url: W3C endpoint, None to start a local chromedriver or geckodriver as a stand-in
+        :param browser: browser requested from the endpoint, chrome or firefox
+        """
+        self.url = url
+        self.browser = browser
+        self.pool_size = pool_size
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.stats = NetworkStats()
+        self.service = None
+
+    def start(self):
+        """Start the stand-in driver server when no URL was given"""
+        if self.url is None:
+            from test_util.driver_factory import browser_options, start_service
+
+            self.service = start_service(self.browser, browser_options(self.browser, '.'))
+            self.url = self.service.service_url
+        return self
+
+    def connection(self):
+        return PooledRemoteConnection(self.url, pool_size=self.pool_size, connect_timeout=self.connect_timeout,
+                                      read_timeout=self.read_timeout, stats=self.stats)
+
+    def new_driver(self, options):
+        """Start a session with the options of browser_options"""
+        return webdriver.Remote(command_executor=self.connection(), options=options)
+
+    def probe(self, count=PROBE_COUNT):
+        """Time count GET /status round-trips on one warm connection, return their median in seconds"""
+        connection = self.connection()
+        connection.stats = None
+        try:
+            connection.status()
+            for _ in range(count):
+                start = time.perf_counter()
+                connection.status()
+                self.stats.record_probe(time.perf_counter() - start)
+        finally:
+            connection.close()
+        return percentile(self.stats.probes[-count:], 50)
+
+    def close(self):
+        if self.service is not None:
+            self.service.stop()
+            self.service = None
+
+
+def merge_stats(reports):
+    """Merge the NetworkStats.to_dict of several processes"""
+    merged = {'commands': {}, 'probes': []}
+    for report in reports:
+        merged['probes'].extend(report['probes'])
+        for command, (count, seconds, connections) in report['commands'].items():
+            total = merged['commands'].get(command, (0, 0.0, 0))
+            merged['commands'][command] = (total[0] + count, total[1] + seconds, total[2] + connections)
+    return merged
+
+
+def format_network_stats(stats, limit=None):
+    """Format the round-trips per command and the share of them that is network overhead as report lines"""
+    commands = stats['commands']
+    count = sum(value[0] for value in commands.values())
+    if not count:
+        return ['no remote WebDriver commands']
+    seconds = sum(value[1] for value in commands.values())
+    connections = sum(value[2] for value in commands.values())
+    lines = [f"{'command':<30}{'count':>8}{'total s':>10}{'mean ms':>10}{'new conn':>10}"]
+    for command, (calls, elapsed, opened) in sorted(commands.items(), key=lambda item: item[1][1],
+                                                    reverse=True)[:limit]:
+        lines.append(f'{command[:29]:<30}{calls:>8}{elapsed:>10.3f}{elapsed / calls * 1000:>10.1f}{opened:>10}')
+    lines.append(f'{count} commands in {seconds:.2f}s, {connections} connections opened '
+                 f'({(1 - connections / count) * 100:.1f}% of the commands on a kept-alive connection)')
+    if stats['probes']:
+        overhead = percentile(stats['probes'], 50)
+        # The bare round-trip can be a little slower than the fastest commands, the overhead is at most all of it
+        total = min(overhead * count, seconds)
+        lines.append(f'bare round-trip (GET /status) p50 {overhead * 1000:.2f}ms: about {total:.2f}s '
+                     f'({total / seconds * 100:.1f}%) of the command time is network and HTTP overhead')
+    return lines
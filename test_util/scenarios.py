@@ -0,0 +1,103 @@
+"""
+Load scenarios composed from the page objects of pages/local_app.py, run by test_util.load_runner.
+
+Every scenario takes a VirtualUser, drives `vu.driver` and wraps each measured step in `vu.interaction(name)`.
+"""
+from pathlib import Path
+
+from pages.local_app import LoginPage, Dashboard, ItemList, Form
+from test_util.config import TEST_ENV
+
+APP_URL = (Path(__file__).parents[1]/'test_site/index.html').as_uri()
+
+
+def login(vu):
+    """Open the application and log in with the configured user"""
+    login_page = LoginPage(vu.driver)
+    dashboard = Dashboard(vu.driver)
+
+    with vu.interaction('open_login_page'):
+        login_page.go_to_url(APP_URL)
+        login_page.is_page_loaded()
+
+    with vu.interaction('login'):
+        login_page.fill_username(TEST_ENV.username)
+        login_page.fill_password(TEST_ENV.password)
+        login_page.click_login_button()
+        dashboard.is_page_loaded()
+
+
+def logout(vu):
+    """Log out from the dashboard"""
+    with vu.interaction('logout'):
+        Dashboard(vu.driver).click_logout()
+        LoginPage(vu.driver).is_page_loaded()
+
+
+def add_edit_delete_item(vu):
+    """Log in, add an item, rename it, delete it and log out"""
+    dashboard = Dashboard(vu.driver)
+    item_list = ItemList(vu.driver)
+    item_name = f'item {vu.user_id}-{vu.iteration}'
+    updated_item_name = f'updated {item_name}'
+
+    login(vu)
+    vu.think()
+
+    with vu.interaction('open_item_list'):
+        dashboard.click_go_to_item_list()
+        item_list.is_page_loaded()
+
+    with vu.interaction('add_item'):
+        item_list.fill_item_input(item_name)
+        item_list.click_add_item()
+
+    with vu.interaction('edit_item'):
+        item_list.click_edit_by_item_name(item_name)
+        item_list.clear_item_edit_input()
+        item_list.fill_item_edit_input(updated_item_name)
+        item_list.click_save()
+
+    with vu.interaction('delete_item'):
+        item_list.click_delete_by_item_name(updated_item_name)
+
+    with vu.interaction('back_to_dashboard'):
+        item_list.click_go_back_to_dashboard()
+        dashboard.is_page_loaded()
+
+    logout(vu)
+
+
+def submit_form(vu):
+    """Log in, fill and submit the form and log out"""
+    dashboard = Dashboard(vu.driver)
+    form = Form(vu.driver)
+
+    login(vu)
+    vu.think()
+
+    with vu.interaction('open_form'):
+        dashboard.click_go_to_form_page()
+        form.is_page_loaded()
+
+    with vu.interaction('submit_form'):
+        form.fill_text_input(f'load test {vu.user_id}-{vu.iteration}')
+        form.select_dropdown_option('Option B')
+        form.fill_date('01/02/2024')
+        form.select_radio_option('Yes')
+        form.check_agree_checkbox()
+        form.submit_form()
+        form.get_form_message()
+
+    with vu.interaction('back_to_dashboard'):
+        form.click_go_back_to_dashboard()
+        dashboard.is_page_loaded()
+
+    logout(vu)
+
+
+# Scenarios selectable with --scenario
+SCENARIOS = {
+    'add_edit_delete_item': add_edit_delete_item,
+    'submit_form': submit_form,
+}
@@ -0,0 +1,135 @@
+"""
+Duration-aware ordering and sharding of the collected tests.
+
+The duration of every test (setup, call and teardown) is kept in the pytest cache between runs, smoothed over the
+previous runs. Tests are ordered longest-first so that pytest-xdist hands the long ones out early. --shard=i/n splits
+them into n shards of similar total duration with the longest processing time first (LPT) rule. Tests without
+history are estimated from the other parameters of the same test function, then from their module, then from the
+whole suite.
+"""
+import heapq
+import statistics
+
+import pytest
+
+DURATIONS_KEY = 'scheduling/durations'
+# Estimate of a test when nothing is known about the suite yet
+DEFAULT_ESTIMATE = 5.0
+# Weight of the latest run in the stored duration
+SMOOTHING = 0.5
+
+
+def _function_id(nodeid):
+    return nodeid.split('[', 1)[0]
+
+
+def _module_id(nodeid):
+    return nodeid.split('::', 1)[0]
+
+
+class DurationStore:
+    """Test durations of the previous runs, read from and saved to the pytest cache"""
+
+    def __init__(self, cache):
+        self.cache = cache
+        self.durations = dict(cache.get(DURATIONS_KEY, {}))
+        self._current = {}
+        self._groups = None
+
+    def add(self, nodeid, seconds):
+        """Add the duration of one phase of a test of the current run"""
+        self._current[nodeid] = self._current.get(nodeid, 0.0) + seconds
+
+    def save(self):
+        """Merge the durations of the current run into the stored ones"""
+        for nodeid, seconds in self._current.items():
+            previous = self.durations.get(nodeid)
+            self.durations[nodeid] = seconds if previous is None else previous + SMOOTHING * (seconds - previous)
+        self.cache.set(DURATIONS_KEY, {nodeid: round(seconds, 4) for nodeid, seconds in self.durations.items()})
+
+    def estimate(self, nodeid):
+        """Stored duration of a test, or the median of its test function, module or suite for new tests"""
+        if nodeid in self.durations:
+            return self.durations[nodeid]
+        if self._groups is None:
+            self._groups = {}
+            for known, seconds in self.durations.items():
+                for key in (_function_id(known), _module_id(known), ''):
+                    self._groups.setdefault(key, []).append(seconds)
+            self._groups = {key: statistics.median(values) for key, values in self._groups.items()}
+        for key in (_function_id(nodeid), _module_id(nodeid), ''):
+            if key in self._groups:
+                return self._groups[key]
+        return DEFAULT_ESTIMATE
+
+
+def longest_first(items, estimate):
+    """Sort items by decreasing estimated duration, ties keep the collection order"""
+    return sorted(items, key=lambda item: -estimate(item.nodeid))
+
+
+def balanced_shards(items, count, estimate):
+    """
+    Split items into count shards of similar total duration: every test, longest first, goes to the shard with the
+    smallest total so far. Returns the list of (total seconds, items) of every shard, items in collection order.
+    """
+    order = {item.nodeid: position for position, item in enumerate(items)}
+    shards = [(0.0, index, []) for index in range(count)]
+    heapq.heapify(shards)
+    for item in sorted(items, key=lambda item: (-estimate(item.nodeid), order[item.nodeid])):
+        total, index, shard = heapq.heappop(shards)
+        shard.append(item)
+        heapq.heappush(shards, (total + estimate(item.nodeid), index, shard))
+    return [(total, sorted(shard, key=lambda item: order[item.nodeid]))
+            for total, _, shard in sorted(shards, key=lambda shard: shard[1])]
+
+
+class SchedulingPlugin:
+    """
+    pytest plugin recording the test durations and applying --shard and --longest-first. With xdist, durations are
+    recorded by the controller, which receives the reports of every worker, and every worker computes the same
+    shard from the same stored durations.
+    """
+
+    def __init__(self, cache, shard=None, longest_first=False, record=True):
+        """
+        :param cache: pytest cache the durations are kept in
+        :param shard: (index, count) tuple of the shard to run, index starting at 1
+        :param longest_first: order the tests by decreasing duration
+        :param record: save the durations of this run, false on xdist workers
+        """
+        self.store = DurationStore(cache)
+        self.shard = shard
+        self.longest_first = longest_first
+        self.record = record
+        self.shard_totals = None
+        self.selected_total = 0.0
+
+    @pytest.hookimpl(trylast=True)
+    def pytest_collection_modifyitems(self, config, items):
+        if self.shard is not None:
+            index, count = self.shard
+            shards = balanced_shards(items, count, self.store.estimate)
+            self.selected_total, selected = shards[index - 1]
+            selected_ids = {item.nodeid for item in selected}
+            config.hook.pytest_deselected(items=[item for item in items if item.nodeid not in selected_ids])
+            items[:] = selected
+            self.shard_totals = [total for total, _ in shards]
+        if self.longest_first:
+            items[:] = longest_first(items, self.store.estimate)
+
+    def pytest_runtest_logreport(self, report):
+        if self.record:
+            self.store.add(report.nodeid, report.duration)
+
+    def pytest_sessionfinish(self, session):
+        if self.record:
+            self.store.save()
+
+    def pytest_terminal_summary(self, terminalreporter):
+        if self.shard_totals is not None:
+            index, count = self.shard
+            terminalreporter.write_sep("-", "shard")
+            terminalreporter.write_line(
+                f"shard {index}/{count}: estimated {self.selected_total:.1f}s, all shards "
+                f"{min(self.shard_totals):.1f}s to {max(self.shard_totals):.1f}s")
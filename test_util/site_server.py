@@ -0,0 +1,196 @@
+"""
+In-process HTTP server for the test site.
+
+Loading test_site/index.html through file:// leaves the network columns of print_timing (backend, latency, server
+response, transfer) at zero. SiteServer serves the same files from a ThreadingHTTPServer on a free local port, with
+an injected delay per request, a bandwidth cap, optional gzip and cache headers. Every response carries a
+Server-Timing header, which the browser exposes in the navigation entry, and is recorded in the request log with a
+wall clock timestamp so it can be matched with the print_timing records of the same interaction.
+"""
+import email.utils
+import gzip
+import http.server
+import json
+import os
+import threading
+import time
+from collections import defaultdict
+
+# Responses smaller than this are not worth compressing
+GZIP_MIN_SIZE = 256
+GZIP_TYPES = ('text/', 'application/javascript', 'application/json', 'image/svg+xml')
+# Number of writes per second of a bandwidth capped response
+THROTTLE_SLICES = 20
+
+
+class _Handler(http.server.SimpleHTTPRequestHandler):
+    server_version = 'TestSiteServer'
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        self._serve(send_body=True)
+
+    def do_HEAD(self):
+        self._serve(send_body=False)
+
+    def log_message(self, format, *args):
+        # Requests go to the request log, not to stderr
+        pass
+
+    def _serve(self, send_body):
+        site = self.server.site
+        start = time.perf_counter()
+        entry = {'timestamp': round(time.time() * 1000), 'method': self.command, 'path': self.path, 'status': 200,
+                 'bytes': 0, 'encoding': None, 'delay_ms': site.delay, 'read_ms': 0.0, 'send_ms': 0.0}
+        file_path = self.translate_path(self.path)
+        if os.path.isdir(file_path):
+            file_path = os.path.join(file_path, 'index.html')
+        try:
+            with open(file_path, 'rb') as file:
+                body = file.read()
+                modified = os.fstat(file.fileno()).st_mtime
+        except OSError:
+            entry['status'] = 404
+            self.send_error(404, 'File not found')
+            site.record(entry, start)
+            return
+        entry['read_ms'] = round((time.perf_counter() - start) * 1000, 2)
+
+        content_type = self.guess_type(file_path)
+        last_modified = email.utils.formatdate(modified, usegmt=True)
+        if site.cache_seconds is not None and self.headers.get('If-Modified-Since') == last_modified:
+            entry['status'] = 304
+            body = b''
+        elif (site.compress and len(body) >= GZIP_MIN_SIZE and content_type.startswith(GZIP_TYPES)
+              and 'gzip' in self.headers.get('Accept-Encoding', '')):
+            body = gzip.compress(body, compresslevel=6)
+            entry['encoding'] = 'gzip'
+
+        if site.delay:
+            time.sleep(site.delay / 1000)
+        self.send_response(entry['status'])
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('Last-Modified', last_modified)
+        self.send_header('Cache-Control', 'no-store' if site.cache_seconds is None
+                         else f'max-age={site.cache_seconds}')
+        if site.compress:
+            self.send_header('Vary', 'Accept-Encoding')
+        if entry['encoding']:
+            self.send_header('Content-Encoding', entry['encoding'])
+        self.send_header('Server-Timing', f"delay;dur={site.delay}, read;dur={entry['read_ms']}")
+        self.end_headers()
+
+        send_start = time.perf_counter()
+        if send_body and body:
+            site.write(self.wfile, body)
+            entry['bytes'] = len(body)
+        entry['send_ms'] = round((time.perf_counter() - send_start) * 1000, 2)
+        site.record(entry, start)
+
+
+class _Server(http.server.ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, handler, site, directory):
+        self.site = site
+        self.directory = directory
+        super().__init__(address, handler)
+
+    def finish_request(self, request, client_address):
+        self.RequestHandlerClass(request, client_address, self, directory=self.directory)
+
+
+class SiteServer:
+    """Serve a directory over HTTP from a background thread, one thread per connection"""
+
+    def __init__(self, root, delay=0, bandwidth=None, compress=False, cache_seconds=None, log_file=None):
+        """
+        :param root: directory served
+        :param delay: milliseconds slept before every response
+        :param bandwidth: maximum bytes per second of every response, None for no cap
+        :param compress: gzip text responses for clients accepting gzip
+        :param cache_seconds: Cache-Control max-age with Last-Modified revalidation, None sends no-store
+        :param log_file: JSON lines file of the requests of this server, rewritten when the server is created
+        """
+        self.root = os.path.abspath(root)
+        self.delay = delay
+        self.bandwidth = bandwidth
+        self.compress = compress
+        self.cache_seconds = cache_seconds
+        self.requests = []
+        self._lock = threading.Lock()
+        self._log = None
+        if log_file:
+            os.makedirs(os.path.dirname(os.path.abspath(log_file)), exist_ok=True)
+            self._log = open(log_file, 'w', encoding='utf-8')
+        self._server = None
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f'http://{host}:{port}/'
+
+    def start(self):
+        self._server = _Server(('127.0.0.1', 0), _Handler, self, self.root)
+        self._thread = threading.Thread(target=self._server.serve_forever, name='site-server', daemon=True)
+        self._thread.start()
+        return self
+
+    def close(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._thread.join()
+            self._server = None
+        if self._log is not None:
+            self._log.close()
+            self._log = None
+
+    def write(self, stream, body):
+        """Write a response body, in slices paced to the bandwidth cap if there is one"""
+        if not self.bandwidth:
+            stream.write(body)
+            return
+        size = max(1024, self.bandwidth // THROTTLE_SLICES)
+        start = time.perf_counter()
+        for offset in range(0, len(body), size):
+            chunk = body[offset:offset + size]
+            # A slice is written once the link would have delivered it
+            ahead = (offset + len(chunk)) / self.bandwidth - (time.perf_counter() - start)
+            if ahead > 0:
+                time.sleep(ahead)
+            stream.write(chunk)
+
+    def record(self, entry, start):
+        entry['total_ms'] = round((time.perf_counter() - start) * 1000, 2)
+        with self._lock:
+            self.requests.append(entry)
+            if self._log is not None:
+                self._log.write(json.dumps(entry) + '\n')
+                self._log.flush()
+
+    def stats(self):
+        """Request count, bytes and total milliseconds per path, query strings removed"""
+        paths = defaultdict(lambda: [0, 0, 0.0])
+        with self._lock:
+            for entry in self.requests:
+                totals = paths[entry['path'].split('?', 1)[0]]
+                totals[0] += 1
+                totals[1] += entry['bytes']
+                totals[2] += entry['total_ms']
+        return {path: tuple(totals) for path, totals in paths.items()}
+
+
+def format_stats(server_stats):
+    """Merge the stats of one or more servers, e.g. one per xdist worker, and format them as lines"""
+    stats = {}
+    for worker_stats in server_stats:
+        for path, (count, size, total_ms) in worker_stats.items():
+            total_count, total_size, total = stats.get(path, (0, 0, 0.0))
+            stats[path] = (total_count + count, total_size + size, total + total_ms)
+    lines = [f"{'path':<40}{'requests':>10}{'KiB':>10}{'mean ms':>10}"]
+    for path, (count, size, total_ms) in sorted(stats.items(), key=lambda item: item[1][2], reverse=True):
+        lines.append(f'{path[:39]:<40}{count:>10}{size / 1024:>10.1f}{total_ms / count:>10.1f}')
+    return lines
@@ -0,0 +1,75 @@
+"""
+Startup profile of a pytest run: time spent before the tests start and the heavy modules already imported by then.
+
+Phases are measured from the import of the conftest module: the conftest import itself, pytest_configure and the
+collection, with the collection time of every test module (which includes importing it). A run whose startup exceeds
+--startup-budget fails, so that a new eager import of pandas or of the selenium remote webdriver is noticed.
+"""
+import sys
+import time
+
+# Modules that should only be imported once a test needs them
+HEAVY_MODULES = (
+    'pandas',
+    'numpy',
+    'openpyxl',
+    'selenium.webdriver.remote.webdriver',
+    'selenium.webdriver.chrome.webdriver',
+    'selenium.webdriver.firefox.webdriver',
+)
+
+
+def imported_modules(names=HEAVY_MODULES):
+    """Return the modules of names that were executed, modules created by lazy_import but never used are skipped"""
+    return [name for name in names if name in sys.modules and type(sys.modules[name]).__name__ == 'module']
+
+
+class StartupProfile:
+    """Wall time of the startup phases of one pytest process"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        # CPU time of the interpreter and pytest before the conftest module was imported
+        self.before_conftest = time.process_time()
+        self.phases = {}
+        self.modules = {}
+        self.heavy_modules = []
+        self.finished = None
+        self._starts = {}
+        self._last = self.started
+
+    def phase(self, name):
+        """Close a phase started where the previous one ended"""
+        now = time.perf_counter()
+        self.phases[name] = now - self._last
+        self._last = now
+
+    def start(self, name):
+        """Start a phase, or the collection of a module, that is closed by stop"""
+        self._starts[name] = time.perf_counter()
+
+    def stop(self, name, module=False):
+        start = self._starts.pop(name, None)
+        if start is not None:
+            (self.modules if module else self.phases)[name] = time.perf_counter() - start
+
+    def finish(self):
+        """Mark the end of the startup, the tests are about to run"""
+        self.finished = time.perf_counter()
+        self.heavy_modules = imported_modules()
+
+    def total(self):
+        """Seconds from the conftest import to the end of the collection, or of the phases measured so far"""
+        if self.finished is None:
+            return sum(self.phases.values())
+        return self.finished - self.started
+
+    def format(self, slowest=5):
+        """Format the profile as the lines of a report"""
+        lines = [f"{'before conftest (cpu)':<30}{self.before_conftest:8.3f}s"]
+        lines += [f'{name:<30}{elapsed:8.3f}s' for name, elapsed in self.phases.items()]
+        lines.append(f"{'total':<30}{self.total():8.3f}s")
+        for name, elapsed in sorted(self.modules.items(), key=lambda item: item[1], reverse=True)[:slowest]:
+            lines.append(f'  {elapsed:8.3f}s  {name}')
+        lines.append(f"heavy modules imported: {', '.join(self.heavy_modules) or 'none'}")
+        return lines
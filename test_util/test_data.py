@@ -0,0 +1,216 @@
+"""
+Cached access to the Excel test data.
+
+Every sheet is converted once into pickled chunks of rows plus a manifest (columns, row count, workbook mtime, size
+and sha256). The cache is reused while the workbook keeps its mtime and size, or its hash when only the mtime
+changed. Conversion streams the workbook with openpyxl in read-only mode, so neither pandas nor the whole workbook
+is loaded in memory. Chunk files are named after the workbook hash and replaced atomically, so that xdist workers
+converting the same workbook at the same time write identical files.
+
+Rows are handed out as LazyRow mappings: parametrizing a test only needs the manifest, the chunk of a row is read
+when the test first accesses it.
+"""
+import hashlib
+import json
+import os
+import pickle
+import re
+import tempfile
+from collections.abc import Mapping, Sequence
+from functools import lru_cache
+from pathlib import Path
+
+CHUNK_SIZE = 1000
+MANIFEST = 'manifest.json'
+
+
+def file_sha256(file_name, block_size=1024 * 1024):
+    """Hash a file without reading it in memory at once"""
+    digest = hashlib.sha256()
+    with open(file_name, 'rb') as file:
+        for block in iter(lambda: file.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def parse_shard(value):
+    """Parse a 'index/count' shard option, index starting at 1, into a (index, count) tuple"""
+    match = re.fullmatch(r'(\d+)/(\d+)', value or '')
+    if not match or not 1 <= int(match.group(1)) <= int(match.group(2)):
+        raise ValueError(f'Invalid shard {value!r}, expected index/count such as 2/8')
+    return int(match.group(1)), int(match.group(2))
+
+
+def _write_atomic(path, write):
+    handle, temp_name = tempfile.mkstemp(dir=path.parent, prefix=f'.{path.name}.')
+    try:
+        with os.fdopen(handle, 'wb') as file:
+            write(file)
+        os.replace(temp_name, path)
+    except BaseException:
+        if os.path.exists(temp_name):
+            os.remove(temp_name)
+        raise
+
+
+class LazyRow(Mapping):
+    """One data row, read from the cache the first time one of its values is accessed"""
+
+    def __init__(self, sheet, index):
+        self._sheet = sheet
+        self.index = index
+        self._row = None
+
+    def _values(self):
+        if self._row is None:
+            self._row = self._sheet.row(self.index)
+        return self._row
+
+    def __getitem__(self, key):
+        return self._values()[key]
+
+    def __iter__(self):
+        return iter(self._sheet.columns)
+
+    def __len__(self):
+        return len(self._sheet.columns)
+
+    def __repr__(self):
+        return f'LazyRow({self._sheet.name!r}, {self.index})'
+
+
+class SheetData(Sequence):
+    """Rows of one cached sheet, as a lazy sequence of dicts"""
+
+    def __init__(self, directory, manifest):
+        self.directory = directory
+        self.name = manifest['sheet']
+        self.columns = manifest['columns']
+        self.chunk_size = manifest['chunk_size']
+        self.generation = manifest['sha256'][:16]
+        self._length = manifest['rows']
+        self._load_chunk = lru_cache(maxsize=4)(self._read_chunk)
+
+    def __len__(self):
+        return self._length
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self.row(i) for i in range(*index.indices(len(self)))]
+        return self.row(index)
+
+    def __iter__(self):
+        for chunk_index in range((len(self) + self.chunk_size - 1) // self.chunk_size):
+            for values in self._load_chunk(chunk_index):
+                yield dict(zip(self.columns, values))
+
+    def row(self, index):
+        """Return one row as a dict"""
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError(index)
+        values = self._load_chunk(index // self.chunk_size)[index % self.chunk_size]
+        return dict(zip(self.columns, values))
+
+    def lazy_rows(self, shard=None):
+        """
+        Return LazyRow references to the rows, optionally only those of one shard.
+
+        :param shard: (index, count) tuple, index starting at 1. Rows are dealt round robin so shards stay balanced.
+        """
+        indexes = range(len(self))
+        if shard is not None:
+            index, count = shard
+            indexes = indexes[index - 1::count]
+        return [LazyRow(self, i) for i in indexes]
+
+    def _read_chunk(self, chunk_index):
+        with open(self.directory / f'{self.generation}_{chunk_index:05d}.pickle', 'rb') as file:
+            return pickle.load(file)
+
+
+class ExcelDataStore:
+    """Excel workbook with a binary cache of its sheets"""
+
+    def __init__(self, workbook, cache_dir, chunk_size=CHUNK_SIZE):
+        """
+        :param workbook: path of the .xlsx file
+        :param cache_dir: directory the converted sheets are stored in
+        :param chunk_size: number of rows per cache file
+        """
+        self.workbook = Path(workbook)
+        self.cache_dir = Path(cache_dir) / self.workbook.stem
+        self.chunk_size = chunk_size
+        self._sheets = {}
+
+    def sheet(self, name):
+        """Return the rows of a sheet, converting the workbook first when the cache is missing or outdated"""
+        if name not in self._sheets:
+            directory = self.cache_dir / name
+            manifest = self._valid_manifest(directory)
+            if manifest is None:
+                manifest = self._convert(name, directory)
+            self._sheets[name] = SheetData(directory, manifest)
+        return self._sheets[name]
+
+    def _valid_manifest(self, directory):
+        try:
+            manifest = json.loads((directory / MANIFEST).read_text())
+        except (OSError, ValueError):
+            return None
+        stat = self.workbook.stat()
+        if manifest['mtime_ns'] == stat.st_mtime_ns and manifest['size'] == stat.st_size:
+            return manifest
+        # Touched but maybe not modified, e.g. after a checkout
+        if manifest['size'] == stat.st_size and manifest['sha256'] == file_sha256(self.workbook):
+            manifest['mtime_ns'] = stat.st_mtime_ns
+            _write_atomic(directory / MANIFEST, lambda file: file.write(json.dumps(manifest).encode()))
+            return manifest
+        return None
+
+    def _convert(self, name, directory):
+        import openpyxl
+
+        directory.mkdir(parents=True, exist_ok=True)
+        stat = self.workbook.stat()
+        sha256 = file_sha256(self.workbook)
+        generation = sha256[:16]
+
+        workbook = openpyxl.load_workbook(self.workbook, read_only=True, data_only=True)
+        try:
+            rows = workbook[name].iter_rows(values_only=True)
+            columns = [str(column) for column in next(rows, ())]
+            count = 0
+            chunk = []
+            for values in rows:
+                if all(value is None for value in values):
+                    continue
+                chunk.append(tuple(values[:len(columns)]))
+                if len(chunk) == self.chunk_size:
+                    self._write_chunk(directory, generation, count // self.chunk_size, chunk)
+                    count += len(chunk)
+                    chunk = []
+            if chunk:
+                self._write_chunk(directory, generation, count // self.chunk_size, chunk)
+                count += len(chunk)
+        finally:
+            workbook.close()
+
+        manifest = {'sheet': name, 'columns': columns, 'rows': count, 'chunk_size': self.chunk_size,
+                    'mtime_ns': stat.st_mtime_ns, 'size': stat.st_size, 'sha256': sha256}
+        _write_atomic(directory / MANIFEST, lambda file: file.write(json.dumps(manifest).encode()))
+
+        # Remove the chunks of previous versions of the workbook
+        for stale in directory.glob('*.pickle'):
+            if not stale.name.startswith(generation):
+                try:
+                    stale.unlink()
+                except OSError:
+                    pass
+        return manifest
+
+    @staticmethod
+    def _write_chunk(directory, generation, chunk_index, chunk):
+        _write_atomic(directory / f'{generation}_{chunk_index:05d}.pickle',
+                      lambda file: pickle.dump(chunk, file, protocol=pickle.HIGHEST_PROTOCOL))
@@ -0,0 +1,443 @@
+"""
+Visual regression checks of screenshots against stored baselines.
+
+Baselines are PNG files in a directory with an index.json holding, per baseline, the check name, the SHA-256 of the
+PNG bytes, the size and a 64-bit perceptual hash (dHash of an 8x9 grayscale thumbnail). A check costs:
+
+- nothing beyond hashing the bytes when the screenshot is byte-identical to a baseline of the same name, the usual
+  case for a step whose page did not change;
+- otherwise one decode with Pillow and a vectorized pixel diff against the baseline of that name nearest in
+  perceptual hash, found with one XOR and popcount over the hashes of the index instead of opening every baseline.
+  Decoded baselines are kept in a small cache.
+
+Without Pillow a NumPy and zlib decoder takes over with a warning. It is a last resort: rows filtered with Average or
+Paeth are undone byte by byte in Python, more than a second per 1080p screenshot, too slow for --visual-steps.
+
+A name can have several baselines, one per page state: a step such as open_item_list looks different on the stress
+profiles of the test site, and the perceptual hash picks the state a screenshot belongs to.
+
+A pixel differs when one of its channels moves by more than the tolerance; masked regions (a clock, an animation)
+are ignored. Only a screenshot whose share of differing pixels exceeds the threshold writes files: the screenshot
+and a diff image with the changed pixels in red over a dimmed baseline.
+"""
+import hashlib
+import io
+import json
+import math
+import os
+import struct
+import tempfile
+import threading
+import time
+import warnings
+import zlib
+from collections import Counter, OrderedDict
+from pathlib import Path
+
+from test_util.artifacts import safe_name
+
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+# Channels of the 8-bit PNG color types: grayscale, RGB, grayscale + alpha, RGBA
+PNG_CHANNELS = {0: 1, 2: 3, 4: 2, 6: 4}
+INDEX_FILE = 'index.json'
+# Decoded baselines kept in memory, about 8 MB each for a 1920x1080 screenshot
+CACHE_SIZE = 16
+
+_CHECKER = None
+_FALLBACK_WARNED = False
+
+
+def set_step_checker(checker):
+    """Install the VisualBaselines checked after every print_timing interaction, None to stop"""
+    global _CHECKER
+    _CHECKER = checker
+
+
+def step_checker():
+    return _CHECKER
+
+
+def decode_png(data):
+    """Decode a PNG into an RGB uint8 array of shape (height, width, 3)"""
+    import numpy as np
+
+    try:
+        from PIL import Image
+    except ImportError:
+        global _FALLBACK_WARNED
+        if not _FALLBACK_WARNED:
+            _FALLBACK_WARNED = True
+            warnings.warn('Pillow is not installed, screenshots are decoded by the slow NumPy fallback '
+                          '(pip install -r requirements.txt)', RuntimeWarning, stacklevel=2)
+        return _decode_png(data)
+    with Image.open(io.BytesIO(data)) as image:
+        return np.asarray(image.convert('RGB'))
+
+
+def _decode_png(data):
+    """Last-resort NumPy PNG decoder for 8-bit non-interlaced images, Average and Paeth rows are slow"""
+    import numpy as np
+
+    if data[:8] != PNG_SIGNATURE:
+        raise ValueError('Not a PNG image')
+    offset, idat, header = 8, [], None
+    while offset < len(data):
+        length, kind = struct.unpack('>I4s', data[offset:offset + 8])
+        chunk = data[offset + 8:offset + 8 + length]
+        offset += length + 12
+        if kind == b'IHDR':
+            header = struct.unpack('>IIBBBBB', chunk)
+        elif kind == b'IDAT':
+            idat.append(chunk)
+        elif kind == b'IEND':
+            break
+    width, height, depth, color, _, _, interlace = header
+    if depth != 8 or interlace or color not in PNG_CHANNELS:
+        raise ValueError(f'Unsupported PNG (depth {depth}, color type {color}, interlace {interlace}), '
+                         f'install Pillow to decode it')
+    channels = PNG_CHANNELS[color]
+    stride = width * channels
+    raw = np.frombuffer(zlib.decompress(b''.join(idat)), np.uint8).reshape(height, stride + 1)
+    pixels = np.empty((height, stride), np.uint8)
+    prior = np.zeros(stride, np.uint8)
+    for y in range(height):
+        kind, line = raw[y, 0], raw[y, 1:]
+        if kind == 0:
+            row = line
+        elif kind == 1:
+            # Sub: a running sum along each channel, uint8 wraps modulo 256 like the filter
+            row = np.cumsum(line.reshape(width, channels), axis=0, dtype=np.uint8).reshape(stride)
+        elif kind == 2:
+            row = line + prior
+        else:
+            row = np.frombuffer(_unfilter_sequential(kind, line.tobytes(), prior.tobytes(), channels), np.uint8)
+        pixels[y] = prior = row
+    pixels = pixels.reshape(height, width, channels)
+    if channels < 3:
+        return np.repeat(pixels[..., :1], 3, axis=2)
+    return np.ascontiguousarray(pixels[..., :3])
+
+
+def _unfilter_sequential(kind, line, prior, bpp):
+    """Undo the Average (3) or Paeth (4) filter of a row, every byte depends on the one before it"""
+    row = bytearray(line)
+    for i in range(len(row)):
+        left = row[i - bpp] if i >= bpp else 0
+        up = prior[i]
+        if kind == 3:
+            row[i] = (row[i] + ((left + up) >> 1)) & 0xFF
+            continue
+        up_left = prior[i - bpp] if i >= bpp else 0
+        estimate = left + up - up_left
+        distance_left = abs(estimate - left)
+        distance_up = abs(estimate - up)
+        distance_up_left = abs(estimate - up_left)
+        if distance_left <= distance_up and distance_left <= distance_up_left:
+            predictor = left
+        elif distance_up <= distance_up_left:
+            predictor = up
+        else:
+            predictor = up_left
+        row[i] = (row[i] + predictor) & 0xFF
+    return bytes(row)
+
+
+def encode_png(pixels, level=6):
+    """Encode an RGB uint8 array as PNG without Pillow"""
+    import numpy as np
+
+    height, width, _ = pixels.shape
+    rows = np.concatenate([np.zeros((height, 1), np.uint8), pixels.reshape(height, width * 3)], axis=1)
+
+    def chunk(kind, payload):
+        return struct.pack('>I', len(payload)) + kind + payload + struct.pack('>I', zlib.crc32(kind + payload))
+
+    return (PNG_SIGNATURE + chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0))
+            + chunk(b'IDAT', zlib.compress(rows.tobytes(), level)) + chunk(b'IEND', b''))
+
+
+def perceptual_hash(pixels):
+    """64-bit dHash: brightness gradients between the cells of a 9x8 grid over the image"""
+    import numpy as np
+
+    # Every other pixel is enough for 72 cell averages
+    gray = pixels[::2, ::2].astype(np.float32) @ np.array([0.299, 0.587, 0.114], np.float32)
+    height, width = gray.shape
+    rows = np.linspace(0, height, 9).astype(int)[:-1]
+    columns = np.linspace(0, width, 10).astype(int)[:-1]
+    sums = np.add.reduceat(np.add.reduceat(gray, rows, axis=0), columns, axis=1)
+    areas = np.outer(np.diff(np.append(rows, height)), np.diff(np.append(columns, width)))
+    cells = sums / areas
+    bits = np.packbits(cells[:, 1:] > cells[:, :-1])
+    return int.from_bytes(bits.tobytes(), 'big')
+
+
+def hamming_distances(hashes, value):
+    """Bits differing between value and every hash of a uint64 array"""
+    import numpy as np
+
+    return np.bitwise_count(hashes ^ np.uint64(value))
+
+
+def region_mask(shape, regions):
+    """Boolean array of the pixels compared, False inside the (x, y, width, height) regions"""
+    import numpy as np
+
+    mask = np.ones(shape[:2], bool)
+    for x, y, width, height in regions:
+        # Partly covered pixels are masked too
+        left, top = max(math.floor(x), 0), max(math.floor(y), 0)
+        mask[top:math.ceil(y + height), left:math.ceil(x + width)] = False
+    return mask
+
+
+def pixel_diff(actual, baseline, tolerance=16, regions=()):
+    """
+    Compare two RGB arrays of the same shape.
+
+    :param tolerance: largest channel difference that is not a change, absorbs anti-aliasing and color rounding
+    :param regions: (x, y, width, height) regions in pixels that are not compared
+    :return: (boolean array of the changed pixels, share of the compared pixels that changed)
+    """
+    import numpy as np
+
+    # |a - b| in uint8 without widening the arrays, the channels are combined with | which is much faster than
+    # any(axis=2) on the last, 3 items long axis
+    difference = np.maximum(actual, baseline) - np.minimum(actual, baseline)
+    changed = (difference[..., 0] > tolerance) | (difference[..., 1] > tolerance) | (difference[..., 2] > tolerance)
+    if regions:
+        mask = region_mask(actual.shape, regions)
+        changed &= mask
+        compared = int(mask.sum())
+    else:
+        compared = changed.size
+    return changed, float(changed.sum()) / compared if compared else 0.0
+
+
+def diff_image(baseline, changed, regions=()):
+    """Dimmed grayscale baseline with the changed pixels in red and the masked regions in blue"""
+    import numpy as np
+
+    gray = (baseline.astype(np.float32) @ np.array([0.299, 0.587, 0.114], np.float32)) * 0.4 + 140
+    image = np.repeat(gray.astype(np.uint8)[..., None], 3, axis=2)
+    if regions:
+        image[~region_mask(baseline.shape, regions)] = (150, 170, 230)
+    image[changed] = (255, 0, 0)
+    return image
+
+
+class VisualBaselines:
+    """Baseline directory with its perceptual-hash index, shared by the checks of one process"""
+
+    def __init__(self, directory, diff_dir, tolerance=16, max_diff=0.001, update=False, max_distance=12):
+        """
+        :param directory: directory of the baselines and their index.json, created when missing
+        :param diff_dir: directory the screenshot and diff image of a mismatch are written to
+        :param tolerance: largest channel difference of a pixel that is not a change
+        :param max_diff: share of changed pixels above which a screenshot does not match, 0.001 is 0.1%
+        :param update: store mismatching screenshots as the new baselines instead of failing
+        :param max_distance: with update, a screenshot farther than this in perceptual hash from every baseline of its
+            name is stored as another state of the name instead of replacing the nearest baseline
+        """
+        self.directory = Path(directory)
+        self.diff_dir = Path(diff_dir)
+        self.tolerance = tolerance
+        self.max_diff = max_diff
+        self.update = update
+        self.max_distance = max_distance
+        self.entries = self._read_index()
+        self.statuses = Counter()
+        self.seconds = 0.0
+        self.mismatches = []
+        self._hashes = None
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _read_index(self):
+        index = self.directory / INDEX_FILE
+        if not index.exists():
+            return []
+        return json.loads(index.read_text())['baselines']
+
+    def save(self):
+        """Merge the baselines recorded by this process into index.json, other xdist workers may have added theirs"""
+        if not any(self.statuses[status] for status in ('new', 'updated')):
+            return
+        self.directory.mkdir(parents=True, exist_ok=True)
+        with self._lock:
+            replaced = {entry['replaces'] for entry in self.entries if entry.get('replaces')}
+            merged = {entry['file']: entry for entry in self._read_index() if entry['file'] not in replaced}
+            merged.update({entry['file']: {key: value for key, value in entry.items() if key != 'replaces'}
+                           for entry in self.entries})
+            handle, temporary = tempfile.mkstemp(prefix='.index.', dir=self.directory)
+            with os.fdopen(handle, 'w') as file:
+                json.dump({'baselines': sorted(merged.values(), key=lambda entry: entry['file'])}, file, indent=1)
+            os.replace(temporary, self.directory / INDEX_FILE)
+
+    def _hash_array(self):
+        import numpy as np
+
+        if self._hashes is None:
+            self._hashes = np.array([int(entry['phash'], 16) for entry in self.entries], np.uint64)
+        return self._hashes
+
+    def _baseline_pixels(self, entry):
+        pixels = self._cache.get(entry['file'])
+        if pixels is None:
+            pixels = self._cache[entry['file']] = decode_png((self.directory / entry['file']).read_bytes())
+            if len(self._cache) > CACHE_SIZE:
+                self._cache.popitem(last=False)
+        else:
+            self._cache.move_to_end(entry['file'])
+        return pixels
+
+    def find(self, name, phash):
+        """Return (entry, distance) of the baseline of a name nearest to a perceptual hash, (None, None) if none"""
+        import numpy as np
+
+        candidates = [index for index, entry in enumerate(self.entries) if entry['name'] == name]
+        if not candidates:
+            return None, None
+        distances = hamming_distances(self._hash_array()[candidates], phash)
+        nearest = int(np.argmin(distances))
+        return self.entries[candidates[nearest]], int(distances[nearest])
+
+    def _record(self, name, png, pixels, phash, sha256, replaces=None):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        file_name = f'{safe_name(name)}_{sha256[:12]}.png'
+        (self.directory / file_name).write_bytes(png)
+        entry = {'name': name, 'file': file_name, 'sha256': sha256, 'phash': f'{phash:016x}',
+                 'width': int(pixels.shape[1]), 'height': int(pixels.shape[0])}
+        if replaces is not None:
+            self.entries = [existing for existing in self.entries if existing['file'] != replaces]
+            self._cache.pop(replaces, None)
+            (self.directory / replaces).unlink(missing_ok=True)
+            entry['replaces'] = replaces
+        self.entries.append(entry)
+        self._hashes = None
+        self._cache[file_name] = pixels
+        return entry
+
+    def compare(self, name, png, regions=()):
+        """
+        Check a screenshot against the baselines of a name.
+
+        :param name: name of the page state, e.g. test_name/step
+        :param png: screenshot as returned by get_screenshot_as_png
+        :param regions: (x, y, width, height) regions in screenshot pixels that are not compared
+        :return: dict with the status (identical, match, new, updated or mismatch), the share of changed pixels,
+            the baseline file and the files written for a mismatch
+        """
+        start = time.perf_counter()
+        result = {'name': name, 'status': None, 'diff': 0.0, 'distance': None, 'baseline': None, 'files': []}
+        sha256 = hashlib.sha256(png).hexdigest()
+        with self._lock:
+            try:
+                identical = next((entry for entry in self.entries
+                                  if entry['name'] == name and entry['sha256'] == sha256), None)
+                if identical is not None:
+                    result.update(status='identical', baseline=identical['file'], distance=0)
+                    return result
+                pixels = decode_png(png)
+                phash = perceptual_hash(pixels)
+                entry, distance = self.find(name, phash)
+                result['distance'] = distance
+                if entry is None:
+                    result.update(status='new', baseline=self._record(name, png, pixels, phash, sha256)['file'])
+                    return result
+                baseline = self._baseline_pixels(entry)
+                if baseline.shape != pixels.shape:
+                    changed, result['diff'] = None, 1.0
+                else:
+                    changed, result['diff'] = pixel_diff(pixels, baseline, self.tolerance, regions)
+                result['baseline'] = entry['file']
+                if result['diff'] <= self.max_diff:
+                    result['status'] = 'match'
+                elif self.update and distance > self.max_distance:
+                    result.update(status='new', baseline=self._record(name, png, pixels, phash, sha256)['file'])
+                elif self.update:
+                    result.update(status='updated',
+                                  baseline=self._record(name, png, pixels, phash, sha256, entry['file'])['file'])
+                else:
+                    result.update(status='mismatch', files=self._write_mismatch(name, png, baseline, changed,
+                                                                                regions))
+                    self.mismatches.append(result)
+                return result
+            finally:
+                self.statuses[result['status'] or 'error'] += 1
+                self.seconds += time.perf_counter() - start
+
+    def _write_mismatch(self, name, png, baseline, changed, regions):
+        self.diff_dir.mkdir(parents=True, exist_ok=True)
+        base_name = safe_name(name)
+        actual_file = self.diff_dir / f'{base_name}_actual.png'
+        actual_file.write_bytes(png)
+        if changed is None:
+            # Another size, there is no pixel to pixel diff
+            return [str(actual_file)]
+        diff_file = self.diff_dir / f'{base_name}_diff.png'
+        diff_file.write_bytes(encode_png(diff_image(baseline, changed, regions)))
+        return [str(actual_file), str(diff_file)]
+
+    def check(self, driver, name, masks=()):
+        """
+        Take a screenshot and compare it, raise AssertionError when it does not match its baseline.
+
+        :param masks: locators (by, value) of the elements not compared and (x, y, width, height) regions in CSS
+            pixels
+        """
+        from pages.scripts import MASK_RECTS_JS
+
+        locators = [list(mask) for mask in masks if len(mask) == 2]
+        regions = [mask for mask in masks if len(mask) == 4]
+        if locators or regions:
+            # The rectangles are read in the same script call, scaled to screenshot pixels
+            ratio, rects = driver.execute_script(MASK_RECTS_JS, locators)
+            regions = [[value * ratio for value in region] for region in regions + rects]
+        result = self.compare(name, driver.get_screenshot_as_png(), regions)
+        if result['status'] == 'mismatch':
+            raise AssertionError(f"Screenshot {name!r} differs from {result['baseline']}: {result['diff']:.3%} of "
+                                 f"the pixels changed > {self.max_diff:.3%}, see {', '.join(result['files'])}")
+        return result
+
+    def stats(self):
+        """Plain data sent from the xdist workers to the controller"""
+        return {'statuses': dict(self.statuses), 'seconds': round(self.seconds, 4),
+                'mismatches': [{key: result[key] for key in ('name', 'diff', 'baseline', 'files')}
+                               for result in self.mismatches]}
+
+
+class VisualCheck:
+    """Screenshot checks of one test, named test_name/name"""
+
+    def __init__(self, baselines, driver, test_name):
+        """
+        :param baselines: VisualBaselines, None when the checks are disabled
+        """
+        self.baselines = baselines
+        self.driver = driver
+        self.test_name = test_name
+
+    def check(self, name, masks=()):
+        """See VisualBaselines.check, returns None when the checks are disabled"""
+        if self.baselines is None:
+            return None
+        return self.baselines.check(self.driver, f'{self.test_name}/{name}', masks)
+
+
+def format_stats(stats):
+    """Format the VisualBaselines.stats of several processes as report lines"""
+    statuses = Counter()
+    for worker_stats in stats:
+        statuses.update(worker_stats['statuses'])
+    checks = sum(statuses.values())
+    if not checks:
+        return ['no screenshot checks']
+    seconds = sum(worker_stats['seconds'] for worker_stats in stats)
+    lines = [f"{checks} checks, {seconds / checks * 1000:.1f}ms mean: "
+             + ', '.join(f'{status} {count}' for status, count in sorted(statuses.items()))]
+    for worker_stats in stats:
+        for mismatch in worker_stats['mismatches']:
+            lines.append(f"mismatch {mismatch['name']}: {mismatch['diff']:.3%} vs {mismatch['baseline']}, "
+                         f"{' '.join(mismatch['files'])}")
+    return lines